@@ -0,0 +1,167 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import json
+import sqlite3
+import numpy as np
+
+# SQLite limits the number of host parameters in a single statement.
+MAX_SQL_PARAMS = 500
+
+
+def _to_sql(value):
+    """Convert numpy scalars (e.g. ids from a pandas index) to python
+    types that sqlite3 can bind."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _to_json(value):
+    """json.dumps default for the numpy values json cannot encode, e.g. a
+    tolerance computed with numpy."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+class QueryResultStore(object):
+    """
+    SQLite backed store for the results of RasterDataset.query. Results are
+    written in batches, each in its own transaction, so a store always
+    contains whole batches even if the writing process is killed.  The
+    method of each result is stored with it, and the query settings that
+    choose the methods are recorded so that a run is not resumed with
+    different ones (see check_settings).
+
+    Parameters
+    ----------
+    path: str
+        Path to the SQLite database. Created if it does not exist.
+
+    See Also
+    --------
+    RasterDataset.query_checkpointed
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results "
+                          "(id PRIMARY KEY, dtype TEXT, vals BLOB, "
+                          "weights BLOB, method TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS metadata "
+                          "(key TEXT PRIMARY KEY, value TEXT)")
+        # Stores written before the method was recorded
+        columns = [r[1] for r in
+                   self.conn.execute("PRAGMA table_info(results)")]
+        if "method" not in columns:
+            self.conn.execute("ALTER TABLE results ADD COLUMN method TEXT")
+        self.conn.commit()
+
+    def check_settings(self, settings):
+        """Record the settings of the query writing to the store, or, if
+        settings were already recorded, check that they are the same, so
+        that results computed with different methods (see
+        choose_query_method) are not mixed in one store.
+
+        Parameters
+        ----------
+        settings: dict
+            JSON serializable settings, e.g. the tolerance and scale
+            factor of RasterDataset.query.  Numpy scalars and arrays are
+            converted to python values.
+
+        Raises
+        ------
+        ValueError if the store has results of a query with different
+        settings."""
+        value = json.dumps(settings, sort_keys=True, default=_to_json)
+        row = self.conn.execute("SELECT value FROM metadata "
+                                "WHERE key = 'settings'").fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO metadata VALUES "
+                                  "('settings', ?)", (value,))
+        elif json.loads(row[0]) != json.loads(value):
+            raise ValueError("%s has results of a query with settings %s, "
+                             "not %s" % (self.path, row[0], value))
+
+    def completed_ids(self, ids=None):
+        """Return the set of ids that have results in the store.  If ids
+        is given, only those ids are checked."""
+        if ids is None:
+            return set(r[0] for r in self.conn.execute("SELECT id FROM results"))
+
+        ids = [_to_sql(i) for i in ids]
+        done = set()
+        for start in xrange(0, len(ids), MAX_SQL_PARAMS):
+            chunk = ids[start:start + MAX_SQL_PARAMS]
+            sql = "SELECT id FROM results WHERE id IN (%s)"
+            sql = sql % ",".join("?" * len(chunk))
+            done.update(r[0] for r in self.conn.execute(sql, chunk))
+        return done
+
+    def write(self, results):
+        """Write an iterable of RasterQueryResult in a single transaction.
+
+        Returns
+        -------
+        int: The number of results written."""
+        rows = []
+        for r in results:
+            values = np.asarray(r.values)
+            weights = np.asarray(r.weights, dtype=np.float64)
+            rows.append((_to_sql(r.id), values.dtype.str,
+                         sqlite3.Binary(values.tobytes()),
+                         sqlite3.Binary(weights.tobytes()),
+                         getattr(r, "method", None)))
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results "
+                                  "(id, dtype, vals, weights, method) "
+                                  "VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def __iter__(self):
+        """Yields (id, values, weights, method) for every stored result."""
+        cursor = self.conn.execute("SELECT id, dtype, vals, weights, method "
+                                   "FROM results")
+        for id, dtype, values, weights, method in cursor:
+            yield (id, np.frombuffer(bytes(values), dtype=np.dtype(dtype)),
+                   np.frombuffer(bytes(weights), dtype=np.float64), method)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
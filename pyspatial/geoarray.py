@@ -0,0 +1,560 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import struct
+import numpy as np
+from osgeo import ogr
+from shapely import wkb
+from shapely.geometry.base import BaseGeometry
+
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+MULTIPOINT = 4
+MULTILINESTRING = 5
+MULTIPOLYGON = 6
+
+SINGLE_TYPES = {MULTIPOINT: POINT, MULTILINESTRING: LINESTRING,
+                MULTIPOLYGON: POLYGON}
+WKB_25D = 0x80000000
+
+GEOJSON_TYPES = {POINT: "Point", LINESTRING: "LineString",
+                 POLYGON: "Polygon", MULTIPOINT: "MultiPoint",
+                 MULTILINESTRING: "MultiLineString",
+                 MULTIPOLYGON: "MultiPolygon"}
+
+
+def is_supported(geom):
+    """Whether a GeometryArray can store the ogr.Geometry geom, i.e. it is
+    a (Multi)Point, (Multi)LineString or (Multi)Polygon"""
+    return (geom.GetGeometryType() & ~WKB_25D) % 1000 in GEOJSON_TYPES
+
+
+def offsets_from_counts(counts):
+    """Offsets array (length n+1) from an array of n counts"""
+    res = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=res[1:])
+    return res
+
+
+def concat_ranges(starts, ends):
+    """Concatenation of np.arange(s, e) for all (s, e) in zip(starts, ends),
+    computed without a python loop."""
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(ends, dtype=np.int64) - starts
+    nonempty = counts > 0
+    starts, counts = starts[nonempty], counts[nonempty]
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    incr = np.ones(total, dtype=np.int64)
+    incr[0] = starts[0]
+    ends_cum = np.cumsum(counts)[:-1]
+    incr[ends_cum] = starts[1:] - (starts[:-1] + counts[:-1]) + 1
+    return np.cumsum(incr)
+
+
+class _WkbReader(object):
+    """Accumulates the parts, rings and coordinates of WKB geometries."""
+    def __init__(self):
+        self.types = []
+        self.has_z = []
+        self.parts_per_geom = []
+        self.rings_per_part = []
+        self.coords_per_ring = []
+        self.xy = []
+        self.z = []
+
+    def header(self, buf, offset):
+        endian = "<" if struct.unpack_from("B", buf, offset)[0] == 1 else ">"
+        gtype = struct.unpack_from(endian + "I", buf, offset + 1)[0]
+        has_z = bool(gtype & WKB_25D)
+        gtype &= 0x0fffffff
+        # ISO WKB: 1000 = Z, 2000 = M, 3000 = ZM.  M values are dropped.
+        iso = gtype // 1000
+        has_z = has_z or iso in (1, 3)
+        dims = 2 + int(has_z) + int(iso in (2, 3))
+        return endian, gtype % 1000, has_z, dims, offset + 5
+
+    def count(self, buf, offset, endian):
+        return struct.unpack_from(endian + "I", buf, offset)[0], offset + 4
+
+    def ring(self, buf, offset, endian, dims, n):
+        arr = np.frombuffer(buf, dtype=endian + "f8", count=n * dims,
+                            offset=offset).reshape(n, dims)
+        self.xy.append(arr[:, :2])
+        self.z.append(arr[:, 2] if dims > 2 else np.zeros(n))
+        self.coords_per_ring.append(n)
+        return offset + 8 * n * dims
+
+    def part(self, buf, offset):
+        endian, gtype, has_z, dims, offset = self.header(buf, offset)
+        if gtype == POINT:
+            offset = self.ring(buf, offset, endian, dims, 1)
+            self.rings_per_part.append(1)
+        elif gtype == LINESTRING:
+            n, offset = self.count(buf, offset, endian)
+            offset = self.ring(buf, offset, endian, dims, n)
+            self.rings_per_part.append(1)
+        elif gtype == POLYGON:
+            n_rings, offset = self.count(buf, offset, endian)
+            for _ in xrange(n_rings):
+                n, offset = self.count(buf, offset, endian)
+                offset = self.ring(buf, offset, endian, dims, n)
+            self.rings_per_part.append(n_rings)
+        else:
+            raise ValueError("Unsupported geometry type: %d" % gtype)
+        return offset
+
+    def geometry(self, buf):
+        endian, gtype, has_z, dims, offset = self.header(buf, 0)
+        if gtype in (POINT, LINESTRING, POLYGON):
+            self.part(buf, 0)
+            n_parts = 1
+        elif gtype in SINGLE_TYPES:
+            n_parts, offset = self.count(buf, offset, endian)
+            for _ in xrange(n_parts):
+                offset = self.part(buf, offset)
+        else:
+            raise ValueError("Unsupported geometry type: %d" % gtype)
+
+        self.types.append(gtype)
+        self.has_z.append(has_z)
+        self.parts_per_geom.append(n_parts)
+
+    def to_array(self):
+        if len(self.xy) > 0:
+            coords = np.concatenate(self.xy).astype(np.float64)
+            z = np.concatenate(self.z).astype(np.float64)
+        else:
+            coords = np.zeros((0, 2))
+            z = np.zeros(0)
+
+        has_z = np.array(self.has_z, dtype=bool)
+        return GeometryArray(np.array(self.types, dtype=np.uint8),
+                             offsets_from_counts(self.parts_per_geom),
+                             offsets_from_counts(self.rings_per_part),
+                             offsets_from_counts(self.coords_per_ring),
+                             coords, z=z if has_z.any() else None,
+                             has_z=has_z)
+
+
+class GeometryArray(object):
+    """
+    Columnar storage for a collection of (Multi)Point, (Multi)LineString
+    and (Multi)Polygon geometries.  All coordinates are kept in a single
+    contiguous float64 array and the structure of each geometry is described
+    by offset arrays, so bulk operations can be computed with numpy instead
+    of looping over ogr.Geometry objects.  ogr and shapely objects are only
+    created on demand.
+
+    Every geometry is stored as a list of parts, every part as a list of
+    rings and every ring as a list of coordinates.  A Point is one part with
+    one ring of one coordinate, a LineString one part with one ring, and a
+    Polygon one part with its exterior ring followed by its interior rings.
+
+    Parameters
+    ----------
+    types: np.ndarray of uint8
+        The WKB geometry type of each geometry (1 to 6, see POINT, etc.)
+
+    geom_offsets: np.ndarray of int64
+        Geometry i is made of parts geom_offsets[i]:geom_offsets[i+1]
+
+    part_offsets: np.ndarray of int64
+        Part j is made of rings part_offsets[j]:part_offsets[j+1]
+
+    ring_offsets: np.ndarray of int64
+        Ring k is made of coordinates ring_offsets[k]:ring_offsets[k+1]
+
+    coords: np.ndarray of float64, shape (n, 2)
+        x, y of all coordinates
+
+    z: np.ndarray of float64 (default None)
+        z of all coordinates, None if no geometry has a z dimension.
+
+    has_z: np.ndarray of bool (default None)
+        Whether each geometry has a z dimension.
+    """
+    def __init__(self, types, geom_offsets, part_offsets, ring_offsets,
+                 coords, z=None, has_z=None):
+        self.types = types
+        self.geom_offsets = geom_offsets
+        self.part_offsets = part_offsets
+        self.ring_offsets = ring_offsets
+        self.coords = coords
+        self.z = z
+        if has_z is None:
+            has_z = np.zeros(len(types), dtype=bool)
+        self.has_z = has_z
+
+    @classmethod
+    def from_wkb(cls, wkbs):
+        """Create a GeometryArray from an iterable of WKB strings."""
+        reader = _WkbReader()
+        for buf in wkbs:
+            reader.geometry(buf)
+        return reader.to_array()
+
+    @classmethod
+    def from_geometries(cls, geoms):
+        """Create a GeometryArray from an iterable of ogr.Geometry or
+        shapely geometries."""
+        def to_wkb(g):
+            if isinstance(g, ogr.Geometry):
+                return g.ExportToWkb(ogr.wkbNDR)
+            elif isinstance(g, BaseGeometry):
+                return g.wkb
+            raise ValueError("Unable to convert %r to WKB" % (g,))
+
+        return cls.from_wkb(to_wkb(g) for g in geoms)
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def nbytes(self):
+        arrays = [self.types, self.geom_offsets, self.part_offsets,
+                  self.ring_offsets, self.coords, self.has_z]
+        if self.z is not None:
+            arrays.append(self.z)
+        return sum(a.nbytes for a in arrays)
+
+    def ring_bounds(self):
+        """Coordinate offsets (start, end) of the rings of each geometry."""
+        first = self.part_offsets[self.geom_offsets]
+        return self.ring_offsets[first[:-1]], self.ring_offsets[first[1:]]
+
+    def vertex_counts(self):
+        """Number of coordinates in each geometry"""
+        start, end = self.ring_bounds()
+        return end - start
+
+    def coord_geometry_ids(self):
+        """Position of the geometry each coordinate belongs to"""
+        return np.repeat(np.arange(len(self)), self.vertex_counts())
+
+    def ring_geometry_ids(self):
+        """Position of the geometry each ring belongs to"""
+        first = self.part_offsets[self.geom_offsets]
+        return np.repeat(np.arange(len(self)), np.diff(first))
+
+    def exterior_rings(self):
+        """Boolean array marking the rings that are the first ring of their
+        part (i.e. the exterior ring of polygons)"""
+        n_rings = len(self.ring_offsets) - 1
+        first = self.part_offsets[:-1][np.diff(self.part_offsets) > 0]
+        res = np.zeros(n_rings, dtype=bool)
+        res[first] = True
+        return res
+
+    def ring_sums(self, values):
+        """Sum of values over the segments of each ring.  values has one
+        entry per segment between consecutive coordinates (n_coords - 1),
+        entries spanning two rings are ignored."""
+        cs = np.zeros(len(values) + 1)
+        np.cumsum(values, out=cs[1:])
+        start = self.ring_offsets[:-1]
+        end = np.maximum(self.ring_offsets[1:] - 1, start)
+        return cs[end] - cs[start]
+
+    def areas(self, ring_areas=None):
+        """Area of each geometry (0 for points and lines)
+
+        Parameters
+        ----------
+        ring_areas: np.ndarray (default None)
+            The area of each ring, e.g. from one of the ring kernels in
+            spatiallib.  If None, the planar area of the coordinates.
+        """
+        if len(self.coords) < 2:
+            return np.zeros(len(self))
+
+        if ring_areas is None:
+            x, y = self.coords[:, 0], self.coords[:, 1]
+            cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+            ring_areas = self.ring_sums(cross) / 2.
+        ring_areas = np.abs(ring_areas)
+        ring_areas[~self.exterior_rings()] *= -1
+
+        ring_ids = self.ring_geometry_ids()
+        is_polygon = (self.types == POLYGON) | (self.types == MULTIPOLYGON)
+        ring_areas[~is_polygon[ring_ids]] = 0.
+        return np.bincount(ring_ids, weights=ring_areas, minlength=len(self))
+
+    def lengths(self, ring_lengths=None):
+        """Length of each geometry (perimeter for polygons)
+
+        Parameters
+        ----------
+        ring_lengths: np.ndarray (default None)
+            The length of each ring, e.g. from one of the ring kernels in
+            spatiallib.  If None, the planar length of the coordinates.
+        """
+        if len(self.coords) < 2:
+            return np.zeros(len(self))
+
+        if ring_lengths is None:
+            seg = np.hypot(np.diff(self.coords[:, 0]),
+                           np.diff(self.coords[:, 1]))
+            ring_lengths = self.ring_sums(seg)
+        return np.bincount(self.ring_geometry_ids(),
+                           weights=ring_lengths, minlength=len(self))
+
+    def bounds(self):
+        """Envelope of each geometry as an (n, 4) array of xmin, ymin, xmax,
+        ymax (0 for empty geometries, as ogr.Geometry.GetEnvelope)"""
+        res = np.zeros((len(self), 4))
+        start, end = self.ring_bounds()
+        nonempty = end > start
+        if nonempty.any():
+            # The coordinates of the non empty geometries are contiguous
+            starts = start[nonempty]
+            for col, (fn, dim) in enumerate([(np.minimum, 0), (np.minimum, 1),
+                                             (np.maximum, 0), (np.maximum, 1)]):
+                res[nonempty, col] = fn.reduceat(self.coords[:, dim], starts)
+        return res
+
+    def centroids(self):
+        """Centroid of each geometry as an (n, 2) array of x, y.  As in
+        GEOS, the centroid of the area for polygons, of the length for
+        lines (and polygons without area) and the mean of the coordinates
+        for points.  Coordinates are taken relative to the first point of
+        their ring to limit the loss of precision."""
+        n = len(self)
+        x, y = self.coords[:, 0], self.coords[:, 1]
+        counts = self.vertex_counts()
+        ids = self.coord_geometry_ids()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            res = np.column_stack([np.bincount(ids, x, minlength=n),
+                                   np.bincount(ids, y, minlength=n)])
+            res /= counts[:, None]
+            if len(self.coords) < 2:
+                return res
+
+            ring_ids = self.ring_geometry_ids()
+            ring_counts = np.diff(self.ring_offsets)
+            ring_start = self.ring_offsets[:-1][ring_counts > 0]
+            ox, oy = x[ring_start], y[ring_start]
+            ring_ox = np.zeros(len(ring_counts))
+            ring_oy = np.zeros(len(ring_counts))
+            ring_ox[ring_counts > 0] = ox
+            ring_oy[ring_counts > 0] = oy
+            dx = x - np.repeat(ring_ox, ring_counts)
+            dy = y - np.repeat(ring_oy, ring_counts)
+
+            def geom_sums(values):
+                return np.bincount(ring_ids, weights=values, minlength=n)
+
+            # Lines: midpoints of the segments weighted by their length
+            seg = np.hypot(np.diff(x), np.diff(y))
+            length = self.ring_sums(seg)
+            mx = self.ring_sums(seg * (dx[:-1] + dx[1:]) / 2) + ring_ox * length
+            my = self.ring_sums(seg * (dy[:-1] + dy[1:]) / 2) + ring_oy * length
+            length = geom_sums(length)
+            is_line = ((self.types != POINT) & (self.types != MULTIPOINT) &
+                       (length > 0))
+            res[is_line, 0] = geom_sums(mx)[is_line] / length[is_line]
+            res[is_line, 1] = geom_sums(my)[is_line] / length[is_line]
+
+            # Polygons: holes are subtracted whatever the orientation
+            cross = dx[:-1] * dy[1:] - dx[1:] * dy[:-1]
+            ring_areas = self.ring_sums(cross) / 2.
+            sign = np.sign(ring_areas)
+            sign[~self.exterior_rings()] *= -1
+            area = ring_areas * sign
+            mx = (self.ring_sums((dx[:-1] + dx[1:]) * cross) / 6. * sign +
+                  ring_ox * area)
+            my = (self.ring_sums((dy[:-1] + dy[1:]) * cross) / 6. * sign +
+                  ring_oy * area)
+            area = geom_sums(area)
+            is_polygon = (((self.types == POLYGON) |
+                           (self.types == MULTIPOLYGON)) & (area != 0))
+            res[is_polygon, 0] = geom_sums(mx)[is_polygon] / area[is_polygon]
+            res[is_polygon, 1] = geom_sums(my)[is_polygon] / area[is_polygon]
+        return res
+
+    def wkb_sizes(self):
+        """Size in bytes of the WKB of each geometry, as
+        ogr.Geometry.WkbSize, computed from the offsets only"""
+        n_parts = len(self.part_offsets) - 1
+        part_geoms = np.repeat(np.arange(len(self)), np.diff(self.geom_offsets))
+        ring_parts = np.repeat(np.arange(n_parts), np.diff(self.part_offsets))
+        single = np.array([0, POINT, LINESTRING, POLYGON, POINT, LINESTRING,
+                           POLYGON], dtype=np.uint8)[self.types][part_geoms]
+
+        dims = 2 + self.has_z.astype(np.int64)
+        ring_dims = dims[part_geoms][ring_parts]
+        coord_bytes = np.diff(self.ring_offsets) * 8 * ring_dims
+        # Header, then the number of points (LineString) or rings (Polygon)
+        # and the number of points of each ring
+        part_bytes = (5 + 4 * (single != POINT) +
+                      4 * np.diff(self.part_offsets) * (single == POLYGON) +
+                      np.bincount(ring_parts, weights=coord_bytes,
+                                  minlength=n_parts))
+        is_multi = (self.types >= MULTIPOINT).astype(np.int64)
+        res = 9 * is_multi + np.bincount(part_geoms, weights=part_bytes,
+                                         minlength=len(self))
+        return res.astype(np.int64)
+
+    def take(self, indices):
+        """Return a GeometryArray with the geometries at positions indices"""
+        indices = np.asarray(indices, dtype=np.int64)
+        go, po, ro = self.geom_offsets, self.part_offsets, self.ring_offsets
+        parts = concat_ranges(go[indices], go[indices + 1])
+        rings = concat_ranges(po[parts], po[parts + 1])
+        coords = concat_ranges(ro[rings], ro[rings + 1])
+        return GeometryArray(self.types[indices],
+                             offsets_from_counts(go[indices + 1] - go[indices]),
+                             offsets_from_counts(po[parts + 1] - po[parts]),
+                             offsets_from_counts(ro[rings + 1] - ro[rings]),
+                             self.coords[coords],
+                             z=None if self.z is None else self.z[coords],
+                             has_z=self.has_z[indices])
+
+    def transform(self, ct, force_z=False):
+        """Return a GeometryArray with all the coordinates transformed by
+        ct in a single call.
+
+        Parameters
+        ----------
+        ct: osr.CoordinateTransformation
+
+        force_z: boolean (default False)
+            Give every geometry a z dimension, like ogr.Geometry.Transform
+            does with GDAL < 2.
+        """
+        pts = self.coords
+        if self.z is not None:
+            pts = np.column_stack([pts, self.z])
+
+        if len(pts) > 0:
+            res = np.array(ct.TransformPoints(pts.tolist()), dtype=np.float64)
+        else:
+            res = np.zeros((0, 3))
+
+        z = None
+        if self.z is not None or force_z:
+            z = res[:, 2].copy() if res.shape[1] > 2 else np.zeros(len(res))
+        has_z = self.has_z
+        if force_z:
+            has_z = np.ones(len(self), dtype=bool)
+
+        return GeometryArray(self.types, self.geom_offsets,
+                             self.part_offsets, self.ring_offsets,
+                             np.ascontiguousarray(res[:, :2]), z=z,
+                             has_z=has_z)
+
+    def _ring_wkb(self, ring, has_z):
+        start, end = self.ring_offsets[ring], self.ring_offsets[ring + 1]
+        xy = self.coords[start:end]
+        if has_z:
+            z = self.z[start:end] if self.z is not None else np.zeros(end - start)
+            xy = np.column_stack([xy, z])
+        return np.ascontiguousarray(xy, dtype="<f8").tobytes()
+
+    def _part_wkb(self, gtype, part, has_z):
+        code = gtype | (WKB_25D if has_z else 0)
+        header = struct.pack("<BI", 1, code)
+        first, last = self.part_offsets[part], self.part_offsets[part + 1]
+
+        if gtype == POINT:
+            return header + self._ring_wkb(first, has_z)
+
+        if gtype == LINESTRING:
+            n = self.ring_offsets[first + 1] - self.ring_offsets[first]
+            return header + struct.pack("<I", n) + self._ring_wkb(first, has_z)
+
+        rings = [struct.pack("<I", self.ring_offsets[r + 1] - self.ring_offsets[r]) +
+                 self._ring_wkb(r, has_z) for r in xrange(first, last)]
+        return header + struct.pack("<I", last - first) + b"".join(rings)
+
+    def wkb(self, i):
+        """WKB (little endian) of the geometry at position i"""
+        gtype = int(self.types[i])
+        has_z = bool(self.has_z[i])
+        first, last = self.geom_offsets[i], self.geom_offsets[i + 1]
+        if gtype in SINGLE_TYPES:
+            single = SINGLE_TYPES[gtype]
+            code = gtype | (WKB_25D if has_z else 0)
+            parts = [self._part_wkb(single, p, has_z)
+                     for p in xrange(first, last)]
+            return (struct.pack("<BII", 1, code, last - first) +
+                    b"".join(parts))
+
+        return self._part_wkb(gtype, first, has_z)
+
+    def geometry(self, i, proj=None):
+        """ogr.Geometry at position i, with proj assigned (if not None)"""
+        geom = ogr.CreateGeometryFromWkb(self.wkb(i))
+        if proj is not None:
+            geom.AssignSpatialReference(proj)
+        return geom
+
+    def shapely(self, i):
+        """shapely geometry at position i"""
+        return wkb.loads(self.wkb(i))
+
+    def to_geojson(self):
+        """GeoJSON geometry objects (dicts) of all the geometries.  The
+        coordinates are converted to lists in one call and then only
+        sliced, instead of converting every geometry separately."""
+        points = self.coords.tolist()
+        points_z = None
+        if self.z is not None and self.has_z.any():
+            points_z = np.column_stack([self.coords, self.z]).tolist()
+        ring_offsets = self.ring_offsets.tolist()
+        part_offsets = self.part_offsets.tolist()
+        geom_offsets = self.geom_offsets.tolist()
+        has_z = self.has_z.tolist()
+
+        def part_coords(pts, gtype, part):
+            first, last = part_offsets[part], part_offsets[part + 1]
+            rings = [pts[ring_offsets[r]:ring_offsets[r + 1]]
+                     for r in xrange(first, last)]
+            if gtype == POINT:
+                return rings[0][0] if rings and rings[0] else []
+            elif gtype == LINESTRING:
+                return rings[0] if rings else []
+            return rings
+
+        res = []
+        for i, gtype in enumerate(self.types.tolist()):
+            pts = points_z if has_z[i] and points_z is not None else points
+            first, last = geom_offsets[i], geom_offsets[i + 1]
+            if gtype in SINGLE_TYPES:
+                coords = [part_coords(pts, SINGLE_TYPES[gtype], p)
+                          for p in xrange(first, last)]
+            elif last > first:
+                coords = part_coords(pts, gtype, first)
+            else:
+                coords = []
+            res.append({"type": GEOJSON_TYPES[gtype], "coordinates": coords})
+        return res
+
+    def to_geometries(self, proj=None):
+        """List of ogr.Geometry for all the geometries"""
+        return [self.geometry(i, proj=proj) for i in xrange(len(self))]
@@ -0,0 +1,104 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import multiprocessing
+
+# Read-only inputs for the worker functions.  They are set before the pool
+# is created, so the forked workers inherit them instead of receiving a
+# pickled copy with every task.
+_SHARED = {}
+
+
+def get_shared(key):
+    """Get an input shared with the workers by pool_map"""
+    return _SHARED[key]
+
+
+def chunk_slices(n, n_chunks):
+    """Split range(n) into at most n_chunks contiguous (start, stop) pairs
+    of (nearly) equal size."""
+    n_chunks = max(1, min(n_chunks, n))
+    size, extra = divmod(n, n_chunks)
+    res = []
+    start = 0
+    for i in xrange(n_chunks):
+        stop = start + size + (1 if i < extra else 0)
+        res.append((start, stop))
+        start = stop
+    return res
+
+
+def n_workers(n_jobs):
+    """Number of processes for n_jobs.  None or a negative number means
+    one per cpu."""
+    if n_jobs is None or n_jobs < 1:
+        return multiprocessing.cpu_count()
+    return n_jobs
+
+
+def pool_map(fn, args, n_jobs=1, shared=None):
+    """Apply fn to every element of args, in a pool of n_jobs processes if
+    n_jobs != 1.  fn must be a module level function.
+
+    Parameters
+    ----------
+    fn: function
+
+    args: list
+        The arguments for each call of fn
+
+    n_jobs: int (default 1)
+        Number of processes. None or -1 uses one process per cpu.
+
+    shared: dict (default None)
+        Read-only inputs available to fn through get_shared, in addition
+        to those of an enclosing pool_map call.  Workers inherit them when
+        the pool is forked, so this requires a platform that forks (i.e.
+        not Windows).
+
+    Returns
+    -------
+    list of the results, in the order of args
+    """
+    global _SHARED
+    # Restored afterwards, so pool_map can be called from a function run by
+    # another pool_map.  The inputs of the outer call stay available.
+    previous = _SHARED
+    _SHARED = dict(previous)
+    if shared is not None:
+        _SHARED.update(shared)
+    try:
+        n_jobs = n_workers(n_jobs)
+        if n_jobs == 1 or len(args) <= 1:
+            return [fn(a) for a in args]
+
+        pool = multiprocessing.Pool(min(n_jobs, len(args)))
+        try:
+            return pool.map(fn, args)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _SHARED = previous
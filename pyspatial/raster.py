@@ -23,8 +23,12 @@ HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABI
 ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import inspect
 import json
+import logging
 import re
+import time
+from collections import defaultdict
 from uuid import uuid4
 import os
 
@@ -45,9 +49,10 @@ from PIL import Image, ImageDraw
 from pyspatial import fileutils
 
 from pyspatial import spatiallib as slib
+from pyspatial.checkpoint import QueryResultStore
 from pyspatial.vector import read_geojson, to_geometry, bounding_box
-from pyspatial.vector import VectorLayer
-from pyspatial.utils import projection_from_epsg
+from pyspatial.vector import VectorLayer, iter_layer_blocks
+from pyspatial.utils import projection_from_epsg, get_proj4, same_projection
 
 
 NP2GDAL_CONVERSION = {
@@ -144,6 +149,95 @@ def rasterize(shp, ext_outline=False, ext_fill=True, int_outline=False,
     return downscale_local_mean(np.array(img), (sf, sf))
 
 
+# Upper bound on (bounding box pixels x vertices) for which the exact
+# method is chosen when the requested tolerance can't be met by
+# supersampling with the maximum scale factor.
+EXACT_COST_BUDGET = 20000
+
+QUERY_METHODS = ["exact", "supersampled", "center"]
+
+# Stages timed by QueryStats, in the order RasterDataset.query runs them
+QUERY_STAGES = ["transform", "within", "to_pixels", "rasterize", "exact",
+                "gather", "tile_io"]
+
+
+def count_vertices(shp):
+    """Number of vertices in a shapely geometry"""
+    parts = shp.geoms if hasattr(shp, "geoms") else [shp]
+    n = 0
+    for p in parts:
+        if hasattr(p, "exterior"):
+            n += len(p.exterior.coords)
+            n += sum(len(r.coords) for r in p.interiors)
+        else:
+            n += len(p.coords)
+    return n
+
+
+def choose_query_method(shp_px, area_px, tolerance=None, scale_factor=4,
+                        small_polygon_pixels=4):
+    """Pick the method used by RasterDataset.query to compute the pixels
+    and weights of a shape.
+
+    * "exact": intersect the shape with every pixel in its bounding box.
+      Cost grows with bounding box pixels x vertices.
+    * "supersampled": rasterize the shape scaled up by a scale factor
+      and downscale (see rasterize).
+    * "center": rasterize the shape at the raster resolution, i.e. a pixel
+      is included if its center is inside the shape.
+
+    Only the boundary pixels of a shape are partially covered, and treating
+    each as fully in or out is off by at most half a pixel on average, so
+    the relative error of the "center" method is roughly
+    perimeter / (2 * area) (in pixels).  Supersampling by a factor sf
+    divides that error by sf.
+
+    Parameters
+    ----------
+    shp_px: shapely.Polygon or MultiPolygon
+        The shape in pixel coordinates.
+
+    area_px: float
+        The area of the shape in pixels.
+
+    tolerance: float (default None)
+        The accepted relative error of the weights. If None, shapes
+        smaller than small_polygon_pixels use the exact method and all others
+        are supersampled by scale_factor.
+
+    scale_factor: int (default 4)
+        The scale factor, or the maximum scale factor if tolerance is set.
+
+    small_polygon_pixels: int (default 4)
+        Shapes with fewer pixels than this always use the exact method,
+        since rasterizing does not work for shapes smaller than a few pixels.
+
+    Returns
+    -------
+    Tuple of (method, scale_factor). The scale_factor is None for "exact".
+    """
+    if area_px < small_polygon_pixels:
+        return "exact", None
+
+    if tolerance is None:
+        return "supersampled", scale_factor
+
+    error = shp_px.length / (2. * area_px)
+    if error <= tolerance:
+        return "center", 1
+
+    sf = int(np.ceil(error / tolerance))
+    if sf <= scale_factor:
+        return "supersampled", sf
+
+    minx, miny, maxx, maxy = shp_px.bounds
+    bbox_px = (maxx - minx + 1) * (maxy - miny + 1)
+    if bbox_px * count_vertices(shp_px) <= EXACT_COST_BUDGET:
+        return "exact", None
+
+    return "supersampled", scale_factor
+
+
 class RasterBase(object):
     """
     Provides methods and attributes common to both RasterBand and
@@ -203,6 +297,12 @@ class RasterBase(object):
         self.pixel_area = abs(self.lon_px_size * self.lat_px_size)
         self.proj = proj
 
+    @property
+    def proj4(self):
+        """The Proj4 string of the raster's projection.  Computed once and
+        cached until proj is replaced."""
+        return get_proj4(self)
+
     def _to_pixels(self, lon, lat, alt=None):
         """Convert a point from lon/lat to pixel coordinates.  Note,
         the altitude is currently ignored.
@@ -226,6 +326,29 @@ class RasterBase(object):
                                         self.lat_px_size)
         return int(lon_px), int(lat_px)
 
+    def _to_pixels_array(self, lon, lat, alt=None):
+        """Array version of _to_pixels, converts all the coordinates of a
+        shape in one call.  Note, the altitude is currently ignored.
+
+        Parameters
+        ----------
+        lon: sequence of float
+            Longitudes of the points
+
+        lat: sequence of float
+            Latitudes of the points
+
+        Returns
+        -------
+        tuple of lists of int
+            (longitudes in pixel space, latitudes in pixel space).
+        """
+        lon_px, lat_px = slib.to_pixels_array(
+            np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64),
+            self.min_lon, self.max_lat, self.lon_px_size, self.lat_px_size)
+        # Truncate like int() in _to_pixels
+        return lon_px.astype(int).tolist(), lat_px.astype(int).tolist()
+
     def shape_to_pixel(self, geom):
         """Takes a feature and returns a shapely object transformed into the
         pixel coords.
@@ -241,7 +364,7 @@ class RasterBase(object):
             Feature in pixel coordinates.
         """
         shp = wkb.loads(geom.ExportToWkb())
-        return ops.transform(self._to_pixels, shp)
+        return ops.transform(self._to_pixels_array, shp)
 
     def to_pixels(self, vector_layer):
         """Takes a vector layer and returns list of shapely geometry
@@ -259,7 +382,7 @@ class RasterBase(object):
         list of shapely.Polygon
             Shapes in pixel coordinates.
         """
-        if self.proj.ExportToProj4() != vector_layer.proj.ExportToProj4():
+        if not same_projection(self, vector_layer):
             vector_layer = vector_layer.transform(self.proj)
         return [self.shape_to_pixel(geom) for geom in vector_layer]
 
@@ -562,11 +685,121 @@ class RasterQueryResult:
 
     weights: np.ndarray
         The fraction of the polygon intersecting with the pixel
+
+    method: str
+        The method used to compute the weights ("exact", "supersampled" or
+        "center"), None if the shape is outside the raster.
     """
-    def __init__(self, id, values, weights):
+    def __init__(self, id, values, weights, method=None):
         self.id = id
         self.values = values
         self.weights = weights
+        self.method = method
+
+
+class _NullTimer(object):
+    """No-op context manager used when query statistics are disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer(object):
+    """Context manager that adds the elapsed time of a block to a stage
+    in a QueryStats object."""
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.stats.add_time(self.stage, time.time() - self.start)
+        return False
+
+
+class QueryStats(object):
+    """
+    Cumulative timings and counters collected by RasterDataset.query.
+    Statistics accumulate across queries until reset() is called.
+
+    Stages (QUERY_STAGES)
+    ---------------------
+    transform: reprojecting the vector layer into the raster projection
+    within: filtering out shapes outside the raster bounds
+    to_pixels: converting shapes into pixel coordinates
+    rasterize: rasterizing shapes (supersampled and center methods)
+    exact: exact intersection of shapes with the pixel grid
+    gather: looking up pixel values (includes tile_io)
+    tile_io: reading tiles from disk
+
+    Counters
+    --------
+    shapes: shapes in the queried layers
+    shapes_missing: shapes outside the raster bounds
+    shapes_exact, shapes_supersampled, shapes_center: shapes per method
+    pixels: pixel values gathered
+    tiles_loaded: tiles read from disk
+    bytes_read: bytes of (uncompressed) pixel data read from tiles
+    tile_cache_hits: pixel lookups served from an already loaded tile
+
+    Parameters
+    ----------
+    callback: callable (default=None)
+        Called as callback(stage, seconds) every time a stage completes.
+        Use it to forward timings to a logger or a metrics client.
+
+    Attributes
+    ----------
+    timings: dict of str: float
+        Cumulative seconds spent in each stage.
+
+    counts: dict of str: int
+        Cumulative value of each counter.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """Clear all timings and counters."""
+        self.timings = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def timer(self, stage):
+        """Context manager timing a block of code as stage."""
+        return _StageTimer(self, stage)
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] += seconds
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def incr(self, counter, n=1):
+        self.counts[counter] += n
+
+    def to_dict(self):
+        """Return the timings and counters as a dictionary."""
+        return {"timings": dict(self.timings), "counts": dict(self.counts)}
+
+    def log(self, logger=None, level=logging.INFO):
+        """Write a one line summary of the statistics to logger."""
+        if logger is None:
+            logger = logging.getLogger(__name__)
+        timings = " ".join("%s=%.3fs" % kv for kv in sorted(self.timings.items()))
+        counts = " ".join("%s=%d" % kv for kv in sorted(self.counts.items()))
+        logger.log(level, "raster query: %s %s", timings, counts)
+
+    def __repr__(self):
+        return "QueryStats(timings=%s, counts=%s)" % (dict(self.timings),
+                                                      dict(self.counts))
 
 
 class RasterDataset(RasterBase):
@@ -633,6 +866,10 @@ class RasterDataset(RasterBase):
         structure for a tile once they have been processed. Tiles can be
         cleared from memory when there are no shapes left in their set.
 
+    stats : QueryStats
+        Timings and counters collected by query(). None (the default)
+        unless enabled with enable_stats().
+
     Notes
     -----
     Raster representation (tiled and untiled):
@@ -682,6 +919,7 @@ class RasterDataset(RasterBase):
         self.index = index
         self.grid_size = grid_size
         self.dtype = None
+        self.stats = None
 
         # Initialize the base class with coordinate information.
         RasterBase.__init__(self, xsize, ysize, geo_transform, proj)
@@ -697,6 +935,50 @@ class RasterDataset(RasterBase):
         ds = None
         path_or_ds = None
 
+    def enable_stats(self, callback=None):
+        """Start collecting timings and counters for queries.
+
+        Parameters
+        ----------
+        callback: callable (default=None)
+            Called as callback(stage, seconds) every time a stage
+            completes.
+
+        Returns
+        -------
+        QueryStats
+        """
+        self.stats = QueryStats(callback=callback)
+        return self.stats
+
+    def disable_stats(self):
+        """Stop collecting statistics and return the ones collected."""
+        stats = self.stats
+        self.stats = None
+        return stats
+
+    def _timer(self, stage):
+        if self.stats is None:
+            return _NULL_TIMER
+        return self.stats.timer(stage)
+
+    def _count(self, counter, n=1):
+        if self.stats is not None:
+            self.stats.incr(counter, n)
+
+    def _load_tile(self, key):
+        """Read the tile with upper left pixel key into raster_arrays."""
+        filename = self.path + "%d_%d.tif" % key
+        with self._timer("tile_io"):
+            self.raster_arrays[key] = read_vsimem(filename)
+
+        if self.dtype is None:
+            self.dtype = self.raster_arrays[key].dtype
+
+        if self.stats is not None:
+            self.stats.incr("tiles_loaded")
+            self.stats.incr("bytes_read", self.raster_arrays[key].nbytes)
+
     def _get_value_for_pixel(self, px):
         """Look up value for a pixel in raster space.
 
@@ -720,10 +1002,9 @@ class RasterDataset(RasterBase):
         # If we haven't already read this grid tile into memory, do so now,
         # and store it in raster_arrays for future queries to access.
         if (x_grid, y_grid) not in self.raster_arrays:
-            filename = self.path + "%d_%d.tif" % key
-            self.raster_arrays[key] = read_vsimem(filename)
-            if self.dtype is None:
-                self.dtype = self.raster_arrays[key].dtype
+            self._load_tile(key)
+        elif self.stats is not None:
+            self.stats.incr("tile_cache_hits")
 
         # Look up the grid tile for this pixel.
         raster = self.raster_arrays[key]
@@ -770,6 +1051,7 @@ class RasterDataset(RasterBase):
         """
         # Untiled case: Use the 1-file raster array we read in at
         # initialization.
+        self._count("pixels", len(pxs))
         if self.grid_size is None:
             return self.raster_arrays[pxs[:, 1], pxs[:, 0]]
         # Tiled case: Compute the grid tile to read, and the x,y offset in
@@ -805,12 +1087,14 @@ class RasterDataset(RasterBase):
 
     def _small_pixel_query(self, shp, shp_px):
 
+        # shp is already in the raster projection (see query), so it
+        # can be intersected with the grid as is.
         grid = self.to_geometry_grid(*shp_px.bounds)
         areas = {}
         for i, b in grid.iteritems():
 
-            if b.Intersects(to_geometry(shp, proj=self.proj)):
-                diff = b.Intersection(to_geometry(shp, proj=self.proj))
+            if b.Intersects(shp):
+                diff = b.Intersection(shp)
                 areas[i] = diff.GetArea()
 
         index = areas.keys()
@@ -826,7 +1110,7 @@ class RasterDataset(RasterBase):
 
     def query(self, vector_layer, ext_outline=False, ext_fill=True,
               int_outline=False, int_fill=False, scale_factor=4,
-              missing_first=False, small_polygon_pixels=4):
+              missing_first=False, small_polygon_pixels=4, tolerance=None):
         """
         Query the dataset with a set of shapes (in a VectorLayer). The
         vectors will be reprojected into the projection of the raster. Any
@@ -848,6 +1132,7 @@ class RasterDataset(RasterBase):
         scale_factor: int (default 4)
             The amount to scale the shape in X, Y before downscaling. The
             higher this number, the more precise the estimate of the overlap.
+            If tolerance is set, this is the maximum scale factor.
 
         missing_first: boolean (default false)
             Where the missing values should be at the beginning or the
@@ -859,23 +1144,42 @@ class RasterDataset(RasterBase):
             the exact intersection between the polygon and the raster in the
             cooridate space of the raster (not pixel space!).
 
+        tolerance: float (default None)
+            The accepted relative error of the weights of each shape. If set,
+            the method (exact, supersampled or center point) and scale factor
+            are chosen per shape from its vertex count and pixel footprint,
+            see choose_query_method. If None, small polygons use the
+            exact method and all others are supersampled by scale_factor.
+
         Yields
         ------
 
-        RasterQueryResult.  This is 3 attributes: id, values, weights.  The
-        values are the pixel values from the raster.  the weights are the fraction
-        of the pixel that is occupied by the polgon.
+        RasterQueryResult.  This is 4 attributes: id, values, weights, method.
+        The values are the pixel values from the raster.  the weights are the
+        fraction of the pixel that is occupied by the polgon.  The method is
+        the one chosen to compute the weights.
+
+        See Also
+        --------
+        RasterDataset.enable_stats : Collect per stage timings and counters.
         """
 
-        if self.proj.ExportToProj4() != vector_layer.proj.ExportToProj4():
-            # Transform all vector shapes into raster projection.
-            vl = vector_layer.transform(self.proj)
-        else:
-            vl = vector_layer
+        self._count("shapes", len(vector_layer))
+
+        # Shapes are transformed at most once per query. If the layer is
+        # already in the raster projection, the geometries are used as is.
+        with self._timer("transform"):
+            if not same_projection(self, vector_layer):
+                # Transform all vector shapes into raster projection.
+                vl = vector_layer.transform(self.proj)
+            else:
+                vl = vector_layer
 
-        # Filter out all shapes outside the raster bounds
-        bbox = self.bbox()
-        vl = vl.within(bbox)
+        # Filter out all shapes outside the raster bounds. Select by id
+        # so the geometries are shared instead of cloned.
+        with self._timer("within"):
+            bbox = self.bbox()
+            vl = vl[vl.iwithin(bbox)]
 
         ids_to_tiles = None
         tiles_to_ids = None
@@ -899,13 +1203,15 @@ class RasterDataset(RasterBase):
         #    vl = vl.sort()
 
         missing = vector_layer.index.difference(vl.index)
+        self._count("shapes_missing", len(missing))
 
         if missing_first:
             ids = missing.append(vl.ids)
         else:
             ids = vl.ids.append(missing)
 
-        px_shps = dict(zip(vl.ids, self.to_pixels(vl)))
+        with self._timer("to_pixels"):
+            px_shps = dict(zip(vl.ids, self.to_pixels(vl)))
 
         for id in ids:
             shp = px_shps.get(id, None)
@@ -922,31 +1228,42 @@ class RasterDataset(RasterBase):
                 #            self.raster_arrays[key] = RasterBand(filename)
                 #        tiles_to_ids[key].remove(id)
 
-                # Check for small polygon since rasterizing a polygon
-                # doesn't work for small polygons
-                if vl[id].GetArea() < small_polygon_pixels * self.pixel_area:
-                    values, weights = self._small_pixel_query(vl[id], shp)
+                # Small polygons always use the exact method since
+                # rasterizing a polygon doesn't work for small polygons
+                area_px = vl[id].GetArea() / self.pixel_area
+                method, sf = choose_query_method(
+                    shp, area_px, tolerance=tolerance,
+                    scale_factor=scale_factor,
+                    small_polygon_pixels=small_polygon_pixels)
+                self._count("shapes_" + method)
+
+                if method == "exact":
+                    with self._timer("exact"):
+                        values, weights = self._small_pixel_query(vl[id], shp)
 
                 else:
                     # Rasterize the shape, and find list of all points.
-                    mask = rasterize(shp, ext_outline=ext_outline,
-                                     ext_fill=ext_fill,
-                                     int_outline=int_outline,
-                                     int_fill=int_fill,
-                                     scale_factor=scale_factor).T
+                    with self._timer("rasterize"):
+                        mask = rasterize(shp, ext_outline=ext_outline,
+                                         ext_fill=ext_fill,
+                                         int_outline=int_outline,
+                                         int_fill=int_fill,
+                                         scale_factor=sf).T
+
+                        minx, miny, maxx, maxy = shp.bounds
+                        idx = np.argwhere(mask > 0)
 
-                    minx, miny, maxx, maxy = shp.bounds
-                    idx = np.argwhere(mask > 0)
+                        if idx.shape[0] == 0:
+                            weights = mask[[0]]
+                        else:
+                            weights = mask[idx[:, 0], idx[:, 1]]
 
-                    if idx.shape[0] == 0:
-                        weights = mask[[0]]
-                    else:
-                        weights = mask[idx[:, 0], idx[:, 1]]
+                        pts = (idx + np.array([minx, miny])).astype(int)
 
-                    pts = (idx + np.array([minx, miny])).astype(int)
-                    values = self.get_values_for_pixels(pts)
+                    with self._timer("gather"):
+                        values = self.get_values_for_pixels(pts)
 
-                yield RasterQueryResult(id, values, weights)
+                yield RasterQueryResult(id, values, weights, method)
 
             #if tiles_to_ids is None:
             #   continue
@@ -958,6 +1275,146 @@ class RasterDataset(RasterBase):
             #    del tiles_to_ids[e]
 
 
+    def query_file(self, path, layer=0, index=None, batch_size=1000,
+                   **kwargs):
+        """
+        Query the dataset with the shapes in a vector file, without loading
+        the whole file into a VectorLayer. Features are streamed from OGR in
+        spatially compact batches of batch_size shapes, and each batch is
+        queried and discarded before the next one is read, so memory use is
+        bounded by a multiple of the batch size rather than the file size
+        (see pyspatial.vector.iter_layer_blocks).
+
+        Parameters
+        ----------
+        path: str
+            Path to the vector file. Can be local or http/s3/gs.
+
+        layer: int (default 0)
+            The layer number to use.
+
+        index: str (default None)
+            The field to use as the id of each shape. Defaults to the
+            feature id (FID).
+
+        batch_size: int (default 1000)
+            Maximum number of shapes in each batch.
+
+        kwargs:
+            Passed to RasterDataset.query
+
+        Yields
+        ------
+        RasterQueryResult
+
+        See Also
+        --------
+        pyspatial.vector.iter_layer_blocks
+        """
+        for vl, _ in iter_layer_blocks(path, layer=layer, index=index,
+                                       batch_size=batch_size):
+            for r in self.query(vl, **kwargs):
+                yield r
+
+    def query_checkpointed(self, vector_layer, path, batch_size=1000,
+                           layer=0, index=None, **kwargs):
+        """
+        Query the dataset with a set of shapes, writing the results to a
+        SQLite database at path in batches of batch_size shapes instead of
+        yielding them. Shapes that already have results in path are
+        skipped, so an interrupted run can be resumed by calling this method
+        again with the same arguments. Only one batch of shapes is
+        transformed and held in memory at a time.  The query settings are
+        recorded in the database, and resuming with settings that change
+        how the weights are computed (e.g. tolerance or scale_factor)
+        raises a ValueError instead of mixing results of different methods.
+
+        Parameters
+        ----------
+        vector_layer : VectorLayer, str, or iterable of VectorLayer
+            Set of shapes in vector format, with ids attached to each.  A
+            path to a vector file is streamed with
+            pyspatial.vector.iter_layer_blocks, like query_file, and an
+            iterable of layers (e.g. from iter_geojson) is consumed one
+            layer at a time, so the shapes are never all in memory.
+
+        path: str
+            Local path of the SQLite database for the results.
+
+        batch_size: int (default 1000)
+            Number of shapes to query and write per transaction.
+
+        layer: int (default 0)
+            The layer number to use if vector_layer is a path.
+
+        index: str (default None)
+            The field to use as the id of each shape if vector_layer is a
+            path. Defaults to the feature id (FID).
+
+        kwargs:
+            Passed to RasterDataset.query
+
+        Returns
+        -------
+        int: The number of results written by this call.
+
+        See Also
+        --------
+        read_query_results : Read the results back.
+        """
+        # The arguments of query that change the results
+        spec = inspect.getargspec(self.query)
+        settings = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+        settings.update(kwargs)
+        settings.pop("missing_first", None)
+
+        if isinstance(vector_layer, VectorLayer):
+            blocks = [vector_layer]
+        elif isinstance(vector_layer, str) or \
+                isinstance(vector_layer, unicode):
+            blocks = (vl for vl, _ in
+                      iter_layer_blocks(vector_layer, layer=layer,
+                                        index=index, batch_size=batch_size))
+        else:
+            # Readers like iter_geojson yield (layer, dataframe) pairs
+            blocks = (b[0] if isinstance(b, tuple) else b
+                      for b in vector_layer)
+
+        written = 0
+        with QueryResultStore(path) as store:
+            store.check_settings(settings)
+            for block in blocks:
+                for start in xrange(0, len(block), batch_size):
+                    stop = min(start + batch_size, len(block))
+                    chunk = block.take(np.arange(start, stop))
+                    done = store.completed_ids(chunk.index)
+                    if len(done) > 0:
+                        chunk = chunk[[i for i in chunk.index
+                                       if i not in done]]
+                    if len(chunk) == 0:
+                        continue
+                    written += store.write(self.query(chunk, **kwargs))
+        return written
+
+
+def read_query_results(path):
+    """
+    Read the results written by RasterDataset.query_checkpointed.
+
+    Parameters
+    ----------
+    path: str
+        Local path of the SQLite database.
+
+    Yields
+    ------
+    RasterQueryResult
+    """
+    with QueryResultStore(path) as store:
+        for id, values, weights, method in store:
+            yield RasterQueryResult(id, values, weights, method)
+
+
 def read_catalog(dataset_catalog_file, workdir=None):
     """Take a catalog file and create a raster dataset
 
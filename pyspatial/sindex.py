@@ -0,0 +1,517 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import heapq
+import struct
+from itertools import islice
+from math import ceil, sqrt
+
+import numpy as np
+from pyspatial.geoarray import concat_ranges
+
+NODE_CAPACITY = 16
+
+# Number of query boxes probed at once by query_bulk.  Bounds the size of
+# the intermediate (query, node) arrays.
+QUERY_CHUNK = 65536
+
+# Index files are a header followed by the arrays of the index, little
+# endian and 8 byte aligned, so they can be memory mapped.
+MAGIC = b"PYSIDX01"
+# magic, number of items, of nodes, of leaves, of view items (-1 if none)
+_HEADER = struct.Struct("<8sqqqq")
+
+
+def _str_order(bounds, capacity):
+    """Sort-Tile-Recursive order of an (n, 4) array of boxes: sorted by
+    x center into ceil(sqrt(n / capacity)) vertical slices, each of which
+    is sorted by y center."""
+    n = len(bounds)
+    n_nodes = int(ceil(n / float(capacity)))
+    slice_size = int(ceil(sqrt(n_nodes))) * capacity
+    cx = bounds[:, 0] + bounds[:, 2]
+    cy = bounds[:, 1] + bounds[:, 3]
+    by_x = np.argsort(cx, kind="mergesort")
+    slices = np.arange(n) // slice_size
+    return by_x[np.lexsort((cy[by_x], slices))]
+
+
+def _intersects(a, b):
+    """Row-wise test whether the boxes in a and b intersect"""
+    return ((a[:, 0] <= b[:, 2]) & (a[:, 2] >= b[:, 0]) &
+            (a[:, 1] <= b[:, 3]) & (a[:, 3] >= b[:, 1]))
+
+
+def _box_distance(a, b):
+    """Distance between each box in a and the box b"""
+    dx = np.maximum(np.maximum(a[:, 0] - b[2], b[0] - a[:, 2]), 0)
+    dy = np.maximum(np.maximum(a[:, 1] - b[3], b[1] - a[:, 3]), 0)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def _part1by1(v):
+    """Spread the lower 32 bits of v so that there is a 0 bit between
+    every bit."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def zorder_codes(x, y):
+    """Position of each grid cell (x, y) along the Z-order (Morton) curve,
+    i.e. the bits of x and y interleaved.
+
+    Parameters
+    ----------
+    x, y: numpy.ndarray of int
+        Cell coordinates, in [0, 2**32)
+
+    Returns
+    -------
+    numpy.ndarray of uint64
+    """
+    return _part1by1(x) | (_part1by1(y) << np.uint64(1))
+
+
+def hilbert_codes(x, y, n_bits=16):
+    """Position of each grid cell (x, y) along the Hilbert curve filling a
+    2**n_bits x 2**n_bits grid.  Unlike the Z-order curve, consecutive
+    cells are always neighbours.
+
+    Parameters
+    ----------
+    x, y: numpy.ndarray of int
+        Cell coordinates, in [0, 2**n_bits)
+
+    n_bits: int (default 16)
+        At most 32.
+
+    Returns
+    -------
+    numpy.ndarray of uint64
+    """
+    x = np.array(x, dtype=np.int64)
+    y = np.array(y, dtype=np.int64)
+    n = 1 << n_bits
+    d = np.zeros(len(x), dtype=np.uint64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += np.uint64(s) * np.uint64(s) * ((3 * rx) ^ ry).astype(np.uint64)
+        # Rotate the quadrant so that the curve within it starts and ends
+        # at the right corners
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return d
+
+
+class SpatialIndex(object):
+    """
+    Immutable R-tree over the bounding boxes of a set of items, packed
+    with Sort-Tile-Recursive bulk loading.  The tree is stored in a few
+    flat numpy arrays: every node is a box with a contiguous range of
+    children in the level below, and the children of the leaves are
+    ranges of order, the item positions in packed order.
+
+    Parameters
+    ----------
+    bounds: numpy.ndarray
+        (n, 4) array of xmin, ymin, xmax, ymax for each item.  Queries
+        return positions in this array.
+
+    capacity: int (default 16)
+        Maximum number of children per node.
+
+    Attributes
+    ----------
+    node_bounds: numpy.ndarray
+        (m, 4) bounds of the nodes, level by level from the leaves up.
+        The last node is the root.
+
+    node_starts, node_stops: numpy.ndarray
+        Range of the children of each node, in node_bounds for inner
+        nodes and in order for leaves.
+
+    n_leaves: int
+        Number of leaf nodes (the first n_leaves nodes).
+
+    See Also
+    --------
+    SpatialIndex.subset: A view of the index over some of its items.
+    """
+    def __init__(self, bounds, capacity=NODE_CAPACITY):
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        n = len(bounds)
+        levels = []
+        order = np.zeros(0, dtype=np.int64)
+        if n > 0:
+            order = _str_order(bounds, capacity)
+            child_bounds = bounds[order]
+            offset = 0
+            while True:
+                m = len(child_bounds)
+                starts = np.arange(0, m, capacity, dtype=np.int64)
+                stops = np.minimum(starts + capacity, m)
+                nb = np.column_stack([
+                    np.minimum.reduceat(child_bounds[:, 0], starts),
+                    np.minimum.reduceat(child_bounds[:, 1], starts),
+                    np.maximum.reduceat(child_bounds[:, 2], starts),
+                    np.maximum.reduceat(child_bounds[:, 3], starts)])
+                if len(nb) > 1:
+                    # Each node only records the range of its children, so
+                    # the nodes can be reordered to pack the next level.
+                    node_order = _str_order(nb, capacity)
+                    nb = nb[node_order]
+                    starts = starts[node_order]
+                    stops = stops[node_order]
+                if levels:
+                    starts = starts + offset
+                    stops = stops + offset
+                    offset += m
+                levels.append((nb, starts, stops))
+                if len(nb) == 1:
+                    break
+                child_bounds = nb
+
+        if levels:
+            node_bounds = np.concatenate([l[0] for l in levels])
+            node_starts = np.concatenate([l[1] for l in levels])
+            node_stops = np.concatenate([l[2] for l in levels])
+            n_leaves = len(levels[0][0])
+        else:
+            node_bounds = np.zeros((0, 4))
+            node_starts = node_stops = np.zeros(0, dtype=np.int64)
+            n_leaves = 0
+
+        self._set_arrays(bounds, order, node_bounds, node_starts,
+                         node_stops, n_leaves)
+
+    def _set_arrays(self, bounds, order, node_bounds, node_starts,
+                    node_stops, n_leaves):
+        self.bounds = bounds
+        self.order = np.asarray(order, dtype=np.int64)
+        self.node_bounds = np.asarray(node_bounds,
+                                      dtype=np.float64).reshape(-1, 4)
+        self.node_starts = np.asarray(node_starts, dtype=np.int64)
+        self.node_stops = np.asarray(node_stops, dtype=np.int64)
+        self.n_leaves = n_leaves
+        self._levels = self._count_levels()
+        # For views created by subset: the position in bounds of each item
+        # of the view, and the view position of each item in bounds (-1
+        # if it is not in the view).
+        self._items = None
+        self._lookup = None
+        for arr in (self.bounds, self.order, self.node_bounds,
+                    self.node_starts, self.node_stops):
+            arr.flags.writeable = False
+
+    def _count_levels(self):
+        """Number of levels above the items"""
+        if len(self.node_bounds) == 0:
+            return 0
+        levels = 1
+        node = len(self.node_bounds) - 1
+        while node >= self.n_leaves:
+            node = self.node_starts[node]
+            levels += 1
+        return levels
+
+    def _arrays(self):
+        return [(self.bounds, "<f8"), (self.order, "<i8"),
+                (self.node_bounds, "<f8"), (self.node_starts, "<i8"),
+                (self.node_stops, "<i8")]
+
+    def save(self, path):
+        """Write the index to path.  Read it back with read_sindex."""
+        n_view = -1 if self._items is None else len(self._items)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(self.bounds),
+                                 len(self.node_bounds), self.n_leaves,
+                                 n_view))
+            for arr, dtype in self._arrays():
+                f.write(np.asarray(arr, dtype=dtype).tobytes())
+            if self._items is not None:
+                f.write(np.asarray(self._items, dtype="<i8").tobytes())
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return len(self.bounds)
+
+    def subset(self, positions):
+        """A view of the index with only the items at positions, which
+        shares the tree of this index.  Queries on the view return
+        positions in the positions array.
+
+        Parameters
+        ----------
+        positions: array of int
+            Positions of the items to keep, without duplicates.
+
+        Returns
+        -------
+        SpatialIndex
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if self._items is not None:
+            positions = self._items[positions]
+
+        if len(np.unique(positions)) != len(positions):
+            raise ValueError("positions must be unique")
+
+        view = object.__new__(SpatialIndex)
+        view.__dict__.update(self.__dict__)
+        view._items = positions
+        view._lookup = np.empty(len(self.bounds), dtype=np.int64)
+        view._lookup.fill(-1)
+        view._lookup[positions] = np.arange(len(positions))
+        return view
+
+    def compact(self):
+        """A standalone index over only the items of this view, e.g. before
+        pickling or saving it, so the tree of the parent index is not
+        copied along.  Returns the index itself if it is not a view."""
+        if self._items is None:
+            return self
+        return SpatialIndex(self.bounds[self._items])
+
+    def _to_view(self, items):
+        """Positions in the view of items (positions in bounds), and a
+        mask of the items that are in the view"""
+        if self._lookup is None:
+            return items, np.ones(len(items), dtype=bool)
+        pos = self._lookup[items]
+        return pos, pos >= 0
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.bounds, self.order,
+                                      self.node_bounds, self.node_starts,
+                                      self.node_stops))
+
+    def get_bounds(self):
+        """The xmin, ymin, xmax, ymax of all the items"""
+        if len(self) == 0:
+            return (np.nan, np.nan, np.nan, np.nan)
+        if self._items is not None:
+            bounds = self.bounds[self._items]
+            return (bounds[:, 0].min(), bounds[:, 1].min(),
+                    bounds[:, 2].max(), bounds[:, 3].max())
+        return tuple(self.node_bounds[-1])
+
+    def intersection(self, bounds):
+        """Positions of the items whose box intersects bounds.
+
+        Parameters
+        ----------
+        bounds: tuple
+            xmin, ymin, xmax, ymax
+
+        Returns
+        -------
+        numpy.ndarray of positions, sorted
+        """
+        return self.query_bulk([bounds])[1]
+
+    def query_bulk(self, bounds):
+        """Probe the index with many boxes at once.
+
+        Parameters
+        ----------
+        bounds: numpy.ndarray
+            (k, 4) array of xmin, ymin, xmax, ymax
+
+        Returns
+        -------
+        (query, items): two arrays of positions, such that the box
+        bounds[query[i]] intersects the box of item items[i].  Sorted by
+        query, then by item.
+        """
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        queries = []
+        items = []
+        for start in xrange(0, len(bounds), QUERY_CHUNK):
+            q, i = self._query_chunk(bounds[start:start + QUERY_CHUNK])
+            queries.append(q + start)
+            items.append(i)
+
+        if not queries:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(queries), np.concatenate(items)
+
+    def _query_chunk(self, bounds):
+        q = np.arange(len(bounds), dtype=np.int64)
+        if self._levels == 0:
+            return q[:0], q[:0]
+
+        # Walk the tree one level at a time for all queries together,
+        # keeping the (query, node) pairs whose boxes intersect.
+        nodes = np.repeat(len(self.node_bounds) - 1, len(q))
+        keep = _intersects(self.node_bounds[nodes], bounds)
+        q, nodes = q[keep], nodes[keep]
+        for _ in xrange(self._levels - 1):
+            starts = self.node_starts[nodes]
+            stops = self.node_stops[nodes]
+            q = np.repeat(q, stops - starts)
+            nodes = concat_ranges(starts, stops)
+            keep = _intersects(self.node_bounds[nodes], bounds[q])
+            q, nodes = q[keep], nodes[keep]
+
+        starts = self.node_starts[nodes]
+        stops = self.node_stops[nodes]
+        q = np.repeat(q, stops - starts)
+        items = self.order[concat_ranges(starts, stops)]
+        keep = _intersects(self.bounds[items], bounds[q])
+        items, in_view = self._to_view(items[keep])
+        q, items = q[keep][in_view], items[in_view]
+        order = np.lexsort((items, q))
+        return q[order], items[order]
+
+    def nearest(self, bounds, num_results=1):
+        """Positions of the num_results items whose boxes are closest to
+        bounds, closest first.
+
+        Parameters
+        ----------
+        bounds: tuple
+            xmin, ymin, xmax, ymax
+
+        num_results: int (default 1)
+
+        Returns
+        -------
+        numpy.ndarray of positions
+        """
+        res = [i for _, i in islice(self.iter_nearest(bounds), num_results)]
+        return np.array(res, dtype=np.int64)
+
+    def iter_nearest(self, bounds, distance=None):
+        """Iterate over the items by increasing distance of their boxes to
+        bounds.
+
+        Parameters
+        ----------
+        bounds: tuple
+            xmin, ymin, xmax, ymax
+
+        distance: function (default None)
+            distance(boxes, bounds) -> numpy.ndarray, the distance between
+            each row of an (n, 4) array of boxes and bounds.  It must not
+            increase when a box grows, i.e. the distance to a node is at
+            most the distance to any of its children.  If None, the
+            euclidean distance between the boxes.
+
+        Returns
+        -------
+        Generator of (distance, position)
+        """
+        if len(self) == 0:
+            return
+
+        if distance is None:
+            distance = _box_distance
+
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(4)
+        root = len(self.node_bounds) - 1
+        # Best first search. Entries are (distance, is_node, position),
+        # so items are returned before nodes at the same distance.
+        heap = [(0., 1, root)]
+        while heap:
+            dist, is_node, i = heapq.heappop(heap)
+            if not is_node:
+                yield dist, i
+                continue
+
+            start, stop = self.node_starts[i], self.node_stops[i]
+            if i < self.n_leaves:
+                children, in_view = self._to_view(self.order[start:stop])
+                child_bounds = self.bounds[self.order[start:stop][in_view]]
+                children = children[in_view]
+                child_is_node = 0
+            else:
+                children = np.arange(start, stop)
+                child_bounds = self.node_bounds[start:stop]
+                child_is_node = 1
+
+            dists = distance(child_bounds, bounds)
+            for d, c in zip(dists, children):
+                heapq.heappush(heap, (d, child_is_node, c))
+
+
+def read_sindex(path, mmap=True):
+    """Read a SpatialIndex written by SpatialIndex.save.
+
+    Parameters
+    ----------
+    path: str
+
+    mmap: boolean (default True)
+        Memory map the arrays of the index instead of reading them, so
+        that opening the index is (nearly) free and processes using the
+        same file share its pages.
+
+    Returns
+    -------
+    SpatialIndex
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+        raise ValueError("%s is not a spatial index file" % path)
+    _, n, m, n_leaves, n_view = _HEADER.unpack(header)
+
+    if mmap:
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        buf = np.fromfile(path, dtype=np.uint8)
+
+    shapes = [((n, 4), "<f8"), ((n,), "<i8"), ((m, 4), "<f8"),
+              ((m,), "<i8"), ((m,), "<i8")]
+    if n_view >= 0:
+        shapes.append(((n_view,), "<i8"))
+
+    expected = _HEADER.size + sum(8 * int(np.prod(s)) for s, _ in shapes)
+    if len(buf) != expected:
+        raise ValueError("%s is truncated or corrupt" % path)
+
+    arrays = []
+    offset = _HEADER.size
+    for shape, dtype in shapes:
+        size = 8 * int(np.prod(shape))
+        arrays.append(buf[offset:offset + size].view(dtype).reshape(shape))
+        offset += size
+
+    sindex = object.__new__(SpatialIndex)
+    sindex._set_arrays(*(arrays[:5] + [n_leaves]))
+    if n_view >= 0:
+        sindex = sindex.subset(arrays[5])
+    return sindex
@@ -3,22 +3,27 @@ cimport cython
 import numpy as np
 cimport numpy as np
 from libc.stdint cimport uintptr_t
+from cython.parallel cimport prange
 from libc.math cimport sin, cos, exp, sqrt, floor
-cdef extern from "math.h":
+cdef extern from "math.h" nogil:
     double sin(double theta)
     double cos(double theta)
     double tan(double theta)
     double acos(double x)
     double asin(double x)
+    double atan(double x)
+    double atan2(double y, double x)
+    double log(double x)
+    double fabs(double x)
     double floor(double x)
     int floor(double x)
 
 import math
 
 cdef inline double pi(): return math.pi
-cdef inline double radians(double x): return PI*x/180.
-cdef inline double degrees(double x): return 180.*x/PI
-cdef PI = pi()
+cdef double PI = pi()
+cdef inline double radians(double x) nogil: return PI*x/180.
+cdef inline double degrees(double x) nogil: return 180.*x/PI
 
 from shapely.coords import required
 
@@ -26,7 +31,7 @@ DTYPE = np.uint8
 ctypedef np.uint8_t DTYPE_t
 
 
-cdef inline float to_pixel(float a, float A, float a_px_size):
+cdef inline float to_pixel(float a, float A, float a_px_size) nogil:
     return (a - A)/a_px_size
 
 @cython.boundscheck(False)
@@ -50,6 +55,28 @@ def to_pixels(float lon, float lat, float minLon, float maxLat,
     lat_px = to_pixel(lat, maxLat, lat_px_size)
     return lon_px, lat_px
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def to_pixels_array(double[::1] lon, double[::1] lat, float minLon,
+                    float maxLat, float lon_px_size, float lat_px_size):
+    """Array version of to_pixels.  Uses the same single precision
+    arithmetic, so the results are identical to calling to_pixels on
+    every point.  Returns (lon_px, lat_px) float32 arrays."""
+    cdef:
+        Py_ssize_t i, n = lon.shape[0]
+        np.ndarray[np.float32_t, ndim=1] lon_px = np.empty(n, dtype=np.float32)
+        np.ndarray[np.float32_t, ndim=1] lat_px = np.empty(n, dtype=np.float32)
+        float[::1] x = lon_px
+        float[::1] y = lat_px
+
+    if lat.shape[0] != n:
+        raise ValueError("lon and lat must have the same length")
+
+    for i in prange(n, nogil=True, schedule="static"):
+        x[i] = to_pixel(lon[i], minLon, lon_px_size)
+        y[i] = to_pixel(lat[i], maxLat, lat_px_size)
+    return lon_px, lat_px
+
 def grid_for_pixel(int grid_size, np.int_t x, np.int_t y):
     x_grid = x - x % grid_size
     y_grid = y - y % grid_size
@@ -115,7 +142,7 @@ cdef double P5 = (1097. / 512 * _E4)
 cdef double R = 6378137
 
 
-cdef int latlon_to_zone_number(double latitude, double longitude):
+cdef int latlon_to_zone_number(double latitude, double longitude) nogil:
     if 56 <= latitude < 64 and 3 <= longitude < 12:
         return 32
 
@@ -131,7 +158,7 @@ cdef int latlon_to_zone_number(double latitude, double longitude):
 
     return floor((longitude + 180.) / 6.) + 1
 
-cdef double zone_number_to_central_longitude(int zone_number):
+cdef double zone_number_to_central_longitude(int zone_number) nogil:
     return (zone_number - 1) * 6 - 180 + 3
 
 
@@ -143,7 +170,13 @@ cdef struct LatLon:
 @cython.overflowcheck(False)
 @cython.nonecheck(False)
 @cython.cdivision(True)
-cdef LatLon from_latlon(double latitude, double longitude):
+cdef LatLon from_latlon(double latitude, double longitude) nogil:
+    cdef:
+        double lat_rad, lat_sin, lat_cos, lat_tan, lat_tan2, lat_tan4
+        double lon_rad, central_lon, central_lon_rad, n, c, m
+        double a, a2, a3, a4, a5, a6, easting, northing
+        int zone_number
+        LatLon res
 
     lat_rad = radians(latitude)
     lat_sin = sin(lat_rad)
@@ -185,7 +218,9 @@ cdef LatLon from_latlon(double latitude, double longitude):
     if latitude < 0:
         northing += 10000000
 
-    return LatLon(easting, northing)
+    res.lat = easting
+    res.lon = northing
+    return res
 
 # Note, had to elevation because shapely can give coordinates
 # in 2 or 3 dimensions when using ops.transform
@@ -194,6 +229,30 @@ def to_utm(np.float64_t lon, np.float64_t lat, ele=None):
     latlon = from_latlon(lat, lon)
     return latlon.lon, latlon.lat
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def to_utm_array(double[::1] lon, double[::1] lat):
+    """Array version of to_utm.  Every point is projected into its own UTM
+    zone.  Returns two float64 arrays, in the same order as the tuples
+    returned by to_utm, so ops.transform(to_utm, shp) and to_utm_array
+    are interchangeable."""
+    cdef:
+        Py_ssize_t i, n = lon.shape[0]
+        np.ndarray[np.float64_t, ndim=1] x = np.empty(n)
+        np.ndarray[np.float64_t, ndim=1] y = np.empty(n)
+        double[::1] xv = x
+        double[::1] yv = y
+        LatLon p
+
+    if lat.shape[0] != n:
+        raise ValueError("lon and lat must have the same length")
+
+    for i in prange(n, nogil=True, schedule="static"):
+        p = from_latlon(lat[i], lon[i])
+        xv[i] = p.lon
+        yv[i] = p.lat
+    return x, y
+
 def haversine(tuple coord1, tuple coord2):
     """Given two (lng, lat) tuples, returns the distance between them in
     meters."""
@@ -223,4 +282,293 @@ def haversine(tuple coord1, tuple coord2):
 
     c = (sin(phi1) * sin(phi2) * cos(theta1 - theta2) + cos(phi1) * cos(phi2))
     arc = acos(c)
-    return arc * 6367444.7
\ No newline at end of file
+    return arc * 6367444.7
+
+
+def _lonlat_array(coords):
+    """Validate an (n, 2) array of (lng, lat) for haversine_matrix"""
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    if coords.ndim != 2 or coords.shape[1] != 2:
+        raise ValueError("Expected an (n, 2) array of (lng, lat)")
+    if (np.abs(coords[:, 1]) > 90).any():
+        raise ValueError("Invalid latitude (should be between +/- 90)")
+    if (np.abs(coords[:, 0]) > 180).any():
+        raise ValueError("Invalid longitude (should be between +/- 180)")
+    return coords
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def haversine_matrix(a, b):
+    """Given (n, 2) and (m, 2) arrays of (lng, lat), returns the (n, m)
+    matrix of distances in meters between every pair of points.  Same
+    formula and radius as haversine, with the ranges checked once."""
+    cdef:
+        double[:, ::1] ca = _lonlat_array(a)
+        double[:, ::1] cb = _lonlat_array(b)
+        Py_ssize_t i, j, n = ca.shape[0], m = cb.shape[0]
+        np.ndarray[np.float64_t, ndim=2] res = np.empty((n, m))
+        double[:, ::1] out = res
+        double[:, ::1] trig_b = np.empty((m, 3))
+        double sin_a, cos_a, theta_a, c
+
+    for j in range(m):
+        trig_b[j, 0] = sin((90.0 - cb[j, 1]) * 0.0174532925)
+        trig_b[j, 1] = cos((90.0 - cb[j, 1]) * 0.0174532925)
+        trig_b[j, 2] = cb[j, 0] * 0.0174532925
+
+    for i in prange(n, nogil=True, schedule="static"):
+        sin_a = sin((90.0 - ca[i, 1]) * 0.0174532925)
+        cos_a = cos((90.0 - ca[i, 1]) * 0.0174532925)
+        theta_a = ca[i, 0] * 0.0174532925
+        for j in range(m):
+            c = (sin_a * trig_b[j, 0] * cos(theta_a - trig_b[j, 2]) +
+                 cos_a * trig_b[j, 1])
+            # Rounding can push c just outside of [-1, 1] for
+            # (anti)coincident points
+            if c > 1:
+                c = 1
+            elif c < -1:
+                c = -1
+            out[i, j] = acos(c) * 6367444.7
+    return res
+
+
+# WGS84 ellipsoid
+cdef double WGS84_A = 6378137.
+cdef double WGS84_F = 1 / 298.257223563
+cdef double WGS84_B = WGS84_A * (1 - WGS84_F)
+cdef double WGS84_E2 = WGS84_F * (2 - WGS84_F)
+cdef double WGS84_E = sqrt(WGS84_E2)
+
+
+@cython.cdivision(True)
+cdef inline double authalic_q(double sin_lat) nogil:
+    """q(lat) of the authalic latitude, see Snyder (1987) eq. 3-12"""
+    return (1 - WGS84_E2) * (
+        sin_lat / (1 - WGS84_E2 * sin_lat * sin_lat) -
+        log((1 - WGS84_E * sin_lat) / (1 + WGS84_E * sin_lat)) /
+        (2 * WGS84_E))
+
+cdef double Q_P = authalic_q(1.)
+# Radius of the sphere with the same area as the ellipsoid
+cdef double R_AUTHALIC2 = WGS84_A * WGS84_A * Q_P / 2
+
+
+@cython.cdivision(True)
+cdef inline double authalic_half_tan(double lat) nogil:
+    """tan(beta / 2) for the authalic latitude beta of lat (degrees)"""
+    cdef double sin_beta = authalic_q(sin(radians(lat))) / Q_P
+    if sin_beta > 1:
+        sin_beta = 1
+    elif sin_beta < -1:
+        sin_beta = -1
+    return tan(asin(sin_beta) / 2)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef double ring_area_utm(double[::1] lon, double[::1] lat,
+                          Py_ssize_t start, Py_ssize_t end) nogil:
+    cdef:
+        LatLon p0, p, prev
+        double s = 0
+        Py_ssize_t j
+
+    if end - start < 3:
+        return 0
+
+    p0 = from_latlon(lat[start], lon[start])
+    prev = p0
+    for j in range(start + 1, end):
+        p = from_latlon(lat[j], lon[j])
+        # Shoelace formula relative to the first vertex, which keeps the
+        # products of large UTM coordinates from losing precision.
+        s += ((prev.lat - p0.lat) * (p.lon - p0.lon) -
+              (p.lat - p0.lat) * (prev.lon - p0.lon))
+        prev = p
+    return fabs(s) / 2
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef double ring_area_geodesic(double[::1] lon, double[::1] lat,
+                               Py_ssize_t start, Py_ssize_t end) nogil:
+    cdef:
+        double s = 0, dlon, t1, t2
+        Py_ssize_t j
+
+    if end - start < 3:
+        return 0
+
+    # Sum of the signed spherical excess between each edge and the equator
+    # on the authalic sphere (equal area with the ellipsoid).
+    t1 = authalic_half_tan(lat[start])
+    for j in range(start + 1, end):
+        t2 = authalic_half_tan(lat[j])
+        dlon = radians(lon[j] - lon[j - 1])
+        if dlon > PI:
+            dlon -= 2 * PI
+        elif dlon < -PI:
+            dlon += 2 * PI
+        s += 2 * atan2(tan(dlon / 2) * (t1 + t2), 1 + t1 * t2)
+        t1 = t2
+    return fabs(s) * R_AUTHALIC2
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef double ring_length_utm(double[::1] lon, double[::1] lat,
+                            Py_ssize_t start, Py_ssize_t end) nogil:
+    cdef:
+        LatLon p, prev
+        double s = 0
+        Py_ssize_t j
+
+    if end - start < 2:
+        return 0
+
+    prev = from_latlon(lat[start], lon[start])
+    for j in range(start + 1, end):
+        p = from_latlon(lat[j], lon[j])
+        s += sqrt((p.lat - prev.lat) * (p.lat - prev.lat) +
+                  (p.lon - prev.lon) * (p.lon - prev.lon))
+        prev = p
+    return s
+
+
+@cython.cdivision(True)
+cdef double vincenty(double lon1, double lat1,
+                     double lon2, double lat2) nogil:
+    """Distance in meters on the WGS84 ellipsoid (Vincenty's inverse
+    formula).  Falls back to a great circle on the authalic sphere for
+    nearly antipodal points, where the iteration does not converge."""
+    cdef:
+        double L, U1, U2, sinU1, cosU1, sinU2, cosU2, lam, lam_prev
+        double sin_lam, cos_lam, sin_sigma, cos_sigma, sigma, sin_alpha
+        double cos2_alpha, cos_2sigma_m, C, u2, A, B, d_sigma
+        int i
+
+    if lon1 == lon2 and lat1 == lat2:
+        return 0
+
+    L = radians(lon2 - lon1)
+    U1 = atan((1 - WGS84_F) * tan(radians(lat1)))
+    U2 = atan((1 - WGS84_F) * tan(radians(lat2)))
+    sinU1, cosU1 = sin(U1), cos(U1)
+    sinU2, cosU2 = sin(U2), cos(U2)
+
+    lam = L
+    for i in range(200):
+        sin_lam, cos_lam = sin(lam), cos(lam)
+        sin_sigma = sqrt((cosU2 * sin_lam) * (cosU2 * sin_lam) +
+                         (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) *
+                         (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam))
+        if sin_sigma == 0:
+            return 0
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = atan2(sin_sigma, cos_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha * sin_alpha
+        if cos2_alpha != 0:
+            cos_2sigma_m = cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha
+        else:
+            # Both points on the equator
+            cos_2sigma_m = 0
+        C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * WGS84_F * sin_alpha * (
+            sigma + C * sin_sigma * (
+                cos_2sigma_m + C * cos_sigma *
+                (-1 + 2 * cos_2sigma_m * cos_2sigma_m)))
+        if fabs(lam - lam_prev) < 1e-12:
+            break
+    else:
+        cos_sigma = (sin(radians(lat1)) * sin(radians(lat2)) +
+                     cos(radians(lat1)) * cos(radians(lat2)) * cos(L))
+        if cos_sigma > 1:
+            cos_sigma = 1
+        elif cos_sigma < -1:
+            cos_sigma = -1
+        return acos(cos_sigma) * sqrt(R_AUTHALIC2)
+
+    u2 = cos2_alpha * (WGS84_A * WGS84_A - WGS84_B * WGS84_B) / (WGS84_B * WGS84_B)
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    d_sigma = B * sin_sigma * (
+        cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m * cos_2sigma_m) -
+            B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma * sin_sigma) *
+            (-3 + 4 * cos_2sigma_m * cos_2sigma_m)))
+    return WGS84_B * A * (sigma - d_sigma)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double ring_length_geodesic(double[::1] lon, double[::1] lat,
+                                 Py_ssize_t start, Py_ssize_t end) nogil:
+    cdef:
+        double s = 0
+        Py_ssize_t j
+
+    for j in range(start + 1, end):
+        s += vincenty(lon[j - 1], lat[j - 1], lon[j], lat[j])
+    return s
+
+
+ctypedef double (*ring_kernel)(double[::1], double[::1],
+                               Py_ssize_t, Py_ssize_t) nogil
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef np.ndarray apply_ring_kernel(ring_kernel kernel, double[::1] lon,
+                                  double[::1] lat,
+                                  np.int64_t[::1] ring_offsets):
+    cdef:
+        Py_ssize_t i, n = max(ring_offsets.shape[0] - 1, 0)
+        np.ndarray[np.float64_t, ndim=1] res = np.zeros(n)
+        double[::1] out = res
+
+    if lon.shape[0] != lat.shape[0]:
+        raise ValueError("lon and lat must have the same length")
+    if n > 0 and ring_offsets[n] > lon.shape[0]:
+        raise ValueError("ring_offsets out of range")
+
+    with nogil:
+        for i in range(n):
+            out[i] = kernel(lon, lat, ring_offsets[i], ring_offsets[i + 1])
+    return res
+
+
+def ring_areas_utm(double[::1] lon, double[::1] lat,
+                   np.int64_t[::1] ring_offsets):
+    """Area in square meters of each ring, with every vertex projected
+    into its UTM zone (like ops.transform(to_utm, shp)).  Ring i is made
+    of the coordinates ring_offsets[i]:ring_offsets[i + 1] of the flat
+    WGS84 lon and lat arrays."""
+    return apply_ring_kernel(ring_area_utm, lon, lat, ring_offsets)
+
+
+def ring_areas_geodesic(double[::1] lon, double[::1] lat,
+                        np.int64_t[::1] ring_offsets):
+    """Area in square meters on the WGS84 ellipsoid of each ring, see
+    ring_areas_utm for the arguments."""
+    return apply_ring_kernel(ring_area_geodesic, lon, lat, ring_offsets)
+
+
+def ring_lengths_utm(double[::1] lon, double[::1] lat,
+                     np.int64_t[::1] ring_offsets):
+    """Length in meters of each ring (or line), with every vertex
+    projected into its UTM zone, see ring_areas_utm for the arguments."""
+    return apply_ring_kernel(ring_length_utm, lon, lat, ring_offsets)
+
+
+def ring_lengths_geodesic(double[::1] lon, double[::1] lat,
+                          np.int64_t[::1] ring_offsets):
+    """Length in meters on the WGS84 ellipsoid of each ring (or line),
+    see ring_areas_utm for the arguments."""
+    return apply_ring_kernel(ring_length_geodesic, lon, lat, ring_offsets)
@@ -58,6 +58,26 @@ def projection_from_wkt(wkt=osr.SRS_WKT_WGS84):
     return srs
 
 
+def get_proj4(obj):
+    """Returns the Proj4 string for the projection of obj (any object
+    with a proj attribute, e.g. VectorLayer or RasterDataset).  The string
+    is cached on obj and only recomputed when obj.proj is replaced."""
+    proj = obj.proj
+    cached = obj.__dict__.get("_proj4_cache", None)
+    if cached is None or cached[0] is not proj:
+        cached = (proj, proj.ExportToProj4().strip())
+        obj.__dict__["_proj4_cache"] = cached
+    return cached[1]
+
+
+def same_projection(obj1, obj2):
+    """Returns True if obj1 and obj2 (objects with a proj attribute)
+    are in the same projection."""
+    if obj1.proj is obj2.proj:
+        return True
+    return get_proj4(obj1) == get_proj4(obj2)
+
+
 # Create a function to project between spatial coords
 def get_projection(obj, layer_index=0):
     if isinstance(obj, ogr.DataSource):
@@ -30,14 +30,23 @@ under the BSD license.
 """
 
 
+import os
+import re
+import json
+import pickle
+import struct
+import hashlib
+import heapq
+import tempfile
+from math import ceil, sqrt
 from urlparse import urlparse
 
 import requests
 from pyspatial import fileutils
 
+import numpy as np
 from numpy import ndarray
 import pandas as pd
-from rtree import index
 from osgeo.osr import CoordinateTransformation, SpatialReference
 from osgeo import ogr
 from shapely.geometry.base import BaseGeometry
@@ -45,9 +54,15 @@ from shapely.geometry import shape
 from shapely import wkb
 from shapely.geometry import box
 from shapely import ops
+from shapely.prepared import prep
 import pyspatial.utils as ut
+from pyspatial.parallel import pool_map, get_shared, chunk_slices, n_workers
+from pyspatial import spatiallib as slib
 from pyspatial.spatiallib import to_utm
 from pyspatial.io import get_ogr_datasource, write_shapefile
+from pyspatial.geoarray import GeometryArray, offsets_from_counts
+from pyspatial.sindex import SpatialIndex, read_sindex
+from pyspatial.sindex import hilbert_codes, zorder_codes
 
 
 def to_shapely(feat, proj=None):
@@ -194,6 +209,481 @@ def set_theoretic_methods(function, shp1, shp2):
     return fn(other)
 
 
+def _transform_wkb(wkbs, ct):
+    """Transform a list of WKB geometries with the
+    osr.CoordinateTransformation ct.  Returns a list of WKB."""
+    res = []
+    for w in wkbs:
+        geom = ogr.CreateGeometryFromWkb(w)
+        geom.Transform(ct)
+        res.append(geom.ExportToWkb(ogr.wkbNDR))
+    return res
+
+
+def _transform_chunk(args):
+    """Run by pool_map: _transform_wkb on a slice of the WKB shared as
+    "wkb".  The projections are passed as WKT, since osr objects cannot
+    be sent to other processes."""
+    start, stop, source_wkt, target_wkt = args
+    source = SpatialReference()
+    source.ImportFromWkt(source_wkt)
+    target = SpatialReference()
+    target.ImportFromWkt(target_wkt)
+    ct = CoordinateTransformation(source, target)
+    return _transform_wkb(get_shared("wkb")[start:stop], ct)
+
+
+# A geometry with at least this many candidates in a join is prepared
+# before the predicate is tested.
+PREPARE_MIN_CANDIDATES = 4
+
+SJOIN_PREDICATES = ["intersects", "within", "contains"]
+
+# g.Predicate(shp) for a shape g in a layer, as the equivalent predicate of
+# a prepared shp tested against g.  Prepared geometries do not speed up
+# g.Contains(shp), and shapely < 1.6 only prepares intersects and contains.
+PREPARED_PREDICATES = {"Intersect": "intersects", "Within": "contains",
+                       "Crosses": "crosses", "Touches": "touches"}
+
+# VectorLayer predicates convert their candidates from ogr to shapely to
+# test them against the prepared shape only if there are at least this
+# many of them.  With fewer, the WKB round trip of every candidate costs
+# more than calling the ogr predicate directly.
+LAYER_PREPARE_MIN_CANDIDATES = 64
+
+
+def _test_pairs(args):
+    """Test a shapely predicate on a chunk of candidate pairs.  Run by
+    pool_map with the WKB of the geometries shared as "a" and "b".
+
+    Parameters
+    ----------
+    args: tuple
+        (predicate, a_pos, b_pos) where a_pos and b_pos are the positions
+        of the pairs in "a" and "b", sorted by a_pos.
+
+    Returns
+    -------
+    numpy.ndarray of bool, True where a.predicate(b)
+    """
+    predicate, a_pos, b_pos = args
+    a_wkb = get_shared("a")
+    b_wkb = get_shared("b")
+    res = np.zeros(len(a_pos), dtype=bool)
+    if len(a_pos) == 0:
+        return res
+
+    # Each a geometry is parsed (and prepared) once for all its candidates
+    breaks = np.flatnonzero(np.diff(a_pos)) + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(a_pos)]])
+    parsed = {}
+    for start, stop in zip(starts, stops):
+        a = wkb.loads(a_wkb[a_pos[start]])
+        if stop - start >= PREPARE_MIN_CANDIDATES:
+            a = prep(a)
+        test = getattr(a, predicate)
+        for j in xrange(start, stop):
+            k = b_pos[j]
+            b = parsed.get(k, None)
+            if b is None:
+                b = parsed[k] = wkb.loads(b_wkb[k])
+            res[j] = test(b)
+    return res
+
+
+OVERLAY_HOWS = ["intersection", "difference", "symmetric_difference",
+                "union", "identity"]
+
+
+def _overlay_chunk(args):
+    """Compute the overlay pieces of a chunk of candidate pairs.  Run by
+    pool_map with the WKB of the geometries shared as "a" and "b".
+
+    Parameters
+    ----------
+    args: tuple
+        (how, a_pos, b_pos) where how is "intersection" or "difference"
+        and a_pos and b_pos are the positions of the pairs in "a" and "b",
+        sorted by a_pos.  All the pairs of a geometry must be in the same
+        chunk.  A b position of -1 marks a geometry without candidates.
+
+    Returns
+    -------
+    Tuple of (a positions, b positions, list of WKB) of the non-empty
+    pieces.  For "intersection", a.intersection(b) for each pair; pieces
+    that only touch (i.e. without area when both a and b have an area)
+    are dropped.  For "difference", a minus the union of all its b, with
+    the b position -1.
+    """
+    how, a_pos, b_pos = args
+    a_wkb = get_shared("a")
+    b_wkb = get_shared("b")
+    res_a, res_b, res = [], [], []
+
+    breaks = np.flatnonzero(np.diff(a_pos)) + 1
+    starts = np.concatenate([[0], breaks]).astype(np.int64)
+    stops = np.concatenate([breaks, [len(a_pos)]]).astype(np.int64)
+    parsed = {}
+    for start, stop in zip(starts, stops):
+        if start == stop:
+            continue
+        i = a_pos[start]
+        a = wkb.loads(a_wkb[i])
+        test = a.intersects
+        if stop - start >= PREPARE_MIN_CANDIDATES:
+            test = prep(a).intersects
+
+        hits = []
+        for j in xrange(start, stop):
+            k = b_pos[j]
+            if k < 0:
+                continue
+            b = parsed.get(k, None)
+            if b is None:
+                b = parsed[k] = wkb.loads(b_wkb[k])
+            if test(b):
+                hits.append((k, b))
+
+        if how == "intersection":
+            for k, b in hits:
+                piece = a.intersection(b)
+                if piece.is_empty or (piece.area == 0 and a.area > 0 and
+                                      b.area > 0):
+                    continue
+                res_a.append(i)
+                res_b.append(k)
+                res.append(piece.wkb)
+        else:
+            piece = a
+            if len(hits) > 0:
+                piece = a.difference(ops.unary_union([b for _, b in hits]))
+            if not piece.is_empty:
+                res_a.append(i)
+                res_b.append(-1)
+                res.append(piece.wkb)
+
+    return (np.array(res_a, dtype=np.int64), np.array(res_b, dtype=np.int64),
+            res)
+
+
+# Layout of the Parquet files written by VectorLayer.to_parquet
+PARQUET_METADATA_KEY = b"pyspatial"
+PARQUET_BBOX_COLUMNS = ["xmin", "ymin", "xmax", "ymax"]
+PARQUET_COLUMNS = ["__id__", "geometry"] + PARQUET_BBOX_COLUMNS
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# Files written by VectorLayer.export_shared are a header, the WKB offsets,
+# the concatenated WKB (padded to 8 bytes) and a pickle of the projection
+# (as WKT), index and name.
+SHARED_MAGIC = b"PYSVL001"
+# magic, number of shapes, bytes of WKB, bytes of pickle
+_SHARED_HEADER = struct.Struct("<8sqqq")
+
+
+def _wkb_buffer(geoms):
+    """The WKB of geoms concatenated, and the (n + 1) offsets of each
+    geometry in it."""
+    wkbs = [bytes(g.ExportToWkb(ogr.wkbNDR)) for g in geoms]
+    counts = np.array([len(w) for w in wkbs], dtype=np.int64)
+    return b"".join(wkbs), offsets_from_counts(counts)
+
+
+def _from_wkb_buffer(buf, offsets, proj_wkt, index, name=None, sindex=None):
+    """Create a VectorLayer from the output of _wkb_buffer.  Used to
+    unpickle layers."""
+    if not isinstance(buf, np.ndarray):
+        buf = np.frombuffer(buf, dtype=np.uint8)
+    proj = SpatialReference()
+    proj.ImportFromWkt(proj_wkt)
+    geoms = [ogr.CreateGeometryFromWkb(buf[offsets[i]:offsets[i + 1]]
+                                       .tobytes())
+             for i in xrange(len(offsets) - 1)]
+    [g.AssignSpatialReference(proj) for g in geoms]
+    vl = VectorLayer(geoms, proj=proj, index=index)
+    vl.name = name
+    vl._sindex = sindex
+    return vl
+
+
+# Resolution of the grid used by VectorLayer.sort and partition for the
+# space filling curves, in bits per dimension.
+CURVE_BITS = 16
+
+# Columns of VectorLayer.properties
+PROPERTIES = ["xmin", "ymin", "xmax", "ymax", "centroid_x", "centroid_y",
+              "area", "size_bytes"]
+
+# Number of features converted at a time by VectorLayer.to_json
+JSON_CHUNK_SIZE = 1000
+
+# Earth radius in meters used by spatiallib.haversine
+HAVERSINE_RADIUS = 6367444.7
+
+
+def _arc_boxes(boxes):
+    """Extend lon/lat boxes in latitude to contain the great circle arcs
+    between any two points of each box, which bulge toward the poles.
+
+    Parameters
+    ----------
+    boxes: numpy.ndarray
+        (n, 4) array of xmin, ymin, xmax, ymax
+
+    Returns
+    -------
+    numpy.ndarray of the extended boxes
+    """
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    # An arc spanning half_lon on each side of its middle reaches at most
+    # atan(tan(lat) / cos(half_lon)), and can cross the pole beyond 90
+    half_lon = np.radians(boxes[:, 2] - boxes[:, 0]) / 2
+    c = np.maximum(np.cos(np.minimum(half_lon, np.pi / 2)), 0)
+    for col, sign in [(3, 1), (1, -1)]:
+        lat = sign * boxes[:, col]
+        apex = np.degrees(np.arctan2(np.tan(np.radians(lat)), c))
+        boxes[:, col] = sign * np.where(lat > 0, apex, lat)
+    return boxes
+
+
+def _box_haversine(boxes, bounds):
+    """Lower bound of the haversine distance in meters between any point
+    of each lon/lat box in boxes and any point of the box bounds.  The
+    boxes are first extended by _arc_boxes, so the bound also holds for
+    the edges of the shapes in them."""
+    boxes = _arc_boxes(boxes)
+    bounds = _arc_boxes(bounds)[0]
+    gap_lon = np.maximum(np.maximum(boxes[:, 0] - bounds[2],
+                                    bounds[0] - boxes[:, 2]), 0)
+    gap_lat = np.maximum(np.maximum(boxes[:, 1] - bounds[3],
+                                    bounds[1] - boxes[:, 3]), 0)
+    # Points may be closer the other way around the antimeridian
+    span = (np.maximum(boxes[:, 2], bounds[2]) -
+            np.minimum(boxes[:, 0], bounds[0]))
+    gap_lon = np.maximum(np.minimum(gap_lon, 360 - span), 0)
+    # Every point is at most this far from the equator, which bounds the
+    # length of a degree of longitude from below.
+    max_lat = np.maximum(np.abs(boxes[:, [1, 3]]).max(axis=1),
+                         max(abs(bounds[1]), abs(bounds[3])))
+    a = (np.sin(np.radians(gap_lat) / 2) ** 2 +
+         np.cos(np.radians(max_lat)) ** 2 *
+         np.sin(np.radians(gap_lon) / 2) ** 2)
+    # Shrunk slightly so rounding cannot make it exceed the distance
+    d = 2 * HAVERSINE_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+    return d * (1 - 1e-9)
+
+
+def _planar_distance(a, b):
+    return a.distance(b)
+
+
+def _coord_parts(g):
+    """Coordinate arrays of the points, lines and rings of the shapely
+    geometry g"""
+    if hasattr(g, "geoms"):
+        return [c for part in g.geoms for c in _coord_parts(part)]
+    if g.geom_type == "Polygon":
+        return [np.asarray(r.coords)[:, :2]
+                for r in [g.exterior] + list(g.interiors)]
+    return [np.asarray(g.coords)[:, :2]]
+
+
+def _unit_vectors(lonlat):
+    """Points on the unit sphere of an (n, 2) array of lon, lat"""
+    lon = np.radians(lonlat[:, 0])
+    lat = np.radians(lonlat[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _vertices_and_edges(g):
+    """The vertices of the lon/lat shapely geometry g, and the start and
+    end of its edges, as points on the unit sphere"""
+    parts = [_unit_vectors(c) for c in _coord_parts(g) if len(c) > 0]
+    lines = [c for c in parts if len(c) > 1]
+    if len(lines) == 0:
+        return np.concatenate(parts), np.empty((0, 3)), np.empty((0, 3))
+    return (np.concatenate(parts), np.concatenate([c[:-1] for c in lines]),
+            np.concatenate([c[1:] for c in lines]))
+
+
+def _angles(u, v):
+    """Angles between the points on the unit sphere u and v"""
+    return np.arctan2(np.sqrt((np.cross(u, v) ** 2).sum(axis=-1)),
+                      (u * v).sum(axis=-1))
+
+
+def _arc_angles(points, starts, ends):
+    """Angle between each point and the nearest point of each great circle
+    arc from starts to ends, as a (len(points), len(starts)) array."""
+    p = points[:, None, :]
+    res = np.minimum(_angles(p, starts[None]), _angles(p, ends[None]))
+    normals = np.cross(starts, ends)
+    norms = np.sqrt((normals ** 2).sum(axis=1))
+    normals /= np.where(norms > 0, norms, 1)[:, None]
+    # The projection of a point on the great circle of an arc is its
+    # nearest point of the arc if it lies between the ends
+    dots = points.dot(normals.T)
+    proj = p - dots[:, :, None] * normals[None]
+    inside = ((np.cross(starts[None], proj) * normals).sum(axis=-1) >= 0) & \
+        ((np.cross(proj, ends[None]) * normals).sum(axis=-1) >= 0) & \
+        (norms > 0)
+    perp = np.arcsin(np.minimum(np.abs(dots), 1))
+    return np.where(inside, np.minimum(res, perp), res)
+
+
+# _geodesic_distance compares every vertex of a shape with every edge and
+# vertex of the other if there are at most GEODESIC_MAX_PAIRS such pairs.
+GEODESIC_MAX_PAIRS = 250000
+
+
+def _geodesic_distance(a, b):
+    """Distance in meters on the sphere between the lon/lat shapely
+    geometries a and b, with their edges taken as great circle arcs.  The
+    minimum is reached at a vertex of one of the shapes, so it is found
+    by comparing the vertices of each shape with the edges and vertices
+    of the other.  If there are more than GEODESIC_MAX_PAIRS of them, it
+    is approximated by the haversine distance between the nearest points
+    in lon/lat.  Whether the shapes intersect (distance 0) is also decided
+    in lon/lat."""
+    if a.distance(b) == 0:
+        return 0.
+    a_pts, a_starts, a_ends = _vertices_and_edges(a)
+    b_pts, b_starts, b_ends = _vertices_and_edges(b)
+    pairs = (len(a_pts) * (len(b_pts) + len(b_starts)) +
+             len(b_pts) * len(a_starts))
+    if pairs > GEODESIC_MAX_PAIRS:
+        p, q = ops.nearest_points(a, b)
+        return slib.haversine_matrix([p.coords[0][:2]],
+                                     [q.coords[0][:2]])[0, 0]
+
+    angle = _angles(a_pts[:, None], b_pts[None]).min()
+    if len(b_starts) > 0:
+        angle = min(angle, _arc_angles(a_pts, b_starts, b_ends).min())
+    if len(a_starts) > 0:
+        angle = min(angle, _arc_angles(b_pts, a_starts, a_ends).min())
+    return HAVERSINE_RADIUS * angle
+
+
+def _knn_chunk(args):
+    """Find the k nearest neighbors of a chunk of query geometries.  Run by
+    pool_map with the spatial index shared as "sindex", and the WKB of
+    the indexed and the query geometries as "wkb" and "queries".
+
+    Parameters
+    ----------
+    args: tuple
+        (start, stop, k, max_distance, geodesic) for the queries
+        start:stop.
+
+    Returns
+    -------
+    Tuple of numpy.ndarray: query positions, positions of the neighbors
+    and distances, ordered by query and distance.
+    """
+    start, stop, k, max_distance, geodesic = args
+    sindex = get_shared("sindex")
+    wkbs = get_shared("wkb")
+    queries = get_shared("queries")
+    if geodesic:
+        distance, box_distance = _geodesic_distance, _box_haversine
+    else:
+        distance, box_distance = _planar_distance, None
+    if max_distance is None:
+        max_distance = np.inf
+
+    parsed = {}
+    q_pos, pos, dists = [], [], []
+    for j in xrange(start, stop):
+        q = wkb.loads(queries[j])
+        if q.is_empty:
+            continue
+
+        # Max heap of the k nearest so far, as (-distance, -position).  The
+        # envelope distance is a lower bound of the distance, so the search
+        # stops at the first envelope farther than the k-th neighbor.
+        best = []
+        for lower, i in sindex.iter_nearest(q.bounds, box_distance):
+            if lower > max_distance or (len(best) == k and
+                                        lower > -best[0][0]):
+                break
+            g = parsed.get(i, None)
+            if g is None:
+                g = parsed[i] = wkb.loads(wkbs[i])
+            d = distance(q, g)
+            if d > max_distance:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, (-d, -i))
+            elif (-d, -i) > best[0]:
+                heapq.heapreplace(best, (-d, -i))
+
+        best.sort(reverse=True)
+        for d, i in best:
+            q_pos.append(j)
+            pos.append(-i)
+            dists.append(-d)
+
+    return (np.array(q_pos, dtype=np.int64), np.array(pos, dtype=np.int64),
+            np.array(dists, dtype=np.float64))
+
+
+# In a parallel cascaded union, runs of UNION_CHUNK_SIZE geometries are
+# unioned first, then UNION_FAN_IN of the partial unions at a time.
+UNION_CHUNK_SIZE = 256
+UNION_FAN_IN = 8
+
+
+def _union_chunk(pos):
+    """Union of the geometries at the positions pos in the WKB shared as
+    "wkb".  Run by pool_map, returns WKB."""
+    wkbs = get_shared("wkb")
+    return ops.unary_union([wkb.loads(wkbs[i]) for i in pos]).wkb
+
+
+def _cascaded_union(wkbs, groups, n_jobs=1):
+    """Union the geometries of each group.  With more than one process, each
+    group is split into runs that are unioned independently, and the
+    partial unions are merged hierarchically, a level at a time.
+
+    Parameters
+    ----------
+    wkbs: list of str
+        The WKB of the geometries
+
+    groups: list of numpy.ndarray
+        Positions in wkbs of the geometries of each group, ordered so that
+        consecutive geometries are close to each other (e.g. along a
+        Hilbert curve) and the partial unions stay small.
+
+    n_jobs: int (default 1)
+
+    Returns
+    -------
+    list of WKB, the union of each group
+    """
+    size = UNION_CHUNK_SIZE
+    if n_workers(n_jobs) == 1:
+        size = max([len(pos) for pos in groups] + [1])
+
+    while True:
+        runs = [pos[start:start + size] for pos in groups
+                for start in xrange(0, len(pos), size)]
+        counts = [-(-len(pos) // size) for pos in groups]
+        # A single geometry is already its own union
+        todo = [r for r in runs if len(r) > 1]
+        done = iter(pool_map(_union_chunk, todo, n_jobs=n_jobs,
+                             shared={"wkb": wkbs}))
+        wkbs = [next(done) if len(r) > 1 else wkbs[r[0]] for r in runs]
+        if all([c == 1 for c in counts]):
+            return wkbs
+
+        offsets = offsets_from_counts(counts)
+        groups = [np.arange(start, stop) for start, stop
+                  in zip(offsets[:-1], offsets[1:])]
+        size = UNION_FAN_IN
+
+
 class VectorLayer(pd.Series):
     """
     Parameters
@@ -209,7 +699,7 @@ class VectorLayer(pd.Series):
     Attributes
     ----------
 
-    _sindex: rtree.index.Index
+    _sindex: pyspatial.sindex.SpatialIndex
         The spatial index. Initially None, but can be built with build_sindex()
 
 
@@ -248,18 +738,42 @@ class VectorLayer(pd.Series):
     def _constructor(self):
         return VectorLayer
 
+    @property
+    def proj4(self):
+        """The Proj4 string of the layer's projection.  Computed once and
+        cached until proj is replaced."""
+        return ut.get_proj4(self)
+
     def _wrapped_pandas_method(self, mtd, *args, **kwargs):
         """Wrap a generic pandas method to ensure it returns a VectorLayer"""
         val = getattr(super(VectorLayer, self), mtd)(*args, **kwargs)
         if type(val) == pd.Series:
             val.__class__ = VectorLayer
             val.proj = self.proj
-            val._sindex = None
+        if isinstance(val, VectorLayer) and val is not self:
+            val._sindex = self._derived_sindex(val.index)
         return val
 
+    def _derived_sindex(self, index):
+        """A view of the spatial index for a layer made of the (unchanged)
+        shapes of this layer with ids in index.  None if this layer has no
+        index yet, or if ids are not unique."""
+        if self._sindex is None:
+            return None
+        if not (self.index.is_unique and index.is_unique):
+            return None
+        pos = self.index.get_indexer(index)
+        if (pos < 0).any():
+            return None
+        return self._sindex.subset(pos)
+
     def __getitem__(self, key):
         return self._wrapped_pandas_method('__getitem__', key)
 
+    def __setitem__(self, key, value):
+        super(VectorLayer, self).__setitem__(key, value)
+        self._sindex = None
+
     def sort_index(self, *args, **kwargs):
         return self._wrapped_pandas_method('sort_index', *args, **kwargs)
 
@@ -274,7 +788,7 @@ class VectorLayer(pd.Series):
 
     def append(self, *args, **kwargs):
         other = args[0]
-        if self.proj.ExportToProj4() != other.proj.ExportToProj4():
+        if not ut.same_projection(self, other):
             args = (other.transform(self.proj),)
         return self._wrapped_pandas_method('append', *args, **kwargs)
 
@@ -291,24 +805,105 @@ class VectorLayer(pd.Series):
         return self.index
 
     # TODO: add inplace support
-    def filter_by_id(self, ids):
+    def filter_by_id(self, ids, copy=True):
         """Return a vector layer with only those shapes with
         id in ids.
 
         Parameters
         ----------
         ids: iterable
-            The ids to filter on"""
+            The ids to filter on
+
+        copy: bool (default=True)
+            Return copies of the geometries, which can be modified without
+            changing this layer.  With copy=False the geometries and the
+            projection are shared with this layer, which is much faster
+            for large selections; use clone() on the result before
+            modifying its geometries in place.
+
+        Raises
+        ------
+        KeyError if an id is not in the layer"""
 
         assert hasattr(ids, "__iter__"), "ids must be iterable"
         if not isinstance(ids, pd.Index):
             ids = self._make_ids(ids)
 
-        geoms = [self[i].Clone() for i in ids]
+        pos = self.index.get_indexer_for(ids)
+        if (pos < 0).any():
+            raise KeyError("ids not in layer: %s" % list(ids[pos < 0]))
+        vl = self.take(pos)
+        if copy:
+            vl = vl.clone()
+        return vl
+
+    def clone(self):
+        """Return a copy of the layer with copies of the geometries and of
+        the projection, which can be modified without changing this
+        layer."""
         proj = SpatialReference()
         proj.ImportFromWkt(self.proj.ExportToWkt())
+        geoms = [g.Clone() for g in self]
         [g.AssignSpatialReference(proj) for g in geoms]
-        return VectorLayer(geoms, index=ids)
+        vl = VectorLayer(geoms, index=self.index, proj=proj)
+        vl.name = self.name
+        vl._sindex = self._sindex
+        return vl
+
+    def __reduce__(self):
+        """Pickle the geometries as one WKB buffer and the projection as
+        WKT, since ogr and osr objects cannot be pickled."""
+        buf, offsets = _wkb_buffer(self.values)
+        sindex = self._sindex
+        if sindex is not None:
+            sindex = sindex.compact()
+        return (_from_wkb_buffer, (buf, offsets, self.proj.ExportToWkt(),
+                                   self.index, self.name, sindex))
+
+    def export_shared(self, path=None):
+        """Write the layer to a file that other processes can attach to
+        with attach_shared, e.g. to send a large reference layer to
+        workers by path instead of pickling it for every task.  Attached
+        layers memory map the spatial index (if built), so it is shared by
+        all the processes instead of copied.  attach_shared(path) reads the
+        geometries into ogr.Geometry objects, so every process holds its
+        own copy of them; attach_shared(path, lazy=True) leaves them in the
+        shared file and parses only the ones that are accessed.
+
+        Parameters
+        ----------
+        path: str (default=None)
+            Where to write the layer.  If None, a new file in /dev/shm
+            (or the temporary directory if there is no /dev/shm).
+
+        Returns
+        -------
+        The path of the file.  Delete it with remove_shared once the
+        workers are done.
+        """
+        if path is None:
+            shm = "/dev/shm"
+            fd, path = tempfile.mkstemp(
+                suffix=".pysvl", dir=shm if os.path.isdir(shm) else None)
+            os.close(fd)
+
+        buf, offsets = _wkb_buffer(self.values)
+        meta = pickle.dumps((self.proj.ExportToWkt(), self.index, self.name),
+                            pickle.HIGHEST_PROTOCOL)
+        with open(path, "wb") as outf:
+            outf.write(_SHARED_HEADER.pack(SHARED_MAGIC, len(self), len(buf),
+                                           len(meta)))
+            outf.write(offsets.astype("<i8").tobytes())
+            outf.write(buf)
+            outf.write(b"\0" * (-len(buf) % 8))
+            outf.write(meta)
+
+        sindex_path = path + ".sidx"
+        if self._sindex is not None:
+            self._sindex.compact().save(sindex_path)
+        elif os.path.exists(sindex_path):
+            os.remove(sindex_path)
+        return path
 
     def _get_index_intersection(self, shp):
         if self._sindex is None:
@@ -319,7 +914,39 @@ class VectorLayer(pd.Series):
         if isinstance(shp, list):
             raise ValueError("Collections of shapes are not supported!")
 
-        return shp, self._sindex.intersection(bounds, objects="raw")
+        return shp, self.index[self._sindex.intersection(bounds)]
+
+    def _predicate_ids(self, shp, predicate):
+        """Ids of the shapes g in the layer for which g.predicate(shp),
+        where predicate is the name of an ogr.Geometry predicate.  When
+        there are at least LAYER_PREPARE_MIN_CANDIDATES candidates, shp is
+        prepared once and tested against each of them, instead of OGR
+        rebuilding its edge index per call."""
+        shp = to_geometry(shp, proj=self.proj, copy=True)
+        if self._sindex is None:
+            self.build_sindex()
+        xmin, xmax, ymin, ymax = shp.GetEnvelope()
+        pos = self._sindex.intersection((xmin, ymin, xmax, ymax))
+        geoms = self.values
+
+        if predicate == "Contains":
+            # g can only contain shp if its envelope contains shp's
+            def envelope_contains(geom):
+                gxmin, gxmax, gymin, gymax = geom.GetEnvelope()
+                return (gxmin <= xmin and gxmax >= xmax and
+                        gymin <= ymin and gymax >= ymax)
+
+            pos = [i for i in pos if envelope_contains(geoms[i])]
+
+        op = PREPARED_PREDICATES.get(predicate, None)
+        if op is not None and len(pos) >= LAYER_PREPARE_MIN_CANDIDATES:
+            test = getattr(prep(to_shapely(shp)), op, None)
+            if test is not None:
+                pos = [i for i in pos if test(to_shapely(geoms[i]))]
+                return self.index[pos]
+
+        pos = [i for i in pos if getattr(geoms[i], predicate)(shp)]
+        return self.index[pos]
 
     def intersects(self, shp, index_only=False):
         """Return a vector layer with only those shapes in the
@@ -339,16 +966,12 @@ class VectorLayer(pd.Series):
 
         """
 
-        shp = to_geometry(shp, proj=self.proj, copy=True)
-        _shp, ids = self._get_index_intersection(shp)
-        ids = [i for i in ids if self[i].Intersect(shp)]
-
-        ids = self._make_ids(ids)
+        ids = self._predicate_ids(shp, "Intersect")
 
         if index_only:
             return ids
         else:
-            return self.filter_by_id(ids)
+            return self.filter_by_id(ids, copy=False)
 
     def iintersects(self, shp):
         """Return an index with only those shapes in the
@@ -383,15 +1006,12 @@ class VectorLayer(pd.Series):
         http://toblerity.org/shapely/manual.html#object.contains
 
         """
-        shp = to_geometry(shp, proj=self.proj, copy=True)
-        _shp, ids = self._get_index_intersection(shp)
-        ids = [i for i in ids if self[i].Contains(shp)]
-        ids = self._make_ids(ids)
+        ids = self._predicate_ids(shp, "Contains")
 
         if index_only:
             return ids
         else:
-            return self.filter_by_id(ids)
+            return self.filter_by_id(ids, copy=False)
 
     def icontains(self, shp):
         """Return an index with only those shapes in the
@@ -425,15 +1045,12 @@ class VectorLayer(pd.Series):
         --------
         http://toblerity.org/shapely/manual.html#object.within"""
 
-        shp = to_geometry(shp, proj=self.proj, copy=True)
-        _shp, ids = self._get_index_intersection(shp)
-        ids = [i for i in ids if self[i].Within(shp)]
-        ids = self._make_ids(ids)
+        ids = self._predicate_ids(shp, "Within")
 
         if index_only:
             return ids
         else:
-            return self.filter_by_id(ids)
+            return self.filter_by_id(ids, copy=False)
 
     def iwithin(self, shp):
         """Return an index with only those shapes in the
@@ -466,15 +1083,12 @@ class VectorLayer(pd.Series):
         --------
         http://toblerity.org/shapely/manual.html#object.crosses"""
 
-        shp = to_geometry(shp, proj=self.proj, copy=True)
-        _shp, ids = self._get_index_intersection(shp)
-        ids = [i for i in ids if self[i].Crosses(shp)]
-        ids = self._make_ids(ids)
+        ids = self._predicate_ids(shp, "Crosses")
 
         if index_only:
             return ids
         else:
-            return self.filter_by_id(ids)
+            return self.filter_by_id(ids, copy=False)
 
     def icrosses(self, shp):
         """Return an index with only those shapes in the
@@ -508,15 +1122,12 @@ class VectorLayer(pd.Series):
         http://toblerity.org/shapely/manual.html#object.touches
         """
 
-        shp = to_geometry(shp, proj=self.proj, copy=True)
-        _shp, ids = self._get_index_intersection(shp)
-        ids = [i for i in ids if self[i].Touches(shp)]
-        ids = self._make_ids(ids)
+        ids = self._predicate_ids(shp, "Touches")
 
         if index_only:
             return ids
         else:
-            return self.filter_by_id(ids)
+            return self.filter_by_id(ids, copy=False)
 
     def itouches(self, shp):
         """Return an index with only those shapes in the
@@ -559,7 +1170,7 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
     def iequals(self, shp):
         """Return an index with only those shapes in the
@@ -599,7 +1210,7 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
     def idisjoint(self, shp):
         """Return an index with only those shapes in the
@@ -703,8 +1314,69 @@ class VectorLayer(pd.Series):
         """
         return self._set_theoretic_methods("Union", shp)
 
-    def unary_union(self):
-        return ops.unary_union(self.to_shapely())
+    def unary_union(self, n_jobs=1):
+        """Union of all the shapes in the layer.  The shapes are sorted
+        along a Hilbert curve, so that with n_jobs > 1 each process unions
+        runs of nearby shapes before the partial unions are merged.
+
+        Parameters
+        ----------
+        n_jobs: int (default 1)
+            Number of processes.  None or -1 uses one process per cpu.
+
+        Returns
+        -------
+        shapely.geometry
+        """
+        if len(self) == 0:
+            return ops.unary_union([])
+        order = np.argsort(self._curve_codes("hilbert"), kind="mergesort")
+        wkbs = [bytes(g.ExportToWkb()) for g in self.values]
+        return wkb.loads(_cascaded_union(wkbs, [order], n_jobs=n_jobs)[0])
+
+    def dissolve(self, by, n_jobs=1):
+        """Merge the shapes that have the same value of by, e.g. fields into
+        farms.  Each group is unioned independently, see unary_union.
+
+        Parameters
+        ----------
+        by: pandas.Series or array-like
+            The group of each shape, either a Series indexed by the ids of
+            the layer or one value per shape.  Shapes without a group (NaN)
+            are dropped.
+
+        n_jobs: int (default 1)
+            Number of processes.  None or -1 uses one process per cpu.
+
+        Returns
+        -------
+        VectorLayer indexed by the values of by
+        """
+        if isinstance(by, pd.Series):
+            name = by.name
+            by = by.reindex(self.index).values
+        else:
+            name = None
+            by = np.asarray(by)
+            if len(by) != len(self):
+                raise ValueError("by must have one value per shape")
+
+        labels, uniques = pd.factorize(by, sort=True)
+        # Positions of the shapes along the curve, grouped by label
+        pos = np.argsort(self._curve_codes("hilbert"), kind="mergesort")
+        pos = pos[labels[pos] >= 0]
+        pos = pos[np.argsort(labels[pos], kind="mergesort")]
+        offsets = offsets_from_counts(np.bincount(labels[pos],
+                                                  minlength=len(uniques)))
+        groups = [pos[start:stop] for start, stop
+                  in zip(offsets[:-1], offsets[1:])]
+
+        wkbs = [bytes(g.ExportToWkb()) for g in self.values]
+        geoms = [ogr.CreateGeometryFromWkb(w)
+                 for w in _cascaded_union(wkbs, groups, n_jobs=n_jobs)]
+        [g.AssignSpatialReference(self.proj) for g in geoms]
+        return VectorLayer(geoms, proj=self.proj,
+                           index=pd.Index(uniques, name=name))
 
     def is_valid(self, index_only=False):
         """
@@ -714,7 +1386,7 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
     def is_invalid(self, index_only=False):
         """
@@ -724,7 +1396,7 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
     def is_empty(self, index_only=False):
         """
@@ -734,7 +1406,7 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
     def is_ring(self, index_only=False):
         """
@@ -744,12 +1416,35 @@ class VectorLayer(pd.Series):
         if index_only:
             return ids
 
-        return self.filter_by_id(ids)
+        return self.filter_by_id(ids, copy=False)
 
-    def transform(self, target_proj):
-        ct = CoordinateTransformation(self.proj, target_proj)
-        geoms = [g.Clone() for g in self]
-        [g.Transform(ct) for g in geoms]
+    def transform(self, target_proj, n_jobs=1):
+        """Return the layer reprojected into target_proj.
+
+        Parameters
+        ----------
+        target_proj: osr.SpatialReference
+
+        n_jobs: int (default 1)
+            Number of processes to transform with, for very large
+            layers.  None or -1 uses one process per cpu.
+        """
+        if n_workers(n_jobs) == 1:
+            ct = CoordinateTransformation(self.proj, target_proj)
+            geoms = [g.Clone() for g in self.values]
+            [g.Transform(ct) for g in geoms]
+            return VectorLayer(geoms, proj=target_proj, index=self.index)
+
+        wkbs = [g.ExportToWkb(ogr.wkbNDR) for g in self.values]
+        source_wkt = self.proj.ExportToWkt()
+        target_wkt = target_proj.ExportToWkt()
+        args = [(start, stop, source_wkt, target_wkt) for start, stop
+                in chunk_slices(len(wkbs), 4 * n_workers(n_jobs))]
+        chunks = pool_map(_transform_chunk, args, n_jobs=n_jobs,
+                          shared={"wkb": wkbs})
+        geoms = [ogr.CreateGeometryFromWkb(w) for chunk in chunks
+                 for w in chunk]
+        [g.AssignSpatialReference(target_proj) for g in geoms]
         return VectorLayer(geoms, proj=target_proj, index=self.index)
 
     def to_wgs84(self):
@@ -766,6 +1461,20 @@ class VectorLayer(pd.Series):
             else:
                 return to_shapely(self[ids])
 
+    def to_geometry_array(self):
+        """Return the geometries in columnar form. Coordinates are stored in
+        contiguous numpy arrays, which is much smaller than a list of
+        ogr.Geometry and allows bulk operations on the numpy arrays.
+
+        Returns
+        -------
+        GeometryArray
+
+        See Also
+        --------
+        from_geometry_array"""
+        return GeometryArray.from_geometries(self)
+
     def to_geometry(self, ids=None, proj=None):
         if ids is None:
             s = [to_geometry(f, proj=proj, copy=True) for f in self.features]
@@ -791,6 +1500,24 @@ class VectorLayer(pd.Series):
         else:
             return VectorLayer(data, index=self.index, proj=self.proj)
 
+    def _ring_values(self, kernel):
+        """Apply one of the ring kernels of spatiallib to the WGS84
+        coordinates of the layer.
+
+        Returns
+        -------
+        Tuple of (GeometryArray, numpy.ndarray of the value of each ring)
+        """
+        if self.proj4 != ut.PROJ_WGS84:
+            vl = self.transform(ut.projection_from_string())
+        else:
+            vl = self
+
+        arr = vl.to_geometry_array()
+        lon = np.ascontiguousarray(arr.coords[:, 0])
+        lat = np.ascontiguousarray(arr.coords[:, 1])
+        return arr, kernel(lon, lat, arr.ring_offsets)
+
     def areas(self, proj=None):
         """Compute the areas for each of the shapes in the vector
         layer.
@@ -798,8 +1525,9 @@ class VectorLayer(pd.Series):
         Parameters
         ----------
         proj: string or osr.SpatialReference (default=None)
-            valid strings are 'albers' or 'utm'. If None, no
-            transformation of coordinates.
+            valid strings are 'albers', 'utm' or 'geodesic'. If None, no
+            transformation of coordinates.  'geodesic' is the area on the
+            WGS84 ellipsoid.
 
         Returns
         -------
@@ -811,20 +1539,20 @@ class VectorLayer(pd.Series):
         'utm' should only be used for small polygons when centimeter
         level accuraccy is needed.  Othewise the area will
         be incorrect.  Similar issues can happen when polygons cross
-        utm boundaries.
+        utm boundaries.  If proj is None the areas are computed shape by
+        shape with ogr, which is cheaper than converting the layer to a
+        GeometryArray for a single property (see properties).
         """
         if proj is None:
-            return self.map(lambda x: x.GetArea())
-
-        if proj == 'utm':
-            if self.proj.ExportToProj4().strip() != ut.PROJ_WGS84:
-                vl = self.transform(ut.projection_from_string())
-            else:
-                vl = self
+            data = np.fromiter((g.GetArea() for g in self.values),
+                               dtype=np.float64, count=len(self))
+            return pd.Series(data, index=self.index)
 
-            shps = vl.to_shapely()
-            areas = [ops.transform(to_utm, shp).area for shp in shps]
-            s = pd.Series(areas, index=self.index)
+        kernels = {'utm': slib.ring_areas_utm,
+                   'geodesic': slib.ring_areas_geodesic}
+        if proj in kernels:
+            arr, ring_areas = self._ring_values(kernels[proj])
+            s = pd.Series(arr.areas(ring_areas), index=self.index)
             s.name = "area_sqr_m"
             return s
 
@@ -833,6 +1561,37 @@ class VectorLayer(pd.Series):
 
         return self.transform(proj).areas()
 
+    def lengths(self, proj=None):
+        """Compute the length of each of the shapes in the vector layer
+        (the perimeter for polygons).
+
+        Parameters
+        ----------
+        proj: string or osr.SpatialReference (default=None)
+            Same as for areas: 'albers', 'utm' or 'geodesic'. If None, no
+            transformation of coordinates.
+
+        Returns
+        -------
+        pandas.Series
+        """
+        if proj is None:
+            lengths = self.to_geometry_array().lengths()
+            return pd.Series(lengths, index=self.index)
+
+        kernels = {'utm': slib.ring_lengths_utm,
+                   'geodesic': slib.ring_lengths_geodesic}
+        if proj in kernels:
+            arr, ring_lengths = self._ring_values(kernels[proj])
+            s = pd.Series(arr.lengths(ring_lengths), index=self.index)
+            s.name = "length_m"
+            return s
+
+        elif proj == 'albers':
+            proj = ut.projection_from_string(ut.ALBERS_N_AMERICA)
+
+        return self.transform(proj).lengths()
+
     def distances(self, shp, proj=None):
         """Compute the euclidean distances for each of the shapes in the vector
         layer. If proj is not none, it will transform shp into proj.
@@ -863,7 +1622,7 @@ class VectorLayer(pd.Series):
             return self.to_geometry(proj=proj).map(lambda x: x.Distance(shp))
 
         if proj == 'utm':
-            if not self.proj.ExportToProj4() == ut.PROJ_WGS84:
+            if self.proj4 != ut.PROJ_WGS84:
                 vl = self.transform(ut.projection_from_string())
             else:
                 vl = self
@@ -896,11 +1655,13 @@ class VectorLayer(pd.Series):
         formats = ["DataFrame", "VectorLayer", "Series"]
 
         if format in ("DataFrame", "Series"):
-            data = (f.Centroid().GetPoints()[0] for f in self.features)
+            df = self.properties(["centroid_x", "centroid_y"])
+            df.columns = ["x", "y"]
             if format == "Series":
-                return pd.Series(data, index=self.index)
+                return pd.Series(map(tuple, df.values.tolist()),
+                                 index=self.index)
             else:
-                return pd.DataFrame(data, columns=["x", "y"], index=self.index)
+                return df
         elif format == "VectorLayer":
             pts = [g.Centroid() for g in self]
             [p.AssignSpatialReference(self.proj) for p in pts]
@@ -910,8 +1671,8 @@ class VectorLayer(pd.Series):
 
     def envelopes(self):
         """The the envelope of each shape as xmin, xmax, ymin, ymax.
-        Returns a pandas.Series."""
-        data = (f.GetEnvelope() for f in self)
+        Returns a pandas.Series of tuples, see bounds for an array."""
+        data = map(tuple, self.bounds()[:, [0, 2, 1, 3]].tolist())
         return pd.Series(data, index=self.index)
 
     def boundingboxes(self):
@@ -923,13 +1684,80 @@ class VectorLayer(pd.Series):
     def upper_left_corners(self):
         """Get a DataFrame with "x" and "y" columns for the
         min_lon, max_lat of each feature"""
-        data = [(f.GetEnvelope()[0], f.GetEnvelope()[3])
-                for f in self.features]
-        return pd.DataFrame(data, columns=["x", "y"], index=self.index)
+        bounds = self.bounds()
+        return pd.DataFrame({"x": bounds[:, 0], "y": bounds[:, 3]},
+                            columns=["x", "y"], index=self.index)
 
     def size_bytes(self):
-        """Get the size of the geometry in bytes"""
-        return self.map(lambda x: x.WkbSize())
+        """Get the size of the WKB of each geometry in bytes, shape by shape
+        with ogr"""
+        data = np.fromiter((g.WkbSize() for g in self.values),
+                           dtype=np.int64, count=len(self))
+        return pd.Series(data, index=self.index)
+
+    def properties(self, names=None):
+        """Compute several properties of all the shapes in one pass.  The
+        shapes are exported to WKB and parsed once into a GeometryArray,
+        and each property is computed for all of them with numpy.  The
+        conversion costs more than one ogr call per shape, so for a
+        single property bounds, areas or size_bytes are faster; this pays
+        off when several properties are needed.
+
+        Parameters
+        ----------
+        names: list of str (default None)
+            Subset of PROPERTIES: "xmin", "ymin", "xmax", "ymax" (the
+            envelope), "centroid_x", "centroid_y", "area" (in the units
+            of the projection) and "size_bytes" (of the WKB).  None
+            computes all of them.
+
+        Returns
+        -------
+        pandas.DataFrame indexed like the layer, with one column per name
+        """
+        names = list(PROPERTIES if names is None else names)
+        unknown = [n for n in names if n not in PROPERTIES]
+        if len(unknown) > 0:
+            raise ValueError("Unknown properties %s, must be in %s" %
+                             (unknown, PROPERTIES))
+
+        try:
+            arr = self.to_geometry_array()
+        except ValueError:
+            # Geometry types that GeometryArray does not support, e.g.
+            # geometry collections
+            return self._ogr_properties(names)
+
+        cols = {}
+        if set(names) & set(PROPERTIES[:4]):
+            cols.update(zip(PROPERTIES[:4], arr.bounds().T))
+        if set(names) & set(PROPERTIES[4:6]):
+            cols.update(zip(PROPERTIES[4:6], arr.centroids().T))
+        if "area" in names:
+            cols["area"] = arr.areas()
+        if "size_bytes" in names:
+            cols["size_bytes"] = arr.wkb_sizes()
+        return pd.DataFrame(dict((n, cols[n]) for n in names),
+                            columns=names, index=self.index)
+
+    def _ogr_properties(self, names):
+        """properties computed shape by shape with ogr"""
+        def row(g):
+            xmin, xmax, ymin, ymax = g.GetEnvelope()
+            res = [xmin, ymin, xmax, ymax, np.nan, np.nan, np.nan, np.nan]
+            if "centroid_x" in names or "centroid_y" in names:
+                res[4:6] = g.Centroid().GetPoint_2D()
+            if "area" in names:
+                res[6] = g.GetArea()
+            if "size_bytes" in names:
+                res[7] = g.WkbSize()
+            return res
+
+        df = pd.DataFrame([row(g) for g in self.values], columns=PROPERTIES,
+                          index=self.index)
+        if "size_bytes" in names:
+            df["size_bytes"] = df["size_bytes"].astype(np.int64)
+        return df[names]
 
     def get_extent(self):
         """The xmin, xmax, ymin, ymax values of the layer"""
@@ -943,15 +1771,42 @@ class VectorLayer(pd.Series):
         (xmin, xmax, ymin, ymax) = self.get_extent()
         return to_geometry(box(xmin, ymin, xmax, ymax), proj=self.proj)
 
-    def _gen_index(self):
-        ix = xrange(len(self.features))
-        for i, id, geom in zip(ix, self.index, self.features):
-            xmin, xmax, ymin, ymax = geom.GetEnvelope()
-            yield (i, (xmin, ymin, xmax, ymax), id)
+    def bounds(self):
+        """The envelope of each shape as an (n, 4) array of xmin, ymin,
+        xmax, ymax.  Computed with one GetEnvelope call per shape, which
+        is cheaper than converting the layer to a GeometryArray."""
+        env = np.array([g.GetEnvelope() for g in self.values],
+                       dtype=np.float64).reshape(-1, 4)
+        return env[:, [0, 2, 1, 3]]
 
     def build_sindex(self):
+        """Bulk load the spatial index of the layer if it does not
+        exist yet."""
         if self._sindex is None:
-            self._sindex = index.Index(self._gen_index())
+            self._sindex = SpatialIndex(self.bounds())
+
+    def save_sindex(self, path):
+        """Build the spatial index if needed and write it to path"""
+        self.build_sindex()
+        self._sindex.save(path)
+
+    def load_sindex(self, path, mmap=True):
+        """Use the spatial index saved in path by save_sindex.  The
+        index refers to shapes by position, so it must have been saved
+        from a layer with the same shapes in the same order.
+
+        Parameters
+        ----------
+        path: str
+
+        mmap: boolean (default True)
+            Memory map the index file instead of reading it.
+        """
+        sindex = read_sindex(path, mmap=mmap)
+        if len(sindex) != len(self):
+            raise ValueError("Index of %d shapes does not match a layer of "
+                             "%d shapes" % (len(sindex), len(self)))
+        self._sindex = sindex
 
     def nearest(self, shp, max_neighbors=5):
         if isinstance(shp, BaseGeometry):
@@ -965,32 +1820,334 @@ class VectorLayer(pd.Series):
 
         self.build_sindex()
 
-        neighbors = self._sindex.nearest((xmin, ymin, xmax, ymax),
-                                         max_neighbors,
-                                         objects="raw")
-        ret = []
-        i = 0
-        while i < max_neighbors:
-            try:
-                ret.append(neighbors.next())
-            except StopIteration:
-                i = max_neighbors
-            i += 1
+        pos = self._sindex.nearest((xmin, ymin, xmax, ymax), max_neighbors)
+        return list(self.index[pos])
+
+    def knn_join(self, other, k=1, max_distance=None, proj=None, n_jobs=1):
+        """For every shape in other, find the k nearest shapes in the layer.
+        Candidates are taken from the spatial index by envelope distance
+        and refined with the distance between the shapes, so the
+        neighbors are the nearest shapes and not only nearest by
+        envelope.
+
+        Parameters
+        ----------
+        other: VectorLayer
+            The shapes to find neighbors for.  Transformed into the
+            projection of this layer (or proj) if needed.
+
+        k: int (default 1)
+            Number of neighbors per shape.
+
+        max_distance: float (default None)
+            Ignore neighbors farther than max_distance, in the units of
+            the distance (meters for 'geodesic').
+
+        proj: string or osr.SpatialReference (default=None)
+            valid strings are 'albers' or 'geodesic'. If None, the
+            distance in the coordinates of the layer.  'geodesic' is the
+            distance in meters on the sphere between the shapes in WGS84,
+            with their edges taken as great circle arcs.  It is
+            approximated by the haversine distance between the closest
+            points in lon/lat for pairs of shapes with more than
+            GEODESIC_MAX_PAIRS vertex-edge pairs.
+
+        n_jobs: int (default 1)
+            Number of processes searching neighbors. None or -1 uses one
+            process per cpu.
+
+        Returns
+        -------
+        pandas.DataFrame with columns "other_id", "id", "distance" and
+        "rank" (1 for the nearest), ordered by the position of other_id
+        in other and by rank.  Shapes of other without a neighbor within
+        max_distance are left out.
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1")
+
+        geodesic = proj == 'geodesic'
+        if geodesic:
+            proj = ut.projection_from_string()
+        elif proj == 'albers':
+            proj = ut.projection_from_string(ut.ALBERS_N_AMERICA)
+        elif proj is not None and not isinstance(proj, SpatialReference):
+            raise ValueError("proj must be 'albers', 'geodesic' or an "
+                             "osr.SpatialReference")
+
+        vl = self
+        if proj is not None and proj.ExportToProj4().strip() != self.proj4:
+            vl = self.transform(proj)
+        if not ut.same_projection(vl, other):
+            other = other.transform(vl.proj)
+
+        vl.build_sindex()
+        shared = {"sindex": vl._sindex,
+                  "wkb": [bytes(g.ExportToWkb()) for g in vl.values],
+                  "queries": [bytes(g.ExportToWkb()) for g in other.values]}
+        args = [(start, stop, k, max_distance, geodesic) for start, stop
+                in chunk_slices(len(other), 4 * n_workers(n_jobs))]
+        chunks = pool_map(_knn_chunk, args, n_jobs=n_jobs, shared=shared)
+        if chunks:
+            q_pos, pos, dists = [np.concatenate(c) for c in zip(*chunks)]
+        else:
+            q_pos = pos = np.zeros(0, dtype=np.int64)
+            dists = np.zeros(0)
+
+        # Neighbors of each query are consecutive and ordered by distance
+        starts = np.flatnonzero(np.r_[True, q_pos[1:] != q_pos[:-1]])
+        counts = np.diff(np.r_[starts, len(q_pos)])
+        rank = np.arange(len(q_pos)) - np.repeat(starts, counts) + 1
+
+        return pd.DataFrame({"other_id": np.asarray(other.index)[q_pos],
+                             "id": np.asarray(self.index)[pos],
+                             "distance": dists,
+                             "rank": rank},
+                            columns=["other_id", "id", "distance", "rank"])
+
+    def _candidate_pairs(self, other):
+        """Positions (i, j) of all pairs of shapes in self and other whose
+        envelopes intersect, sorted by i."""
+        other.build_sindex()
+        return other._sindex.query_bulk(self.bounds())
 
-        return ret
+    def sjoin(self, other, predicate="intersects", how="inner", n_jobs=1):
+        """Spatial join of the shapes in the layer with the shapes in other.
+
+        Parameters
+        ----------
+        other: VectorLayer
+            The layer to join with.  Transformed into the projection of
+            this layer if needed.
+
+        predicate: str (default "intersects")
+            One of "intersects", "within" or "contains".  A pair (a, b)
+            is joined if a.predicate(b), where a is in this layer and b
+            in other.
+
+        how: str (default "inner")
+            "inner" returns only the joined pairs.  "left" also returns
+            the shapes without a match, with other_id NaN.
+
+        n_jobs: int (default 1)
+            Number of processes testing the candidate pairs. None or -1
+            uses one process per cpu.
+
+        Returns
+        -------
+        pandas.DataFrame with columns "id" and "other_id", ordered by the
+        position of id in the layer.
+        """
+        if predicate not in SJOIN_PREDICATES:
+            raise ValueError("predicate must be in %s" % SJOIN_PREDICATES)
+        if how not in ["inner", "left"]:
+            raise ValueError("how must be 'inner' or 'left'")
+
+        if not ut.same_projection(self, other):
+            other = other.transform(self.proj)
+
+        left, right = self._candidate_pairs(other)
+
+        # a.contains(b) for within, so that the geometry prepared is the
+        # one that is tested against many candidates.
+        if predicate == "within":
+            a, b, a_pos, b_pos = other, self, right, left
+            test = "contains"
+        else:
+            a, b, a_pos, b_pos = self, other, left, right
+            test = predicate
+
+        order = np.argsort(a_pos, kind="mergesort")
+        a_pos = a_pos[order]
+        b_pos = b_pos[order]
+        a_geoms = a.values
+        b_geoms = b.values
+        shared = {"a": dict((i, bytes(a_geoms[i].ExportToWkb()))
+                            for i in np.unique(a_pos)),
+                  "b": dict((i, bytes(b_geoms[i].ExportToWkb()))
+                            for i in np.unique(b_pos))}
+
+        chunks = chunk_slices(len(a_pos), 4 * n_workers(n_jobs))
+        args = [(test, a_pos[start:stop], b_pos[start:stop])
+                for start, stop in chunks]
+        keep = pool_map(_test_pairs, args, n_jobs=n_jobs, shared=shared)
+        keep = np.concatenate(keep) if keep else np.zeros(0, dtype=bool)
+
+        left = left[order][keep]
+        right = right[order][keep]
+        order = np.lexsort((right, left))
+        left = left[order]
+        ids = np.asarray(self.index)[left]
+        other_ids = np.asarray(other.index)[right[order]]
+
+        if how == "left":
+            missing = np.setdiff1d(np.arange(len(self)), left)
+            if len(missing) > 0:
+                pos = np.concatenate([left, missing])
+                order = np.argsort(pos, kind="mergesort")
+                ids = np.asarray(self.index)[pos[order]]
+                nan = np.empty(len(missing), dtype=object)
+                nan[:] = np.nan
+                other_ids = np.concatenate([other_ids.astype(object),
+                                            nan])[order]
+
+        return pd.DataFrame({"id": ids, "other_id": other_ids},
+                            columns=["id", "other_id"])
+
+    def overlay(self, other, how="intersection", n_jobs=1):
+        """Overlay the shapes in the layer with the shapes in other, e.g. to
+        cut fields by soil units.  Candidate pairs are found with the
+        spatial index of other, and the pieces are computed in chunks.
+
+        Parameters
+        ----------
+        other: VectorLayer
+            Transformed into the projection of this layer if needed.
+
+        how: str (default "intersection")
+            "intersection": a.intersection(b) for every pair of
+            intersecting shapes.
+            "difference": each shape minus all the shapes of other.
+            "symmetric_difference": the difference of both layers with
+            each other.
+            "union": intersection and symmetric_difference.
+            "identity": intersection and difference.
+
+        n_jobs: int (default 1)
+            Number of processes computing the pieces. None or -1 uses one
+            process per cpu.
+
+        Returns
+        -------
+        Tuple of (VectorLayer, pandas.DataFrame)
+            The pieces, and the "id" and "other_id" of the shapes each
+            piece comes from (NaN if it comes from only one layer).  Both
+            have the same (range) index.
+        """
+        if how not in OVERLAY_HOWS:
+            raise ValueError("how must be in %s" % OVERLAY_HOWS)
+
+        if not ut.same_projection(self, other):
+            other = other.transform(self.proj)
+
+        left, right = self._candidate_pairs(other)
+        ids = np.asarray(self.index).astype(object)
+        other_ids = np.asarray(other.index).astype(object)
+        nan = np.array([np.nan], dtype=object)
+        parts = []
+        if how in ["intersection", "union", "identity"]:
+            a_pos, b_pos, wkbs = self._overlay_pieces(other, left, right,
+                                                      "intersection", n_jobs)
+            parts.append((ids[a_pos], other_ids[b_pos], wkbs))
+        if how != "intersection":
+            a_pos, _, wkbs = self._overlay_pieces(other, left, right,
+                                                  "difference", n_jobs)
+            parts.append((ids[a_pos], nan.repeat(len(a_pos)), wkbs))
+        if how in ["symmetric_difference", "union"]:
+            b_pos, _, wkbs = other._overlay_pieces(self, right, left,
+                                                   "difference", n_jobs)
+            parts.append((nan.repeat(len(b_pos)), other_ids[b_pos], wkbs))
+
+        geoms = [ogr.CreateGeometryFromWkb(w) for p in parts for w in p[2]]
+        [g.AssignSpatialReference(self.proj) for g in geoms]
+        df = pd.DataFrame({"id": np.concatenate([p[0] for p in parts]),
+                           "other_id": np.concatenate([p[1] for p in parts])},
+                          columns=["id", "other_id"])
+        return VectorLayer(geoms, proj=self.proj, index=df.index), df
+
+    def _overlay_pieces(self, other, left, right, how, n_jobs=1):
+        """Pieces of the shapes of the layer for overlay, from the
+        candidate pairs (left, right) with other.  how is "intersection"
+        or "difference", see _overlay_chunk.
+
+        Returns
+        -------
+        Tuple of (positions in the layer, positions in other, list of WKB)
+        """
+        if how == "difference":
+            # Shapes without candidates are kept whole
+            missing = np.setdiff1d(np.arange(len(self)), left)
+            left = np.concatenate([left, missing])
+            right = np.concatenate([right, -np.ones(len(missing),
+                                                    dtype=right.dtype)])
+
+        order = np.lexsort((right, left))
+        left = left[order]
+        right = right[order]
+        a_geoms = self.values
+        b_geoms = other.values
+        shared = {"a": dict((i, bytes(a_geoms[i].ExportToWkb()))
+                            for i in np.unique(left)),
+                  "b": dict((i, bytes(b_geoms[i].ExportToWkb()))
+                            for i in np.unique(right[right >= 0]))}
+
+        # Chunks start at the first pair of a shape
+        chunks = chunk_slices(len(left), 4 * n_workers(n_jobs))
+        bounds = np.searchsorted(left, left[[start for start, _ in chunks
+                                             if start < len(left)]])
+        bounds = np.unique(np.concatenate([bounds, [len(left)]]))
+        args = [(how, left[start:stop], right[start:stop])
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+        chunks = pool_map(_overlay_chunk, args, n_jobs=n_jobs, shared=shared)
+        a_pos = np.concatenate([c[0] for c in chunks] + [[]]).astype(np.int64)
+        b_pos = np.concatenate([c[1] for c in chunks] + [[]]).astype(np.int64)
+        return a_pos, b_pos, [w for c in chunks for w in c[2]]
+
+    def _curve_codes(self, kind="hilbert"):
+        """Position of the center of the envelope of each shape along a
+        space filling curve over the extent of the layer.
+
+        Parameters
+        ----------
+        kind: str
+            Either "hilbert" or "zorder"
+
+        Returns
+        -------
+        numpy.ndarray of uint64
+        """
+        bounds = self.bounds()
+        if len(bounds) == 0:
+            return np.zeros(0, dtype=np.uint64)
+
+        cx = (bounds[:, 0] + bounds[:, 2]) / 2
+        cy = (bounds[:, 1] + bounds[:, 3]) / 2
+        cells = (1 << CURVE_BITS) - 1
+
+        def to_grid(c):
+            # Empty shapes (without a finite envelope) go in the first cell
+            res = np.zeros(len(c), dtype=np.int64)
+            finite = np.isfinite(c)
+            if not finite.any():
+                return res
+            cmin, cmax = c[finite].min(), c[finite].max()
+            if cmax > cmin:
+                res[finite] = ((c[finite] - cmin) / (cmax - cmin) *
+                               cells).astype(np.int64)
+            return res
+
+        x, y = to_grid(cx), to_grid(cy)
+        if kind == "hilbert":
+            return hilbert_codes(x, y, CURVE_BITS)
+        return zorder_codes(x, y)
 
     def sort(self, kind="upper_left_corners", columns=["y", "x"],
              ascending=True, index_only=False):
-        """Sort the vector layer by upper_left_corners or centroids
+        """Sort the vector layer by upper_left_corners or centroids, or
+        along a space filling curve.
 
         Parameters
         ----------
         kind: str
-            Either "upper_left_corners" or "centroids"
+            One of "upper_left_corners", "centroids", "hilbert" or
+            "zorder".  "hilbert" and "zorder" order the shapes by the
+            position of the center of their envelope along the curve,
+            which keeps nearby shapes close together in both dimensions.
 
         columns : list of str (default ["y", "x"]
             Order in which to sort the shapes (ie. sort primarily by y-axis
-            or x-axis).  Will be passed to pandas.DataFrame.sort.
+            or x-axis).  Will be passed to pandas.DataFrame.sort.  Not used
+            by the curves.
 
         ascending : boolean (default True)
             Sort by columns in ascending or descending order.
@@ -1002,19 +2159,136 @@ class VectorLayer(pd.Series):
             Shape ids sorted by columns.
         """
 
-        kinds = set(["upper_left_corners", "centroids"])
+        kinds = set(["upper_left_corners", "centroids", "hilbert", "zorder"])
         col_msg = "Sort columns must be in ['x', 'y']"
         assert all([c in ["x", "y"] for c in columns]), col_msg
         assert kind in kinds, "Sort kind not in %s" % ",".join(kinds)
 
-        # Get dataframe with min_lon, max_lat for all shapes.
-        df = getattr(self, kind)()
+        if kind in ("hilbert", "zorder"):
+            order = np.argsort(self._curve_codes(kind), kind="mergesort")
+            if not ascending:
+                order = order[::-1]
+            if index_only:
+                return self.index[order]
+            return self.take(order)
+
+        # Get dataframe with the x, y of all shapes.
+        if kind == "centroids":
+            df = self.centroids(format="DataFrame")
+        else:
+            df = self.upper_left_corners()
         df.sort_values(by=columns, ascending=ascending, inplace=True)
 
         if index_only:
             return df.index
 
-        return self.filter_by_id(df.index)
+        return self.filter_by_id(df.index, copy=False)
+
+    def partition(self, n, weights=None, kind="hilbert"):
+        """Split the layer into at most n spatially compact parts of about
+        the same total weight, e.g. to distribute work over processes or
+        machines.  The shapes are sorted along a space filling curve and
+        the curve is cut into consecutive runs.
+
+        Parameters
+        ----------
+        n: int
+            Number of parts.
+
+        weights: str or array-like (default None)
+            The cost of each shape.  "vertices" for the number of
+            vertices, "footprint" for the area of the envelope (i.e.
+            proportional to the number of pixels covered), or one weight
+            per shape.  If None, or if all the weights are 0, every shape
+            has the same weight.  Missing (NaN) weights count as 0.
+
+        kind: str (default "hilbert")
+            The curve, "hilbert" or "zorder".
+
+        Returns
+        -------
+        list of VectorLayer, without empty parts.
+        """
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        if kind not in ("hilbert", "zorder"):
+            raise ValueError("kind must be 'hilbert' or 'zorder'")
+
+        is_str = isinstance(weights, str) or isinstance(weights, unicode)
+        if weights is None:
+            w = np.ones(len(self))
+        elif is_str and weights == "vertices":
+            w = self.to_geometry_array().vertex_counts()
+        elif is_str and weights == "footprint":
+            b = self.bounds()
+            w = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        else:
+            w = np.asarray(weights, dtype=np.float64)
+            if len(w) != len(self):
+                raise ValueError("weights must have one value per shape")
+
+        # Missing weights (e.g. empty shapes) count as 0.  Without any
+        # weight (e.g. the footprint of points), parts have equal counts.
+        w = np.array(w, dtype=np.float64)
+        w[~np.isfinite(w)] = 0
+        if w.sum() <= 0:
+            w = np.ones(len(self))
+
+        order = np.argsort(self._curve_codes(kind), kind="mergesort")
+        cum = np.cumsum(w[order])
+        total = cum[-1] if len(cum) > 0 else 0
+        # Cut after the shape whose cumulative weight reaches each
+        # multiple of total / n
+        cuts = np.searchsorted(cum, total * np.arange(1, n) / float(n)) + 1
+        cuts = np.concatenate([[0], np.minimum(cuts, len(order)),
+                               [len(order)]])
+        return [self.take(order[start:stop])
+                for start, stop in zip(cuts[:-1], cuts[1:]) if stop > start]
+
+    def _iter_features(self, df=None, chunk_size=JSON_CHUNK_SIZE):
+        """GeoJSON features (dicts) of the layer, in WGS84, with the
+        properties from df.  The shapes are transformed and converted
+        chunk_size at a time.
+
+        Returns
+        -------
+        Generator of lists of dict
+        """
+        wgs84 = None
+        if self.proj4 != ut.PROJ_WGS84:
+            wgs84 = ut.projection_from_string()
+
+        columns = []
+        if df is not None:
+            if not df.index.equals(self.index):
+                df = df.loc[self.index]
+            columns = list(df.columns)
+
+        for start in xrange(0, len(self), chunk_size):
+            vl = self.iloc[start:start + chunk_size]
+            if wgs84 is not None:
+                vl = vl.transform(wgs84)
+            try:
+                geoms = GeometryArray.from_geometries(vl.values).to_geojson()
+            except ValueError:
+                # e.g. geometry collections
+                geoms = [json.loads(g.ExportToJson()) for g in vl.values]
+
+            # Properties aligned by position, one column at a time
+            values = [df.iloc[start:start + chunk_size, k].tolist()
+                      for k in xrange(len(columns))]
+            rows = zip(*values) if values else [()] * len(vl)
+
+            features = []
+            for j, (i, geom, row) in enumerate(zip(vl.ids, geoms, rows)):
+                props = dict(zip(columns, row))
+                props["__id__"] = i
+                # Same keys, inserted in the same order, as
+                # ogr.Feature.ExportToJson
+                f = {"type": "Feature", "geometry": geom, "properties": props}
+                f["id"] = start + j
+                features.append(f)
+            yield features
 
     def to_dict(self, df=None):
         """Return a dictionary representation of the object.
@@ -1031,31 +2305,26 @@ class VectorLayer(pd.Series):
         -------
         dict
         """
-
-        if self.proj.ExportToProj4() != ut.projection_from_string():
-            vl = self.transform(ut.projection_from_string())
-        else:
-            vl = self
-
         res = {"type": "FeatureCollection"}
-        res["features"] = [to_feature(f, i).ExportToJson(as_object=True)
-                           for i, f in enumerate(vl)]
-
-        if df is not None:
-            for i, f in zip(vl.ids, res["features"]):
-                props = f["properties"]
-                df_props = df.loc[i].to_dict()
-                f["properties"] = dict(props.items() + df_props.items())
-                f["properties"]["__id__"] = i
-        else:
-            for i, f in zip(vl.ids, res["features"]):
-                f["properties"]["__id__"] = i
-
+        res["features"] = [f for chunk in self._iter_features(df=df)
+                           for f in chunk]
         return res
 
+    def _iter_json(self, df=None, precision=6):
+        """The GeoJSON of the layer in pieces, one per chunk of features"""
+        yield '{"type":"FeatureCollection","features":['
+        sep = ""
+        for features in self._iter_features(df=df):
+            yield sep + ",".join(pd.io.json.dumps(f, double_precision=precision)
+                                 for f in features)
+            sep = ","
+        yield "]}"
+
     def to_json(self, path=None, df=None, precision=6):
         """Return the layer as a GeoJSON.  If a path is provided,
         it will save to the path. Otherwise, will return a string.
+        Features are serialized and written in chunks, so saving to a
+        path does not hold the whole GeoJSON in memory.
 
         Parameters
         ----------
@@ -1072,13 +2341,13 @@ class VectorLayer(pd.Series):
         -------
         geojson string
         """
-        res = self.to_dict(df=df)
-        s = pd.io.json.dumps(res, double_precision=precision)
+        pieces = self._iter_json(df=df, precision=precision)
         if path is None:
-            return s
+            return "".join(pieces)
         else:
             with fileutils.open(path, 'wb') as outf:
-                outf.write(s)
+                for piece in pieces:
+                    outf.write(piece)
 
     def to_svg(self, ids=None, ipython=False):
         """Return svg represention. Can output in IPython
@@ -1135,6 +2404,59 @@ class VectorLayer(pd.Series):
         """
         return write_shapefile(self, path, df=df)
 
+    def to_parquet(self, path, df=None, row_group_size=PARQUET_ROW_GROUP_SIZE):
+        """Write the VectorLayer to a Parquet file (requires pyarrow).  The
+        geometries are stored as WKB in a "geometry" column with the
+        projection (as WKT) in the file metadata, the ids in an "__id__"
+        column, and the envelopes in "xmin", "ymin", "xmax" and "ymax"
+        columns.  Parquet keeps min/max statistics of every row group, so
+        read_parquet can skip the row groups outside of a bbox.  Sort the
+        layer spatially first for the statistics to be selective.
+
+        Parameters
+        ----------
+        path: str
+             Path to where you want to save the file. Can be local or s3/gs.
+
+        df: pandas.DataFrame (default=None)
+            Attach the attributes to the vector layer.  Similar to to_dict.
+            The column types are kept.
+
+        row_group_size: int (default=65536)
+            Number of shapes per row group.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        bounds = self.bounds()
+        data = pd.DataFrame({"__id__": np.asarray(self.index)})
+        if df is not None:
+            if not df.index.equals(self.index):
+                df = df.loc[self.index]
+            reserved = [c for c in df.columns if c in PARQUET_COLUMNS]
+            if len(reserved) > 0:
+                raise ValueError("Reserved column names: %s" % reserved)
+            for c in df.columns:
+                data[c] = df[c].values
+        data["geometry"] = [bytes(g.ExportToWkb(ogr.wkbNDR))
+                            for g in self.values]
+        for k, c in enumerate(PARQUET_BBOX_COLUMNS):
+            data[c] = bounds[:, k]
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[PARQUET_METADATA_KEY] = json.dumps(
+            {"crs": self.proj.ExportToWkt(), "geometry": "geometry",
+             "bbox": PARQUET_BBOX_COLUMNS, "index_name": self.index.name})
+        table = table.replace_schema_metadata(meta)
+
+        url = urlparse(path)
+        if url.scheme == "" or url.scheme == "file":
+            pq.write_table(table, url.path, row_group_size=row_group_size)
+        else:
+            with fileutils.open(path, "wb") as outf:
+                pq.write_table(table, outf, row_group_size=row_group_size)
+
 
 def fetch_geojson(path):
     url = urlparse(path)
@@ -1148,12 +2470,29 @@ def fetch_geojson(path):
     return geojson
 
 
-def read_datasource(ds, layer=0, index=None):
-    dslayer = ds.GetLayerByIndex(layer)
+def read_features(features, proj, index=None, columns=None):
+    """Create a vector layer from a list of ogr.Feature.
+
+    Parameters
+    ----------
+    features: list of ogr.Feature
 
-    features = [dslayer.GetFeature(i) for i in
-                xrange(dslayer.GetFeatureCount())]
+    proj: osr.SpatialReference
+        The projection of the features.
+
+    index: string or iterable (default=None)
+        If string, the field of each feature to use as the index. If
+        iterable, use the iterable as the index. If not specified, the
+        feature ids (FID) are used.
+
+    columns: list of string (default=None)
+        The fields to read into the properties.  If not specified, all
+        the fields.
 
+    Returns
+    -------
+    Tuple of (VectorLayer, pandas.DataFrame of properties)
+    """
     if index is None:
         ids = pd.Index([f.GetFID() for f in features])
     elif isinstance(index, str) or isinstance(index, unicode):
@@ -1167,15 +2506,257 @@ def read_datasource(ds, layer=0, index=None):
         msg = "index length doesn't match number of shapes: %d vs %d."
         raise ValueError(msg % (len(ids), len(features)))
 
-    rows = [f.items() for f in features]
-    df = pd.DataFrame(rows, index=ids)
+    if columns is None:
+        rows = [f.items() for f in features]
+        df = pd.DataFrame(rows, index=ids)
+    else:
+        rows = [[f.GetField(c) for c in columns] for f in features]
+        df = pd.DataFrame(rows, index=ids, columns=columns)
     geoms = [to_geometry(f, copy=True) for f in features]
+    return VectorLayer(geoms, proj=proj, index=ids), df
+
+
+def _set_layer_filters(dslayer, bbox=None, where=None, columns=None,
+                       index=None):
+    """Push the filters of read_datasource down to an ogr.Layer, so that
+    OGR skips the features and fields that are not needed."""
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        dslayer.SetSpatialFilterRect(xmin, ymin, xmax, ymax)
+    if where is not None:
+        dslayer.SetAttributeFilter(where)
+    if columns is not None:
+        defn = dslayer.GetLayerDefn()
+        fields = [defn.GetFieldDefn(i).GetName()
+                  for i in xrange(defn.GetFieldCount())]
+        missing = [c for c in columns if c not in fields]
+        if len(missing) > 0:
+            raise ValueError("Unknown columns: %s" % missing)
+        dslayer.SetIgnoredFields([f for f in fields
+                                  if f not in columns and f != index])
+
+
+def _reset_layer_filters(dslayer):
+    dslayer.SetSpatialFilter(None)
+    dslayer.SetAttributeFilter(None)
+    dslayer.SetIgnoredFields([])
+
+
+def _iter_datasource_chunks(ds, dslayer, proj, index, chunksize, **filters):
+    """Read the features of dslayer chunksize at a time.  Holds on to ds
+    until all the features are read.  The filters are only set on
+    dslayer while it is read, since the datasource is shared."""
+    columns = filters["columns"]
+    try:
+        _set_layer_filters(dslayer, index=index, **filters)
+        dslayer.ResetReading()
+        features = []
+        for f in iter(dslayer.GetNextFeature, None):
+            features.append(f)
+            if len(features) == chunksize:
+                yield read_features(features, proj, index=index,
+                                    columns=columns)
+                features = []
+
+        if len(features) > 0:
+            yield read_features(features, proj, index=index, columns=columns)
+    finally:
+        _reset_layer_filters(dslayer)
+        ds = None
+
+
+def read_datasource(ds, layer=0, index=None, bbox=None, where=None,
+                    columns=None, chunksize=None):
+    """Read a layer of an ogr.DataSource.  See read_layer for the
+    arguments."""
+    is_str = isinstance(index, str) or isinstance(index, unicode)
+    if chunksize is not None and index is not None and not is_str:
+        raise ValueError("index must be a field name when reading chunks.")
+
+    dslayer = ds.GetLayerByIndex(layer)
     proj = ut.get_projection(dslayer)
+    if chunksize is not None:
+        return _iter_datasource_chunks(ds, dslayer, proj, index, chunksize,
+                                       bbox=bbox, where=where,
+                                       columns=columns)
+
+    try:
+        _set_layer_filters(dslayer, bbox=bbox, where=where, columns=columns,
+                           index=index if is_str else None)
+        dslayer.ResetReading()
+        features = list(iter(dslayer.GetNextFeature, None))
+    finally:
+        _reset_layer_filters(dslayer)
+
     ds = None
+    return read_features(features, proj, index=index, columns=columns)
+
+
+# Maximum number of features held in memory by iter_layer_blocks, in
+# batches.  Larger layers are sorted on disk.
+LAYER_BLOCKS_BUFFER = 16
+
+
+def _dump_run(records):
+    """Sort records and write them to a temporary file, for the external
+    sort of iter_layer_blocks.  Returns the file, rewound."""
+    records.sort()
+    run = tempfile.TemporaryFile()
+    for r in records:
+        pickle.dump(r, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _iter_run(run):
+    """Records written to run by _dump_run"""
+    try:
+        while True:
+            yield pickle.load(run)
+    except EOFError:
+        run.close()
+
+
+def _read_records(records, proj, index=None):
+    """VectorLayer and DataFrame of properties of the records of
+    iter_layer_blocks, (code, position, fid, wkb, properties)."""
+    if index is None:
+        ids = pd.Index([r[2] for r in records])
+    else:
+        ids = pd.Index([r[4][index] for r in records])
+    df = pd.DataFrame([r[4] for r in records], index=ids)
+    geoms = [ogr.CreateGeometryFromWkb(r[3]) for r in records]
+    [g.AssignSpatialReference(proj) for g in geoms]
     return VectorLayer(geoms, proj=proj, index=ids), df
 
 
-def read_layer(path, layer=0, index=None):
+def iter_layer_blocks(path, layer=0, index=None, batch_size=1000):
+    """Stream the features of a vector file in spatially compact batches
+    without loading the whole file.  The features are sorted by the
+    position of the center of their envelope along a Hilbert curve over
+    the extent of the layer, and returned in batches of batch_size
+    consecutive features.  The file is read once; at most
+    LAYER_BLOCKS_BUFFER * batch_size features are held in memory, larger
+    layers are sorted in temporary files (an external merge sort).
+    Features without a geometry are skipped.
+
+    Parameters
+    ----------
+    path: string
+        Path to the vector file. Can be local or http/s3/gs.
+
+    layer: integer
+        The layer number to use.
+
+    index: string (default=None)
+        The field of each feature to use as the index. If not specified,
+        the feature ids (FID) are used.
+
+    batch_size: integer (default=1000)
+        The number of features in each batch (except the last one).
+
+    Yields
+    ------
+    Tuple of (VectorLayer, pandas.DataFrame of properties)
+    """
+    is_str = isinstance(index, str) or isinstance(index, unicode)
+    if index is not None and not is_str:
+        raise ValueError("index must be a field name when streaming.")
+
+    ds = get_ogr_datasource(path)
+    dslayer = ds.GetLayerByIndex(layer)
+    proj = ut.get_projection(dslayer)
+    xmin, xmax, ymin, ymax = dslayer.GetExtent()
+    cells = (1 << CURVE_BITS) - 1
+    sx = cells / (xmax - xmin) if xmax > xmin else 0.
+    sy = cells / (ymax - ymin) if ymax > ymin else 0.
+
+    def with_codes(centers, features):
+        # Records sorted by the Hilbert code of the envelope centers
+        if len(features) == 0:
+            return []
+        c = np.array(centers)
+        x = np.clip(((c[:, 0] - xmin) * sx).astype(np.int64), 0, cells)
+        y = np.clip(((c[:, 1] - ymin) * sy).astype(np.int64), 0, cells)
+        codes = hilbert_codes(x, y, CURVE_BITS).tolist()
+        return [(code,) + f for code, f in zip(codes, features)]
+
+    runs = []
+    centers, features = [], []
+    max_records = LAYER_BLOCKS_BUFFER * batch_size
+    try:
+        dslayer.SetSpatialFilter(None)
+        dslayer.ResetReading()
+        for pos, f in enumerate(iter(dslayer.GetNextFeature, None)):
+            geom = f.geometry()
+            if geom is None:
+                continue
+            gxmin, gxmax, gymin, gymax = geom.GetEnvelope()
+            centers.append(((gxmin + gxmax) / 2, (gymin + gymax) / 2))
+            features.append((pos, f.GetFID(),
+                             bytes(geom.ExportToWkb(ogr.wkbNDR)), f.items()))
+            if len(features) == max_records:
+                runs.append(_dump_run(with_codes(centers, features)))
+                centers, features = [], []
+    finally:
+        ds = None
+
+    records = with_codes(centers, features)
+    if len(runs) == 0:
+        records.sort()
+        merged = iter(records)
+    else:
+        runs.append(_dump_run(records))
+        merged = heapq.merge(*[_iter_run(r) for r in runs])
+
+    batch = []
+    for r in merged:
+        batch.append(r)
+        if len(batch) == batch_size:
+            yield _read_records(batch, proj, index=index)
+            batch = []
+    if len(batch) > 0:
+        yield _read_records(batch, proj, index=index)
+
+
+def _sindex_cache_path(cache_dir, path, layer=0):
+    """Path of the cached spatial index for a layer of a local file, keyed
+    by the path, size and modification time of the file.  None if path is
+    not a local file."""
+    if not os.path.isfile(path):
+        return None
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = "%s|%d|%r|%s" % (path, stat.st_size, stat.st_mtime, layer)
+    return os.path.join(cache_dir, hashlib.sha1(key).hexdigest() + ".sidx")
+
+
+def _use_sindex_cache(vl, cache_dir, path, layer=0):
+    """Load the spatial index of vl, read from path, from cache_dir.  If
+    it is not cached yet, build it and save it there."""
+    cache_path = _sindex_cache_path(cache_dir, path, layer)
+    if cache_path is None:
+        return
+
+    if os.path.exists(cache_path):
+        try:
+            vl.load_sindex(cache_path)
+            return
+        except ValueError:
+            pass
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Write then rename, so that concurrent readers never see a partial
+    # file.
+    tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    vl.save_sindex(tmp_path)
+    os.rename(tmp_path, cache_path)
+
+
+def read_layer(path, layer=0, index=None, sindex_cache=None, bbox=None,
+               where=None, columns=None, chunksize=None):
     """Create a vector layer from the specified path.
     Will try to read using ogr.OpenShared.
 
@@ -1193,15 +2774,86 @@ def read_layer(path, layer=0, index=None):
         as the index. If iterable, use the iterable as the index. If not
         specified, will create an integer based index.
 
+    sindex_cache: str (default=None)
+        Directory for cached spatial indexes.  If given and path is a
+        local file, the spatial index of the layer is loaded from the
+        cache, or built and saved to it on the first read of the file.
+        Not used with bbox, where or chunksize.
+
+    bbox: tuple (default=None)
+        xmin, ymin, xmax, ymax in the coordinates of the layer. Only
+        the features whose envelope intersects bbox are read.
+
+    where: string (default=None)
+        Only read the features matching this OGR SQL condition, e.g.
+        "STATEFP = '17'".
+
+    columns: list of string (default=None)
+        The fields to read into the properties.  Other fields are
+        skipped by OGR.  If not specified, all the fields.
+
+    chunksize: integer (default=None)
+        If given, return an iterator of (VectorLayer, DataFrame) with at
+        most chunksize features each instead of reading the whole layer.
+        index must then be a field name or None.
+
     Returns
     -------
     Tuple of (VectorLayer, pandas.DataFrame of properties)
     """
     ds = get_ogr_datasource(path)
-    return read_datasource(ds, layer=layer, index=index)
+    res = read_datasource(ds, layer=layer, index=index, bbox=bbox,
+                          where=where, columns=columns, chunksize=chunksize)
+    filtered = bbox is not None or where is not None
+    if sindex_cache is not None and chunksize is None and not filtered:
+        _use_sindex_cache(res[0], sindex_cache, path, layer)
+    return res
+
+
+def _read_geojson_features(feats, index=None, offset=0):
+    """Create a vector layer from a list of GeoJSON features (dicts).
+
+    Parameters
+    ----------
+    feats: list of dict
+
+    index: string (default=None)
+        The column in the "properties" of each feature to use as the
+        index.  If None, the "id" of the features, or their position
+        (starting at offset) if any of them has no id.
+
+    offset: int (default=0)
+        Position of the first feature.
+
+    Returns
+    -------
+    Tuple of (VectorLayer, pandas.DataFrame of properties)
+    """
+    if index is None:
+        try:
+            ids = map(lambda x: x["id"], feats)
+        except KeyError:
+            ids = range(offset, offset + len(feats))
+
+        name = "index"
+    elif isinstance(index, str) or isinstance(index, unicode):
+        ids = map(lambda x: x["properties"][index], feats)
+        name = index
+    else:
+        raise ValueError("Unable to create index.")
+
+    proj = ut.projection_from_epsg()
+    props = pd.DataFrame(map(lambda x: x["properties"], feats), index=ids)
+    geoms = pd.Series(map(lambda x: shape(x["geometry"]), feats), index=ids) \
+              .map(lambda x: to_geometry(x, proj=proj))
 
+    props.index.name = name
+    geoms.index.name = name
+
+    return VectorLayer(geoms, proj=proj, index=ids), props
 
-def read_geojson(path_or_str, index=None):
+
+def read_geojson(path_or_str, index=None, sindex_cache=None):
     """Create a vector layer from a geojson object.  Assumes that
     the data has a projection of EPSG:4326
 
@@ -1214,6 +2866,8 @@ def read_geojson(path_or_str, index=None):
         If string, the column in the "properties" of each feature to use
         as the index. If iterable, use the iterable as the index.
 
+    sindex_cache: str (default=None)
+        Directory for cached spatial indexes.  See read_layer.
 
     Returns
     -------
@@ -1226,31 +2880,414 @@ def read_geojson(path_or_str, index=None):
         geojson_str = path_or_str
 
     feats = pd.io.json.loads(geojson_str)["features"]
+    vl, props = _read_geojson_features(feats, index=index)
+    if sindex_cache is not None and geojson_str is not path_or_str:
+        _use_sindex_cache(vl, sindex_cache, path_or_str)
+    return vl, props
 
-    if index is None:
-        try:
-            ids = map(lambda x: x["id"], feats)
-        except KeyError:
-            ids = range(len(feats))
 
-        name = "index"
-    elif isinstance(index, str) or isinstance(index, unicode):
-        ids = map(lambda x: x["properties"][index], feats)
-        name = index
+# Size in bytes of the chunks read by iter_geojson
+GEOJSON_CHUNK_SIZE = 1 << 20
+
+_JSON_STRUCTURE = re.compile(r'[{}\[\]"]')
+_JSON_OBJECTS = re.compile(r'[{}"]')
+_JSON_STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+
+
+def _iter_bytes(path, chunk_size):
+    """Read a local or http/s3/gs file in chunks of chunk_size bytes"""
+    url = urlparse(path)
+    if "http" in url.scheme:
+        res = requests.get(path, stream=True)
+        res.raise_for_status()
+        for chunk in res.iter_content(chunk_size):
+            yield chunk
     else:
-        raise ValueError("Unable to create index.")
+        with fileutils.open(path) as inf:
+            for chunk in iter(lambda: inf.read(chunk_size), b""):
+                yield chunk
 
-    proj = ut.projection_from_epsg()
-    props = pd.DataFrame(map(lambda x: x["properties"], feats), index=ids)
-    geoms = pd.Series(map(lambda x: shape(x["geometry"]), feats), index=ids) \
-              .map(lambda x: to_geometry(x, proj=proj))
 
-    props.index.name = name
-    geoms.index.name = name
+def _iter_geojson_features(chunks):
+    """Split a stream of GeoJSON into the text of its features, without
+    parsing their content.  The stream is either a FeatureCollection or a
+    sequence of features, e.g. newline delimited GeoJSON.  Only the
+    current feature is kept in memory.
+
+    Parameters
+    ----------
+    chunks: iterable of str
+        The bytes of the stream.
+
+    Yields
+    ------
+    str, the JSON of each feature
+    """
+    chunks = iter(chunks)
+    buf = b""
+    pos = 0
+    # Open objects and arrays, outside of the feature being read
+    depth = 0
+    # Last string seen at depth 1, i.e. the key of the current member of
+    # the top-level object
+    key = None
+    in_features = False
+    is_collection = False
+    # Start in buf of the object being read (top-level object or feature)
+    start = None
+    # Open objects in the feature being read, 0 if not in a feature.
+    # Arrays are not tracked inside features, so that the many brackets
+    # of coordinates are skipped by the regex.
+    feature_depth = 0
+    while True:
+        pattern = _JSON_OBJECTS if feature_depth else _JSON_STRUCTURE
+        m = pattern.search(buf, pos)
+        scan_from = len(buf)
+        if m is not None and buf[m.start()] == b'"':
+            string_end = _JSON_STRING_END.match(buf, m.start() + 1)
+            if string_end is None:
+                # The string continues in the next chunk
+                scan_from = m.start()
+                m = None
+
+        if m is None:
+            chunk = next(chunks, b"")
+            if not chunk:
+                break
+            keep = scan_from if start is None else start
+            buf = buf[keep:] + chunk
+            pos = scan_from - keep
+            if start is not None:
+                start -= keep
+            continue
+
+        i = m.start()
+        c = buf[i]
+        pos = i + 1
+        if c == b'"':
+            if depth == 1 and not feature_depth:
+                key = buf[i + 1:string_end.end() - 1]
+            pos = string_end.end()
+
+        elif feature_depth:
+            feature_depth += 1 if c == b"{" else -1
+            if feature_depth == 0:
+                yield buf[start:pos]
+                start = None
+
+        elif c == b"{":
+            if depth == 0:
+                start = i
+                is_collection = False
+            elif depth == 2 and in_features:
+                start = i
+                feature_depth = 1
+                continue
+            depth += 1
+
+        elif c == b"[":
+            if depth == 1 and key == b"features":
+                in_features = is_collection = True
+                # Only the features of a collection are kept
+                start = None
+            depth += 1
+
+        elif c == b"]":
+            depth -= 1
+            if depth == 1:
+                in_features = False
+
+        else:
+            depth -= 1
+            if depth == 0 and not is_collection:
+                yield buf[start:pos]
+                start = None
+
+    if depth != 0 or start is not None:
+        raise ValueError("Unexpected end of GeoJSON")
+
+
+def iter_geojson(path, index=None, batch_size=1000,
+                 chunk_size=GEOJSON_CHUNK_SIZE):
+    """Stream the features of a geojson file in batches, parsing them as
+    the file is read instead of loading the whole file.  Assumes that the
+    data has a projection of EPSG:4326.
+
+    Parameters
+    ----------
+    path: string
+        Path to a FeatureCollection or to newline delimited GeoJSON
+        features.  Can be local or http/s3/gs.
+
+    index: string (default=None)
+        The column in the "properties" of each feature to use as the
+        index.  If not specified, the "id" of the features, or their
+        position in the file for a batch with features without id.
+
+    batch_size: integer (default=1000)
+        The maximum number of features in each batch.
+
+    chunk_size: integer (default=1MB)
+        Number of bytes read at a time.
+
+    Yields
+    ------
+    Tuple of (VectorLayer, pandas.DataFrame of properties)
+    """
+    is_str = isinstance(index, str) or isinstance(index, unicode)
+    if index is not None and not is_str:
+        raise ValueError("index must be a field name when streaming.")
+
+    offset = 0
+    feats = []
+    for text in _iter_geojson_features(_iter_bytes(path, chunk_size)):
+        feats.append(pd.io.json.loads(text))
+        if len(feats) == batch_size:
+            yield _read_geojson_features(feats, index=index, offset=offset)
+            offset += len(feats)
+            feats = []
+
+    if len(feats) > 0:
+        yield _read_geojson_features(feats, index=index, offset=offset)
+
+
+def _row_groups_in_bbox(pf, bbox):
+    """Row groups of the ParquetFile pf whose envelope statistics
+    intersect bbox.  Row groups without statistics are kept."""
+    xmin, ymin, xmax, ymax = bbox
+    names = pf.schema.names
+    pos = [names.index(c) for c in PARQUET_BBOX_COLUMNS]
+    res = []
+    for i in xrange(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        stats = [rg.column(j).statistics for j in pos]
+        if any(st is None or not st.has_min_max for st in stats):
+            res.append(i)
+            continue
+        # min of xmin, min of ymin, max of xmax and max of ymax
+        if (stats[0].min <= xmax and stats[1].min <= ymax and
+                stats[2].max >= xmin and stats[3].max >= ymin):
+            res.append(i)
+    return res
+
+
+def read_parquet(path, columns=None, bbox=None, memory_map=True):
+    """Read a VectorLayer written with VectorLayer.to_parquet (requires
+    pyarrow).
+
+    Parameters
+    ----------
+    path: str
+        Path to the file.  Can be local or s3/gs.
+
+    columns: list of str (default=None)
+        The attributes to read.  If not specified, all of them.  Other
+        columns are not read from the file.
+
+    bbox: tuple (default=None)
+        xmin, ymin, xmax, ymax in the coordinates of the layer.  Only the
+        shapes whose envelope intersects bbox are returned, and row groups
+        with no such shape are skipped.
+
+    memory_map: bool (default=True)
+        Memory map local files instead of reading them.
+
+    Returns
+    -------
+    Tuple of (VectorLayer, pandas.DataFrame of properties)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
+    url = urlparse(path)
+    if url.scheme == "" or url.scheme == "file":
+        pf = pq.ParquetFile(url.path, memory_map=memory_map)
+    else:
+        with fileutils.open(path) as inf:
+            pf = pq.ParquetFile(pa.BufferReader(inf.read()))
+
+    meta = (pf.schema.to_arrow_schema().metadata or {})
+    if PARQUET_METADATA_KEY not in meta:
+        raise ValueError("%s was not written by VectorLayer.to_parquet"
+                         % path)
+    meta = json.loads(meta[PARQUET_METADATA_KEY])
+
+    if columns is None:
+        columns = [c for c in pf.schema.names if c not in PARQUET_COLUMNS]
+    read_columns = ["__id__", "geometry"] + list(columns)
+    if bbox is not None:
+        read_columns += PARQUET_BBOX_COLUMNS
+        groups = _row_groups_in_bbox(pf, bbox)
+    else:
+        groups = range(pf.metadata.num_row_groups)
+
+    if len(groups) > 0:
+        data = pf.read_row_groups(groups, columns=read_columns).to_pandas()
+    elif pf.metadata.num_row_groups > 0:
+        # No shape in bbox, but keep the columns and types of the file
+        data = pf.read_row_group(0, columns=read_columns).to_pandas()[:0]
+    else:
+        data = pf.read(columns=read_columns).to_pandas()
+
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        keep = ((data["xmin"] <= xmax) & (data["ymin"] <= ymax) &
+                (data["xmax"] >= xmin) & (data["ymax"] >= ymin))
+        data = data[keep.values]
+
+    proj = SpatialReference()
+    proj.ImportFromWkt(meta["crs"])
+    ids = pd.Index(data["__id__"].values, name=meta.get("index_name", None))
+    geoms = [ogr.CreateGeometryFromWkb(w) for w in data["geometry"]]
+    [g.AssignSpatialReference(proj) for g in geoms]
+    props = pd.DataFrame(dict((c, data[c].values) for c in columns),
+                         index=ids, columns=columns)
     return VectorLayer(geoms, proj=proj, index=ids), props
 
 
+class SharedLayer(object):
+    """A layer attached with attach_shared(path, lazy=True).  The WKB
+    and the spatial index stay in the memory mapped file, shared by all
+    the processes, and geometries are only created for the features
+    that are accessed, e.g. the candidates of a spatial query.
+
+    Attributes
+    ----------
+    proj: osr.SpatialReference
+    index: pandas.Index
+    name: str
+    sindex: SpatialIndex or None
+    """
+    def __init__(self, buf, offsets, proj_wkt, index, name=None,
+                 sindex=None):
+        self._buf = buf
+        self._offsets = offsets
+        self.proj = SpatialReference()
+        self.proj.ImportFromWkt(proj_wkt)
+        self.index = pd.Index(index)
+        self.name = name
+        self.sindex = sindex
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, id):
+        return self.geometry(self.index.get_loc(id))
+
+    def wkb(self, i):
+        """WKB of the feature at position i"""
+        return self._buf[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def geometry(self, i):
+        """ogr.Geometry of the feature at position i"""
+        geom = ogr.CreateGeometryFromWkb(self.wkb(i))
+        geom.AssignSpatialReference(self.proj)
+        return geom
+
+    def take(self, positions):
+        """Create a VectorLayer of the features at the given positions.
+
+        Parameters
+        ----------
+        positions: array-like of ints
+
+        Returns
+        -------
+        VectorLayer
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        vl = VectorLayer([self.geometry(i) for i in positions],
+                         proj=self.proj, index=self.index[positions])
+        vl.name = self.name
+        if self.sindex is not None:
+            vl._sindex = self.sindex.subset(positions).compact()
+        return vl
+
+    def filter_by_id(self, ids):
+        """Create a VectorLayer of the features with the given ids.
+        Raises a KeyError if an id is not in the index."""
+        ids = np.asarray(ids)
+        positions = self.index.get_indexer_for(ids)
+        if (positions < 0).any():
+            raise KeyError("Ids not in index: %s" %
+                           list(ids[positions < 0]))
+        return self.take(positions)
+
+    def to_layer(self):
+        """Create a VectorLayer of all the features"""
+        return self.take(np.arange(len(self)))
+
+    def intersects(self, shp):
+        """Create a VectorLayer of the features that intersect shp.
+        Only the candidates of the spatial index are parsed.
+
+        Parameters
+        ----------
+        shp: shapely or ogr geometry
+
+        Returns
+        -------
+        VectorLayer
+        """
+        if self.sindex is None:
+            return self.to_layer().intersects(shp)
+        shp = to_geometry(shp, proj=self.proj)
+        xmin, xmax, ymin, ymax = shp.GetEnvelope()
+        candidates = self.sindex.intersection((xmin, ymin, xmax, ymax))
+        return self.take(candidates).intersects(shp)
+
+
+def attach_shared(path, lazy=False):
+    """Read a layer written by VectorLayer.export_shared.  Its spatial
+    index, if it was exported, is memory mapped read-only and shared
+    with the other processes.  By default the geometries are parsed
+    from the file into a VectorLayer, one copy per process; with
+    lazy=True they are left in the shared memory map and parsed only
+    when they are accessed.
+
+    Parameters
+    ----------
+    path: str
+
+    lazy: bool
+        Return a SharedLayer instead of a VectorLayer.
+
+    Returns
+    -------
+    VectorLayer or SharedLayer
+    """
+    with open(path, "rb") as inf:
+        header = inf.read(_SHARED_HEADER.size)
+    if len(header) < _SHARED_HEADER.size:
+        raise ValueError("%s is not a shared VectorLayer" % path)
+    magic, n, wkb_nbytes, meta_nbytes = _SHARED_HEADER.unpack(header)
+    if magic != SHARED_MAGIC:
+        raise ValueError("%s is not a shared VectorLayer" % path)
+
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    pos = _SHARED_HEADER.size
+    offsets = data[pos:pos + 8 * (n + 1)].view("<i8")
+    pos += 8 * (n + 1)
+    buf = data[pos:pos + wkb_nbytes]
+    pos += wkb_nbytes + (-wkb_nbytes % 8)
+    proj_wkt, index, name = pickle.loads(data[pos:pos + meta_nbytes]
+                                         .tobytes())
+
+    sindex = None
+    if os.path.exists(path + ".sidx"):
+        sindex = read_sindex(path + ".sidx", mmap=True)
+    if lazy:
+        return SharedLayer(buf, offsets, proj_wkt, index, name, sindex)
+    return _from_wkb_buffer(buf, offsets, proj_wkt, index, name, sindex)
+
+
+def remove_shared(path):
+    """Delete the files written by VectorLayer.export_shared"""
+    for p in [path, path + ".sidx"]:
+        if os.path.exists(p):
+            os.remove(p)
+
+
 def from_series(geom_series, proj=None):
     """Create a VectorLayer from a pandas.Series object.  If
     the geometries do not have an spatial reference, EPSG:4326
@@ -1274,3 +3311,24 @@ def from_series(geom_series, proj=None):
     proj = ut.projection_from_string() if proj is None else proj
     geoms = geom_series.map(lambda x: to_geometry(x, proj=proj))
     return VectorLayer(geoms, proj=proj)
+
+
+def from_geometry_array(arr, proj=None, index=None):
+    """Create a VectorLayer from a GeometryArray.
+
+    Parameters
+    ----------
+    arr: GeometryArray
+
+    proj: osr.SpatialReference
+        The projection to use, defaults to EPSG:4326
+
+    index: iterable (default=None)
+        The index to use for the shapes
+
+    Returns
+    -------
+    VectorLayer
+    """
+    proj = ut.projection_from_epsg() if proj is None else proj
+    return VectorLayer(arr.to_geometries(proj=proj), proj=proj, index=index)
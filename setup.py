@@ -40,9 +40,19 @@ except ImportError as e:
     USE_CYTHON = False
     ext = ".c"
 
+# The array kernels of spatiallib run in parallel when compiled with
+# OpenMP, e.g. PYSPATIAL_OPENMP=1 pip install .  Without it they run on a
+# single thread.
+if os.environ.get("PYSPATIAL_OPENMP", "0") not in ("", "0"):
+    openmp_args = ["-fopenmp"]
+else:
+    openmp_args = []
+
 extensions = [
     Extension("pyspatial.spatiallib", ["pyspatial/spatiallib" + ext],
-              include_dirs = [numpy.get_include()]),
+              include_dirs = [numpy.get_include()],
+              extra_compile_args=openmp_args,
+              extra_link_args=openmp_args),
 ]
 
 if USE_CYTHON:
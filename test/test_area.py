@@ -56,6 +56,19 @@ class TestVectorLayer:
         vl = self.il[["Washington County, IL"]]
         assert_almost_equal(vl.areas("albers").sum() * M_TO_MI, 564.022347393)
 
+    def test_areas_geodesic(self):
+        vl = self.counties[["San Francisco"]]
+        # Albers is an equal area projection of the ellipsoid
+        geodesic = vl.areas("geodesic").sum()
+        assert abs(geodesic / vl.areas("albers").sum() - 1) < 1e-4
+
+    def test_lengths(self):
+        vl = self.counties[["San Francisco"]]
+        exp = vl.map(lambda x: x.Boundary().Length()).sum()
+        assert_almost_equal(vl.lengths().sum(), exp)
+        geodesic = vl.lengths("geodesic").sum()
+        assert abs(vl.lengths("utm").sum() / geodesic - 1) < 1e-3
+
     @timed(0.5)
     def test_perf_areas_albers(self):
         assert_almost_equal(self.clus.areas("albers").sum() * M_TO_MI,
@@ -0,0 +1,94 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import numpy as np
+from numpy.testing import assert_array_almost_equal
+from shapely.geometry import Point, LineString
+import pyspatial.vector as vt
+from osgeo import ogr
+from pyspatial.geoarray import GeometryArray, is_supported
+
+base = os.path.abspath(os.path.dirname(__file__))
+get_path = lambda x: os.path.join(base, "data/vector", x)
+
+
+class TestGeometryArray:
+    @classmethod
+    def setup_class(cls):
+        path = get_path("bay_area_counties.geojson")
+        cls.counties, _ = vt.read_geojson(path, index="NAME")
+        cls.arr = cls.counties.to_geometry_array()
+
+    def test_round_trip(self):
+        assert len(self.arr) == len(self.counties)
+        vl = vt.from_geometry_array(self.arr, proj=self.counties.proj,
+                                    index=self.counties.index)
+        for a, b in zip(vl, self.counties):
+            assert a.Equals(b)
+
+    def test_areas_lengths(self):
+        assert_array_almost_equal(self.arr.areas(),
+                                  self.counties.areas().values)
+        exp = self.counties.map(lambda x: x.Boundary().Length()).values
+        assert_array_almost_equal(self.arr.lengths(), exp)
+
+    def test_take(self):
+        idx = [3, 0, 1]
+        arr = self.arr.take(idx)
+        assert len(arr) == 3
+        assert_array_almost_equal(arr.areas(), self.arr.areas()[idx])
+        assert arr.geometry(0).Equals(self.counties.iloc[3])
+
+    def test_points_lines(self):
+        geoms = [Point(1, 2), LineString([(0, 0), (3, 4)])]
+        arr = GeometryArray.from_geometries(geoms)
+        assert_array_almost_equal(arr.lengths(), [0, 5])
+        assert_array_almost_equal(arr.areas(), [0, 0])
+        assert arr.shapely(1).equals(geoms[1])
+        assert list(arr.vertex_counts()) == [1, 2]
+        assert arr.nbytes > 0
+
+    def test_bounds_centroids_sizes(self):
+        exp = self.counties.map(lambda x: x.GetEnvelope()).tolist()
+        assert_array_almost_equal(self.arr.bounds(),
+                                  np.array(exp)[:, [0, 2, 1, 3]])
+        exp = self.counties.map(lambda x: x.Centroid().GetPoint_2D())
+        assert_array_almost_equal(self.arr.centroids(), exp.tolist())
+        exp = self.counties.map(lambda x: x.WkbSize()).values
+        assert list(self.arr.wkb_sizes()) == list(exp)
+
+        geoms = [Point(1, 2), LineString([(0, 0), (2, 0), (2, 2)])]
+        arr = GeometryArray.from_geometries(geoms)
+        assert_array_almost_equal(arr.bounds(), [[1, 2, 1, 2], [0, 0, 2, 2]])
+        assert_array_almost_equal(arr.centroids(), [[1, 2], [1.5, 0.5]])
+        assert list(arr.wkb_sizes()) == [len(g.wkb) for g in geoms]
+
+    def test_is_supported(self):
+        assert all([is_supported(g) for g in self.counties])
+        wkts = ["POINT Z (1 2 3)", "MULTILINESTRING ((0 0, 1 1))",
+                "GEOMETRYCOLLECTION (POINT (1 2))"]
+        geoms = [ogr.CreateGeometryFromWkt(w) for w in wkts]
+        assert [is_supported(g) for g in geoms] == [True, True, False]
@@ -0,0 +1,59 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from pyspatial.parallel import pool_map, get_shared, chunk_slices
+from nose.tools import assert_raises
+
+
+def _scale(i):
+    return get_shared("scale") * i
+
+
+def _nested(i):
+    # The inner call gets its own inputs and still sees the outer ones
+    inner = pool_map(_scale, range(i), shared={"scale": i})
+    return get_shared("offset") + sum(inner)
+
+
+def test_pool_map():
+    assert pool_map(_scale, range(5), shared={"scale": 2}) == \
+        [0, 2, 4, 6, 8]
+    assert pool_map(_scale, range(5), n_jobs=2, shared={"scale": 3}) == \
+        [0, 3, 6, 9, 12]
+    # Inputs are not kept after the call
+    assert_raises(KeyError, get_shared, "scale")
+
+
+def test_nested_pool_map():
+    exp = [10 + i * sum(range(i)) for i in range(5)]
+    assert pool_map(_nested, range(5), shared={"offset": 10}) == exp
+    assert pool_map(_nested, range(5), n_jobs=2,
+                    shared={"offset": 10}) == exp
+    assert_raises(KeyError, get_shared, "offset")
+
+
+def test_chunk_slices():
+    assert chunk_slices(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert chunk_slices(2, 4) == [(0, 1), (1, 2)]
@@ -24,16 +24,19 @@ ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
+import shutil
+from tempfile import mkdtemp
 
 # Scipy stack
 import numpy as np
 import pandas as pd
 
 # Spatial
-from pyspatial.vector import read_layer, read_geojson
-from pyspatial.raster import read_catalog
+from pyspatial.vector import read_layer, read_geojson, iter_geojson
+from pyspatial.raster import read_catalog, read_query_results
+from pyspatial.raster import QUERY_METHODS, QUERY_STAGES
 
-from nose.tools import timed
+from nose.tools import timed, assert_raises
 
 cwd = os.getcwd()
 base = os.path.abspath(os.path.dirname(__file__))
@@ -212,6 +215,98 @@ class TestRasterQuery:
 
         assert failed
 
+    def test_query_stats(self):
+        dataset_catalog_file = get_path("../catalog/cdl_2014.json")
+        rd = read_catalog(dataset_catalog_file)
+        assert rd.stats is None
+
+        stages = []
+        stats = rd.enable_stats(callback=lambda s, t: stages.append(s))
+        df = self.make_dataframe(rd.query(self.vl_one_shape))
+        assert len(df.index) == 1
+        assert stats.counts["shapes"] == 1
+        assert stats.counts["tiles_loaded"] > 0
+        assert stats.counts["bytes_read"] > 0
+        assert stats.counts["pixels"] > 0
+        assert sum([stats.counts["shapes_" + m]
+                    for m in QUERY_METHODS]) == 1
+        assert "to_pixels" in stats.timings
+        assert "tile_io" in stages
+        assert set(stages) <= set(QUERY_STAGES)
+        assert set(stats.timings) == set(stages)
+
+        # Tiles are cached, so a second query only hits the cache.
+        stats.reset()
+        self.make_dataframe(rd.query(self.vl_one_shape))
+        assert stats.counts.get("tiles_loaded", 0) == 0
+        assert stats.counts["tile_cache_hits"] > 0
+
+        assert rd.disable_stats() is stats
+        assert rd.stats is None
+
+    def test_query_tolerance(self):
+        rd = read_catalog(get_path("../catalog/cdl_2014.json"))
+        vl = self.vl[:50]
+        exp = self.make_dataframe(rd.query(vl))
+        results = list(rd.query(vl, tolerance=0.05, scale_factor=8))
+        assert all([r.method in QUERY_METHODS for r in results])
+        act = self.make_dataframe(iter(results))
+        corn_error = (exp[1] - act[1]).abs().max()
+        assert corn_error < 0.1, corn_error
+
+    def test_query_file(self):
+        p = get_path("vector/clu/four_shapes_2il_2ca.geojson")
+        rd = read_catalog(get_path("../catalog/cdl_2014.json"))
+        df = self.make_dataframe(rd.query_file(p, batch_size=2))
+        assert len(df.index) == 4
+        sums = df.sum(axis=1).map(int)
+        assert df[sums < 1e-6].shape[0] == 2
+
+    def test_query_checkpointed(self):
+        rd = read_catalog(get_path("../catalog/cdl_2014.json"))
+        vl = self.vl[:20]
+        tmpdir = mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "results.db")
+            # Simulate a run that was interrupted after 10 shapes
+            assert rd.query_checkpointed(vl[:10], path, batch_size=4) == 10
+            assert rd.query_checkpointed(vl, path, batch_size=4) == 10
+            assert rd.query_checkpointed(vl, path, batch_size=4) == 0
+
+            df = self.make_dataframe(read_query_results(path))
+            assert len(df.index) == 20
+            exp = self.make_dataframe(rd.query(vl))
+            assert ((df.loc[exp.index] - exp).abs().max().max()) < 1e-8
+
+            # The method of each result is stored with it
+            methods = dict((r.id, r.method) for r in rd.query(vl))
+            assert all([r.method == methods[r.id]
+                        for r in read_query_results(path)])
+            # Resuming with settings that change the method is refused
+            assert_raises(ValueError, rd.query_checkpointed, vl, path,
+                          tolerance=0.01)
+            assert rd.query_checkpointed(vl, path, missing_first=True) == 0
+            # Numpy settings are recorded as python values
+            assert rd.query_checkpointed(vl, path,
+                                         scale_factor=np.int64(4)) == 0
+
+            # Shapes streamed from a file or an iterator of layers
+            p = get_path("vector/clu/four_shapes_2il_2ca.geojson")
+            path = os.path.join(tmpdir, "file.db")
+            assert rd.query_checkpointed(p, path, batch_size=3) == 4
+            assert rd.query_checkpointed(p, path, batch_size=3) == 0
+            df = self.make_dataframe(read_query_results(path))
+            exp = self.make_dataframe(rd.query_file(p))
+            assert ((df.loc[exp.index] - exp).abs().max().max()) < 1e-8
+
+            path = os.path.join(tmpdir, "blocks.db")
+            blocks = iter_geojson(p, batch_size=3)
+            assert rd.query_checkpointed(blocks, path, batch_size=2) == 4
+            blocks = iter_geojson(p, batch_size=3)
+            assert rd.query_checkpointed(blocks, path) == 0
+        finally:
+            shutil.rmtree(tmpdir)
+
     # Test if tilepaths were defined from a different working directory
     # than the python code
     def test_unconventional_tilepath(self):
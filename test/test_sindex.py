@@ -0,0 +1,154 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import shutil
+from tempfile import mkdtemp
+import numpy as np
+from nose.tools import assert_raises
+from pyspatial.sindex import SpatialIndex, read_sindex
+from pyspatial.sindex import hilbert_codes, zorder_codes
+
+
+def random_boxes(n, seed=0):
+    rs = np.random.RandomState(seed)
+    xy = rs.uniform(0, 100, (n, 2))
+    return np.column_stack([xy, xy + rs.uniform(0, 5, (n, 2))])
+
+
+def brute_force(bounds, query):
+    return np.flatnonzero((bounds[:, 0] <= query[2]) &
+                          (bounds[:, 2] >= query[0]) &
+                          (bounds[:, 1] <= query[3]) &
+                          (bounds[:, 3] >= query[1]))
+
+
+def box_distance(bounds, box):
+    dx = np.maximum(bounds[:, 0] - box[2], box[0] - bounds[:, 2])
+    dy = np.maximum(bounds[:, 1] - box[3], box[1] - bounds[:, 3])
+    dx, dy = np.maximum(dx, 0), np.maximum(dy, 0)
+    return np.sqrt(dx ** 2 + dy ** 2)
+
+
+class TestSpatialIndex:
+    @classmethod
+    def setup_class(cls):
+        cls.bounds = random_boxes(1000)
+        cls.queries = random_boxes(50, seed=1)
+        cls.sindex = SpatialIndex(cls.bounds, capacity=8)
+
+    def test_intersection(self):
+        for q in self.queries:
+            res = self.sindex.intersection(q)
+            assert list(res) == list(brute_force(self.bounds, q))
+
+    def test_query_bulk(self):
+        q, items = self.sindex.query_bulk(self.queries)
+        exp = [(i, j) for i, query in enumerate(self.queries)
+               for j in brute_force(self.bounds, query)]
+        assert zip(q, items) == exp
+
+    def test_nearest(self):
+        p = (50., 50., 50., 50.)
+        res = self.sindex.nearest(p, 5)
+        dist = box_distance(self.bounds, p)
+        assert len(res) == 5
+        assert np.allclose(dist[res], np.sort(dist)[:5])
+
+    def test_subset(self):
+        pos = np.arange(0, 1000, 3)[::-1]
+        view = self.sindex.subset(pos)
+        assert len(view) == len(pos)
+        for q in self.queries:
+            hits = set(brute_force(self.bounds, q))
+            exp = [i for i, p in enumerate(pos) if p in hits]
+            assert list(view.intersection(q)) == exp
+
+        # A view of a view is relative to the positions of the view
+        view2 = view.subset([5, 1, 2])
+        q, items = view2.query_bulk(self.bounds[pos[[1, 5]]])
+        assert zip(q, items) == [(0, 1), (1, 0)]
+
+        p = (50., 50., 50., 50.)
+        res = view.nearest(p, 3)
+        dist = box_distance(self.bounds[pos], p)
+        assert np.allclose(dist[res], np.sort(dist)[:3])
+        assert np.allclose(view.get_bounds()[:2],
+                           self.bounds[pos].min(axis=0)[:2])
+
+        compact = view.compact()
+        assert compact._items is None
+        assert len(compact.bounds) == len(pos)
+        for q in self.queries[:10]:
+            assert sorted(compact.intersection(q)) == \
+                sorted(view.intersection(q))
+        assert self.sindex.compact() is self.sindex
+
+    def test_save(self):
+        tmp = mkdtemp()
+        try:
+            path = os.path.join(tmp, "index.sidx")
+            view = self.sindex.subset(np.arange(0, 1000, 7)[::-1])
+            for sindex in [self.sindex, view]:
+                sindex.save(path)
+                for mmap in [True, False]:
+                    res = read_sindex(path, mmap=mmap)
+                    assert len(res) == len(sindex)
+                    a = sindex.query_bulk(self.queries)
+                    b = res.query_bulk(self.queries)
+                    assert (a[0] == b[0]).all() and (a[1] == b[1]).all()
+
+            with open(path, "ab") as f:
+                f.write(b"x")
+            assert_raises(ValueError, read_sindex, path)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_bounds(self):
+        exp = (self.bounds[:, 0].min(), self.bounds[:, 1].min(),
+               self.bounds[:, 2].max(), self.bounds[:, 3].max())
+        assert np.allclose(self.sindex.get_bounds(), exp)
+
+    def test_empty(self):
+        sindex = SpatialIndex(np.zeros((0, 4)))
+        assert len(sindex) == 0
+        assert len(sindex.intersection((0, 0, 1, 1))) == 0
+        assert len(sindex.nearest((0, 0, 1, 1), 3)) == 0
+
+
+def test_curve_codes():
+    x, y = np.meshgrid(np.arange(8), np.arange(8))
+    x, y = x.ravel(), y.ravel()
+
+    z = zorder_codes(x, y)
+    assert sorted(z) == list(range(64))
+    assert z[(x == 1) & (y == 0)] == 1 and z[(x == 0) & (y == 1)] == 2
+
+    h = hilbert_codes(x, y, 3)
+    assert sorted(h) == list(range(64))
+    # Consecutive cells along the Hilbert curve are neighbours
+    order = np.argsort(h)
+    steps = np.abs(np.diff(x[order])) + np.abs(np.diff(y[order]))
+    assert (steps == 1).all()
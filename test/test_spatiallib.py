@@ -0,0 +1,64 @@
+"""
+Copyright (c) 2016, Granular, Inc.
+All rights reserved.
+License: BSD 3-Clause ("BSD New" or "BSD Simplified")
+
+Redistribution and use in source and binary forms, with or without modification, are permitted
+provided that the following conditions are met:
+
+  * Redistributions of source code must retain the above copyright notice, this list of conditions
+    and the following disclaimer.
+  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+    following disclaimer in the documentation and/or other materials provided with the distribution.
+  * Neither the name of the nor the names of its contributors may be used to endorse or promote products
+    derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS
+OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY
+ AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL BE LIABLE FOR ANY DIRECT,
+INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+from nose.tools import assert_raises
+from pyspatial.spatiallib import (to_utm, to_utm_array, haversine,
+                                  haversine_matrix, to_pixels,
+                                  to_pixels_array)
+
+
+class TestArrayKernels:
+    @classmethod
+    def setup_class(cls):
+        rs = np.random.RandomState(0)
+        cls.lon = rs.uniform(-179, 179, 500)
+        cls.lat = rs.uniform(-80, 84, 500)
+
+    def test_to_utm_array(self):
+        x, y = to_utm_array(self.lon, self.lat)
+        expected = np.array([to_utm(a, b) for a, b in zip(self.lon, self.lat)])
+        np.testing.assert_array_equal(x, expected[:, 0])
+        np.testing.assert_array_equal(y, expected[:, 1])
+        assert_raises(ValueError, to_utm_array, self.lon, self.lat[:10])
+
+    def test_haversine_matrix(self):
+        a = np.c_[self.lon[:20], self.lat[:20]]
+        b = np.c_[self.lon[20:50], self.lat[20:50]]
+        res = haversine_matrix(a, b)
+        assert res.shape == (20, 30)
+        expected = [[haversine(tuple(p), tuple(q)) for q in b] for p in a]
+        np.testing.assert_allclose(res, expected, rtol=1e-12)
+        assert (haversine_matrix(a, a).diagonal() < 1).all()
+        assert_raises(ValueError, haversine_matrix, [[0, 91]], b)
+        assert_raises(ValueError, haversine_matrix, [[181, 0]], b)
+
+    def test_to_pixels_array(self):
+        args = (-100., 45., 0.0003, -0.0003)
+        lon_px, lat_px = to_pixels_array(self.lon, self.lat, *args)
+        expected = np.array([to_pixels(a, b, *args)
+                             for a, b in zip(self.lon, self.lat)])
+        np.testing.assert_array_equal(lon_px, expected[:, 0])
+        np.testing.assert_array_equal(lat_px, expected[:, 1])
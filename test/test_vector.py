@@ -24,13 +24,20 @@ ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
+import json
 import pickle
+import random
+import multiprocessing
+import shutil
+from tempfile import mkdtemp
+import numpy as np
 import pyspatial.vector as vt
 from pyspatial.utils import projection_from_string, ALBERS_N_AMERICA
 from pyspatial.utils import projection_from_epsg
 from pyspatial.spatiallib import haversine
-from osgeo import ogr
+from osgeo import ogr, osr
 from nose.tools import assert_raises, assert_almost_equal
+from shapely.geometry import Point, LineString
 
 base = os.path.abspath(os.path.dirname(__file__))
 get_path = lambda x: os.path.join(base, "data/vector", x)
@@ -116,6 +123,10 @@ def __test_read():
     assert len(vt.read_geojson(geojson_str)[0]) == 52
 
 
+def _shared_areas(path):
+    return list(vt.attach_shared(path).areas())
+
+
 class TestVectorLayer:
     @classmethod
     def setup_class(cls):
@@ -145,21 +156,384 @@ class TestVectorLayer:
         co, co_df = vt.read_layer(get_path("clu/clu_public_a_co095.shp"))
         assert isinstance(co, vt.VectorLayer)
 
+    def test_iter_layer_blocks(self):
+        path = get_path("cb_2014_us_state_500k.zip")
+        batches = list(vt.iter_layer_blocks(path, index="STUSPS",
+                                            batch_size=10))
+        assert all([len(vl) <= 10 for vl, df in batches])
+        ids = [i for vl, df in batches for i in vl.index]
+        assert len(ids) == 56
+        assert len(set(ids)) == 56
+        assert all([(vl.index == df.index).all() for vl, df in batches])
+
+        # Shapes that do not touch the cell of their upper left corner
+        features = [{"type": "Feature", "properties": {"name": "p%d" % i},
+                     "geometry": {"type": "Point",
+                                  "coordinates": [i % 10, i // 10]}}
+                    for i in xrange(100)]
+        line = {"type": "LineString", "coordinates": [[0, 0], [10, 10]]}
+        parts = {"type": "MultiPolygon",
+                 "coordinates": [[[[0, 9], [1, 9], [1, 10], [0, 10],
+                                   [0, 9]]],
+                                 [[[9, 0], [10, 0], [10, 1], [9, 1],
+                                   [9, 0]]]]}
+        features += [{"type": "Feature", "properties": {"name": name},
+                      "geometry": geom}
+                     for name, geom in [("line", line), ("parts", parts)]]
+        # In random order, and sorted on disk
+        random.Random(0).shuffle(features)
+        buffer_size = vt.LAYER_BLOCKS_BUFFER
+        tmp = mkdtemp()
+        try:
+            path = os.path.join(tmp, "shapes.geojson")
+            with open(path, "w") as f:
+                json.dump({"type": "FeatureCollection",
+                           "features": features}, f)
+            vt.LAYER_BLOCKS_BUFFER = 1
+            batches = list(vt.iter_layer_blocks(path, index="name",
+                                                batch_size=7))
+        finally:
+            vt.LAYER_BLOCKS_BUFFER = buffer_size
+            shutil.rmtree(tmp)
+        ids = [i for vl, df in batches for i in vl.index]
+        assert sorted(ids) == sorted(f["properties"]["name"]
+                                     for f in features)
+        assert [len(vl) for vl, df in batches] == [7] * 14 + [4]
+        # Batches are spatially compact: a batch of points covers a small
+        # part of the 10 x 10 extent
+        areas = []
+        for vl, df in batches:
+            pts = np.array([g.GetPoint_2D() for g in vl.values
+                            if g.GetGeometryName() == "POINT"])
+            if len(pts) > 0:
+                size = pts.max(axis=0) - pts.min(axis=0)
+                areas.append(size[0] * size[1])
+        assert np.median(areas) <= 10
+
+    def test_iter_geojson(self):
+        path = get_path("bay_area_zips.geojson")
+        batches = list(vt.iter_geojson(path, index="ZCTA5CE10",
+                                       batch_size=25, chunk_size=4096))
+        assert all([len(vl) <= 25 for vl, df in batches])
+        ids = [i for vl, df in batches for i in vl.index]
+        assert ids == list(self.zips.index)
+        assert all([(vl.index == df.index).all() for vl, df in batches])
+        assert all([vl[i].Equals(self.zips[i]) for vl, df in batches
+                    for i in vl.index])
+
+        # Newline delimited GeoJSON
+        tmp = mkdtemp()
+        try:
+            ndjson = os.path.join(tmp, "zips.json")
+            with open(ndjson, "w") as out:
+                for line in self.zips.head(30).to_dict()["features"]:
+                    out.write(json.dumps(line) + "\n")
+            batches = list(vt.iter_geojson(ndjson, index="__id__",
+                                           batch_size=20))
+            assert [len(vl) for vl, df in batches] == [20, 10]
+            assert [i for vl, df in batches for i in vl.index] == \
+                list(self.zips.index[:30])
+        finally:
+            shutil.rmtree(tmp)
+
     def test_from_series(self):
         series = self.df["__geometry__"]
         assert isinstance(vt.from_series(series), vt.VectorLayer)
 
+    def test_proj4(self):
+        counties = self.counties[[self.sf]]
+        assert counties.proj4 == counties.proj.ExportToProj4().strip()
+        albers = counties.transform(projection_from_string(ALBERS_N_AMERICA))
+        assert albers.proj4 != counties.proj4
+        # Reassigning the projection invalidates the cached string
+        albers.proj = counties.proj
+        assert albers.proj4 == counties.proj4
+
+    def test_transform(self):
+        albers = projection_from_string(ALBERS_N_AMERICA)
+        ct = osr.CoordinateTransformation(self.counties.proj, albers)
+        expected = [g.Clone() for g in self.counties]
+        [g.Transform(ct) for g in expected]
+        for n_jobs in [1, 2]:
+            res = self.counties.transform(albers, n_jobs=n_jobs)
+            assert list(res.index) == list(self.counties.index)
+            assert res.proj is albers
+            for a, b in zip(res, expected):
+                assert a.GetCoordinateDimension() == \
+                    b.GetCoordinateDimension()
+                assert a.Equals(b)
+
+        # Geometry collections are transformed shape by shape
+        gc = ogr.CreateGeometryFromWkt("GEOMETRYCOLLECTION (POINT (-122 37),"
+                                       " LINESTRING (-122 37, -121 38))")
+        vl = vt.VectorLayer([gc], proj=self.counties.proj)
+        exp = gc.Clone()
+        exp.Transform(ct)
+        assert vl.transform(albers, n_jobs=2)[0].Equals(exp)
+
     def test_predicates(self):
         sf = self.counties["San Francisco"]
         assert isinstance(sf, ogr.Geometry)
         sf_ids = self.zips.within(sf, index_only=True)
         assert all(map(lambda x: x.startswith("941"), sf_ids))
 
+        # The prepared shapely path and the ogr path agree
+        min_candidates = vt.LAYER_PREPARE_MIN_CANDIDATES
+        res = []
+        try:
+            for n in [0, len(self.zips) + 1]:
+                vt.LAYER_PREPARE_MIN_CANDIDATES = n
+                res.append((list(self.zips.within(sf, index_only=True)),
+                            list(self.zips.iintersects(sf))))
+        finally:
+            vt.LAYER_PREPARE_MIN_CANDIDATES = min_candidates
+        assert res[0] == res[1]
+        assert res[0][0] == list(sf_ids)
+
+    def test_sindex(self):
+        centroid = self.counties[self.sf].Centroid()
+        assert self.counties.nearest(centroid, 1) == [self.sf]
+        xmin, xmax, ymin, ymax = self.counties.get_extent()
+        env = self.counties.envelopes()
+        assert xmin == min(e[0] for e in env)
+        assert ymax == max(e[3] for e in env)
+
+    def test_properties(self):
+        zips = self.zips
+        df = zips.properties()
+        assert list(df.columns) == vt.PROPERTIES
+        assert list(df.index) == list(zips.index)
+        assert np.allclose(df[["xmin", "ymin", "xmax", "ymax"]].values,
+                           zips.bounds())
+        assert np.allclose(df["area"], zips.areas())
+        assert (df["size_bytes"] == zips.size_bytes()).all()
+        centroids = zips.centroids(format="DataFrame")
+        assert np.allclose(df[["centroid_x", "centroid_y"]], centroids)
+        exp = [g.Centroid().GetPoint_2D() for g in zips.values]
+        assert np.allclose(centroids.values, exp)
+
+        corners = zips.upper_left_corners()
+        assert (corners["x"] == df["xmin"]).all()
+        assert (corners["y"] == df["ymax"]).all()
+        assert zips.envelopes().iloc[0] == zips.iloc[0].GetEnvelope()
+        assert list(zips.properties(["area"]).columns) == ["area"]
+        assert_raises(ValueError, zips.properties, ["perimeter"])
+        ids = zips.sort(kind="centroids", index_only=True)
+        assert sorted(ids) == sorted(zips.index)
+
+    def test_sindex_views(self):
+        zips = self.zips[self.zips.index[:200]]
+        zips.build_sindex()
+        sf = self.counties[self.sf]
+        # Filtered layers reuse the parent's index
+        subset = zips.within(sf)
+        assert subset._sindex is not None
+        assert subset._sindex.node_bounds is zips._sindex.node_bounds
+        assert list(subset.iintersects(sf)) == list(subset.index)
+        sorted_zips = zips.sort()
+        assert sorted_zips._sindex is not None
+        ids = sorted(subset.index)
+        assert sorted(sorted_zips.iwithin(sf)) == ids
+        # Replacing a shape invalidates the index
+        sorted_zips[sorted_zips.index[0]] = sf.Clone()
+        assert sorted_zips._sindex is None
+
+    def test_curve_sort(self):
+        for kind in ["hilbert", "zorder"]:
+            ids = self.zips.sort(kind=kind, index_only=True)
+            assert sorted(ids) == sorted(self.zips.index)
+            desc = self.zips.sort(kind=kind, ascending=False)
+            assert list(desc.index) == list(ids[::-1])
+
+    def test_partition(self):
+        zips = self.zips[self.zips.index[:500]]
+        for weights in [None, "vertices", "footprint"]:
+            parts = zips.partition(4, weights=weights)
+            assert 0 < len(parts) <= 4
+            ids = [i for p in parts for i in p.index]
+            assert sorted(ids) == sorted(zips.index)
+        sizes = [len(p) for p in zips.partition(4)]
+        assert sizes == [125] * 4
+        assert len(zips.partition(1000)) == len(zips)
+        assert_raises(ValueError, zips.partition, 0)
+        assert_raises(ValueError, zips.partition, 2, weights=[1, 2])
+
+        # Points have no footprint: parts of equal counts
+        pts = zips.centroids()
+        sizes = [len(p) for p in pts.partition(4, weights="footprint")]
+        assert sizes == [125] * 4
+        weights = np.ones(len(zips))
+        weights[::2] = np.nan
+        parts = zips.partition(5, weights=weights)
+        assert len(parts) == 5
+        assert sum(len(p) for p in parts) == len(zips)
+
+    def test_filter_by_id(self):
+        ids = list(self.zips.index[[5, 2, 7]])
+        vl = self.zips.filter_by_id(ids)
+        assert list(vl.index) == ids
+        # Geometries and projection are copied by default
+        assert vl.proj is not self.zips.proj
+        assert all([vl[i] is not self.zips[i] and vl[i].Equals(self.zips[i])
+                    for i in ids])
+        assert_raises(KeyError, self.zips.filter_by_id, ids + ["not an id"])
+        # Ids of another layer
+        assert_raises(KeyError, self.zips.filter_by_id,
+                      self.counties.index[:2])
+        common = self.zips.index.intersection(ids + ["not an id"])
+        assert sorted(self.zips.filter_by_id(common).index) == sorted(ids)
+
+        # Modifying the copies leaves the parent unchanged
+        area = self.zips[ids[0]].GetArea()
+        wkt = self.zips.proj.ExportToWkt()
+        albers = projection_from_string(ALBERS_N_AMERICA)
+        vl[ids[0]].Transform(osr.CoordinateTransformation(self.zips.proj,
+                                                          albers))
+        vl.proj.ImportFromProj4(ALBERS_N_AMERICA)
+        assert_almost_equal(self.zips[ids[0]].GetArea(), area)
+        assert vl[ids[0]].GetArea() > 1e6 * area
+        assert self.zips.proj.ExportToWkt() == wkt
+
+        # copy=False shares the geometries and the projection
+        view = self.zips.filter_by_id(ids, copy=False)
+        assert list(view.index) == ids
+        assert view.proj is self.zips.proj
+        assert all([view[i] is self.zips[i] for i in ids])
+
+        clone = view.clone()
+        assert list(clone.index) == ids
+        assert all([clone[i] is not view[i] and clone[i].Equals(view[i])
+                    for i in ids])
+
+    def test_sindex_cache(self):
+        tmp = mkdtemp()
+        try:
+            path = get_path("cb_2014_us_state_500k.zip")
+            vl, df = vt.read_layer(path, index="STUSPS", sindex_cache=tmp)
+            assert vl._sindex is not None
+            assert len(os.listdir(tmp)) == 1
+            vl2, df2 = vt.read_layer(path, index="STUSPS", sindex_cache=tmp)
+            assert isinstance(vl2._sindex.bounds, np.memmap)
+            assert list(vl2.iintersects(vl["CA"])) == \
+                list(vl.iintersects(vl["CA"]))
+
+            sindex_path = os.path.join(tmp, "zips.sidx")
+            self.zips.save_sindex(sindex_path)
+            zips = self.zips[self.zips.index]
+            zips.load_sindex(sindex_path)
+            sf = self.counties[self.sf]
+            assert list(zips.iwithin(sf)) == list(self.zips.iwithin(sf))
+            assert_raises(ValueError, vl.load_sindex, sindex_path)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_prepared_predicates(self):
+        # Many zips are candidates for SF, so the prepared path is used.
+        # It must agree with the OGR predicates.
+        sf = self.counties[self.sf]
+        methods = [("iintersects", "Intersect"), ("iwithin", "Within"),
+                   ("icrosses", "Crosses"), ("itouches", "Touches"),
+                   ("icontains", "Contains")]
+        for method, op in methods:
+            ids = getattr(self.zips, method)(sf)
+            expected = [i for i, g in self.zips.iteritems()
+                        if getattr(g, op)(sf)]
+            assert sorted(ids) == sorted(expected)
+
+    def test_sjoin(self):
+        sf_ids = self.zips.within(self.counties[self.sf], index_only=True)
+        df = self.zips.sjoin(self.counties, predicate="within")
+        assert list(df.columns) == ["id", "other_id"]
+        assert sorted(df[df["other_id"] == self.sf]["id"]) == sorted(sf_ids)
+
+        df2 = self.counties.sjoin(self.zips, predicate="contains", n_jobs=2)
+        assert sorted(zip(df2["other_id"], df2["id"])) == \
+            sorted(zip(df["id"], df["other_id"]))
+
+        df3 = self.zips.sjoin(self.counties, how="left")
+        assert set(df3["id"]) == set(self.zips.index)
+        assert len(df3) >= len(self.zips)
+        assert_raises(ValueError, self.zips.sjoin, self.counties, "touches")
+
+    def test_knn_join(self):
+        pts = self.zips.centroids().head(20)
+        df = self.counties.knn_join(pts, k=2)
+        assert list(df.columns) == ["other_id", "id", "distance", "rank"]
+        assert list(df["rank"]) == [1, 2] * len(pts)
+        assert list(df["other_id"][::2]) == list(pts.index)
+        for zip_id, g in df.groupby("other_id"):
+            d = self.counties.distances(pts[zip_id]).sort_values()
+            assert list(g["id"]) == list(d.index[:2])
+            assert np.allclose(g["distance"], d.values[:2])
+
+        df2 = self.counties.knn_join(pts, k=2, n_jobs=2)
+        assert df2.equals(df)
+
+        df3 = self.counties.knn_join(pts, proj="geodesic",
+                                     max_distance=1000.)
+        assert (df3["distance"] <= 1000.).all()
+        assert set(df3["other_id"]) <= set(pts.index)
+        assert_raises(ValueError, self.counties.knn_join, pts, 0)
+
+        # Near the pole the edge of the line bulges north to within 263km
+        # of the point, which is 556km south of it in lon/lat
+        wgs84 = projection_from_epsg()
+        pt = vt.VectorLayer([vt.to_geometry(Point(0, 80), proj=wgs84)],
+                            index=["pt"], proj=wgs84)
+        shapes = [LineString([(-60, 75), (60, 75)]), Point(0, 76.5)]
+        vl = vt.VectorLayer([vt.to_geometry(g, proj=wgs84) for g in shapes],
+                            index=["line", "point"], proj=wgs84)
+        df = vl.knn_join(pt, k=2, proj="geodesic")
+        assert list(df["id"]) == ["line", "point"]
+        apex = np.degrees(np.arctan(np.tan(np.radians(75)) /
+                                    np.cos(np.radians(60))))
+        assert_almost_equal(df["distance"].iloc[0],
+                            haversine((0, 80), (0, apex)), places=0)
+        assert_almost_equal(df["distance"].iloc[1],
+                            haversine((0, 80), (0, 76.5)), places=0)
+
     def test_intersection(self):
         sf = self.counties["San Francisco"]
         vl = self.zips.intersection(sf)
         assert abs(vl.unary_union().area - vt.to_shapely(sf).area) < 1e-3
 
+    def test_dissolve(self):
+        zips = self.zips[self.zips.index[:300]]
+        union = zips.unary_union()
+        assert abs(zips.unary_union(n_jobs=2).area - union.area) < 1e-6
+
+        prefix = self.df4["GEOID10"].str[:3]
+        vl = zips.dissolve(prefix)
+        assert isinstance(vl, vt.VectorLayer)
+        assert sorted(vl.index) == sorted(set(prefix[zips.index]))
+        for key in vl.index:
+            ids = [i for i in zips.index if prefix[i] == key]
+            exp = zips[ids].unary_union().area
+            assert abs(vt.to_shapely(vl[key]).area - exp) < 1e-6
+
+        vl2 = zips.dissolve([z[:3] for z in zips.index], n_jobs=2)
+        assert list(vl2.index) == list(vl.index)
+        assert abs(sum(vl2.areas()) - sum(vl.areas())) < 1e-6
+        assert_raises(ValueError, zips.dissolve, [1, 2])
+
+    def test_overlay(self):
+        zips = self.zips[self.zips.index[:100]]
+        vl, df = zips.overlay(self.counties)
+        assert isinstance(vl, vt.VectorLayer)
+        assert len(vl) == len(df) > 0
+        assert set(df["id"]) <= set(zips.index)
+        assert set(df["other_id"]) <= set(self.counties.index)
+        for i in [0, len(df) - 1]:
+            a = zips[df["id"][i]]
+            b = self.counties[df["other_id"][i]]
+            assert_almost_equal(vl[i].GetArea(),
+                                a.Intersection(b).GetArea())
+
+        vl2, df2 = zips.overlay(self.counties, how="union", n_jobs=2)
+        assert df2.iloc[:len(df)].equals(df)
+        assert df2["id"].isnull().any() and df2["other_id"].isnull().any()
+        assert_raises(ValueError, zips.overlay, self.counties, "xor")
+
     def test_read_index(self):
         path = get_path("cb_2014_us_state_500k.zip")
         vl, df = vt.read_layer(path, index="STUSPS")
@@ -167,6 +541,35 @@ class TestVectorLayer:
         vl, df = vt.read_layer(path, index=xrange(5, 61))
         assert_raises(ValueError, vt.read_layer, path, 0, xrange(5, 56))
 
+    def test_read_filters(self):
+        path = get_path("cb_2014_us_state_500k.zip")
+        states, states_df = vt.read_layer(path, index="STUSPS")
+        vl, df = vt.read_layer(path, index="STUSPS",
+                               where="STUSPS IN ('CA', 'IL', 'NV')",
+                               columns=["NAME"])
+        assert sorted(vl.index) == ["CA", "IL", "NV"]
+        assert list(df.columns) == ["NAME"]
+        assert list(df.loc[vl.index, "NAME"]) == \
+            list(states_df.loc[vl.index, "NAME"])
+
+        xmin, xmax, ymin, ymax = states["IL"].GetEnvelope()
+        vl, df = vt.read_layer(path, index="STUSPS",
+                               bbox=(xmin, ymin, xmax, ymax))
+        assert "IL" in vl.index and "CA" not in vl.index
+        bbox = vt.bounding_box((xmin, xmax, ymin, ymax), states.proj)
+        assert set(states.iintersects(bbox)) <= set(vl.index)
+
+        chunks = vt.read_layer(path, index="STUSPS", columns=[],
+                               chunksize=20)
+        chunks = list(chunks)
+        assert [len(c[0]) for c in chunks] == [20, 20, 16]
+        assert [i for c, _ in chunks for i in c.index] == list(states.index)
+        assert all([len(c.columns) == 0 for _, c in chunks])
+
+        # The filters are not left on the shared datasource
+        assert len(vt.read_layer(path)[0]) == 56
+        assert_raises(ValueError, vt.read_layer, path, columns=["foo"])
+
     def test_ipredicates(self):
         path = get_path("cb_2014_us_state_500k.zip")
         vl, df = vt.read_layer(path, index="STUSPS")
@@ -208,6 +611,93 @@ class TestVectorLayer:
                                index="STUSPS")
         assert exp == act[["RI"]].to_json()
 
+    def test_to_json_stream(self):
+        tmp = mkdtemp()
+        try:
+            path = os.path.join(tmp, "zips.json")
+            df = self.df4.iloc[::-1]
+            self.zips.to_json(path, df=df[["ALAND10"]])
+            with open(path) as inf:
+                assert inf.read() == self.zips.to_json(df=df[["ALAND10"]])
+            vl, props = vt.read_geojson(path, index="__id__")
+            assert list(vl.index) == list(self.zips.index)
+            assert (props["ALAND10"] == self.df4["ALAND10"]).all()
+            d = self.zips.to_dict()
+            assert len(d["features"]) == len(self.zips)
+            assert d["features"][-1]["id"] == len(self.zips) - 1
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_parquet(self):
+        tmp = mkdtemp()
+        try:
+            path = os.path.join(tmp, "zips.parquet")
+            self.zips.to_parquet(path, df=self.df4, row_group_size=20)
+            vl, df = vt.read_parquet(path)
+            assert list(vl.index) == list(self.zips.index)
+            assert vl.proj4 == self.zips.proj4
+            assert all([a.Equals(b) for a, b in zip(vl, self.zips)])
+            assert df.equals(self.df4)
+
+            sf = self.counties[self.sf]
+            xmin, xmax, ymin, ymax = sf.GetEnvelope()
+            vl, df = vt.read_parquet(path, columns=["ALAND10"],
+                                     bbox=(xmin, ymin, xmax, ymax))
+            bbox = vt.bounding_box((xmin, xmax, ymin, ymax), self.zips.proj)
+            assert set(self.zips.iintersects(bbox)) <= set(vl.index)
+            assert len(vl) < len(self.zips)
+            assert list(df.columns) == ["ALAND10"]
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_pickle(self):
+        zips = self.zips.head(50)
+        zips.build_sindex()
+        vl = pickle.loads(pickle.dumps(zips, pickle.HIGHEST_PROTOCOL))
+        assert isinstance(vl, vt.VectorLayer)
+        assert list(vl.index) == list(zips.index)
+        assert vl.proj4 == zips.proj4
+        assert all([a.Equals(b) for a, b in zip(vl, zips)])
+        assert vl._sindex is not None
+
+        # A view of the parent's index is compacted before pickling
+        sub = self.zips.filter_by_id(self.zips.index[:10])
+        self.zips.build_sindex()
+        sub._sindex = self.zips._sindex.subset(np.arange(10))
+        vl = pickle.loads(pickle.dumps(sub, pickle.HIGHEST_PROTOCOL))
+        assert vl._sindex._items is None
+        assert len(vl._sindex.bounds) == 10
+        assert list(vl.iintersects(sub[0])) == list(sub.iintersects(sub[0]))
+
+        path = zips.export_shared()
+        try:
+            pool = multiprocessing.Pool(2)
+            try:
+                res = pool.map(_shared_areas, [path, path])
+            finally:
+                pool.close()
+                pool.join()
+            assert all([np.allclose(r, zips.areas()) for r in res])
+            vl = vt.attach_shared(path)
+            assert isinstance(vl._sindex.bounds, np.memmap)
+            assert list(vl.iintersects(zips[0])) == \
+                list(zips.iintersects(zips[0]))
+
+            lazy = vt.attach_shared(path, lazy=True)
+            assert isinstance(lazy, vt.SharedLayer)
+            assert len(lazy) == len(zips)
+            assert isinstance(lazy._buf, np.memmap)
+            assert lazy[zips.index[3]].Equals(zips[zips.index[3]])
+            res = lazy.intersects(zips[0])
+            assert list(res.index) == list(zips.iintersects(zips[0]))
+            sub = lazy.filter_by_id(zips.index[:5])
+            assert list(sub.index) == list(zips.index[:5])
+            assert np.allclose(sub.areas(), zips.areas()[:5])
+            assert_raises(KeyError, lazy.filter_by_id, ["not an id"])
+        finally:
+            vt.remove_shared(path)
+        assert not os.path.exists(path)
+
     def test_set_theoretic(self):
         proj = projection_from_string(ALBERS_N_AMERICA)
         counties = self.counties.transform(proj)